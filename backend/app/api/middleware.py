@@ -0,0 +1,244 @@
+"""ASGI middleware for the marketplace API."""
+
+import asyncio
+import logging
+import os
+import time
+
+from starlette.responses import JSONResponse
+
+from app.infrastructure.db import DATABASE_REPLICA_URL, DB_POOL_CAPACITY
+from app.infrastructure.instrumentation import server_timing, track_queries
+from app.infrastructure.metrics import HTTP_REQUEST_SECONDS, REGISTRY
+from app.infrastructure.ratelimit import (
+    RATE_LIMIT_RULES,
+    find_rule,
+    get_rate_limit_store,
+    parse_rules,
+    rate_limit_headers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Expose per-request DB statistics in a Server-Timing header
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS", "1") not in ("0", "false", "no")
+# Warn when one statement runs this many times in a single request (N+1 pattern)
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+# Admission control for /api: concurrent requests per class, sized from the
+# DB pool so requests queue here (bounded) rather than on a pool checkout.
+# Writes get a reserved share of the primary pool; reads get the rest, or a
+# full pool of their own when served from a replica.
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL", "1") not in ("0", "false", "no")
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", str(max(1, DB_POOL_CAPACITY // 3))))
+ADMISSION_READ_LIMIT = int(os.getenv(
+    "ADMISSION_READ_LIMIT",
+    str(DB_POOL_CAPACITY if DATABASE_REPLICA_URL else max(1, DB_POOL_CAPACITY - ADMISSION_WRITE_LIMIT)),
+))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+SHED_REQUESTS = REGISTRY.counter(
+    "http_requests_shed_total", "Requests rejected by admission control.", ("route_class", "reason")
+)
+RATE_LIMITED_REQUESTS = REGISTRY.counter(
+    "http_requests_rate_limited_total", "Requests rejected by rate limiting.", ("rule",)
+)
+
+
+class QueryStatsMiddleware:
+    """Count SQL statements per request and report them as ``Server-Timing``."""
+
+    def __init__(self, app, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        with track_queries() as stats:
+
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    value = server_timing(stats, time.perf_counter() - started)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    message["headers"] = headers
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        statement, repeats = stats.most_repeated()
+        if repeats >= self.n_plus_one_threshold:
+            logger.warning(
+                "Possible N+1 query in %s %s: statement ran %d times: %s",
+                scope["method"],
+                scope["path"],
+                repeats,
+                " ".join(statement.split()),
+            )
+
+
+class MetricsMiddleware:
+    """Record request latency per route template, method and status code."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; label by its
+            # template so /orders/<uuid> does not create a series per order
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code),
+            )
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders, at most ``max_queue`` waiters, bounded wait."""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> str:
+        """Take a slot; return "" on success or why the request was refused."""
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                return "queue_timeout"
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        return ""
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class AdmissionControlMiddleware:
+    """Limit concurrent /api requests per class (reads vs. writes).
+
+    Requests beyond the limit wait in a bounded queue; once it is full, or
+    the wait exceeds the queue timeout, they fail fast with ``503`` and a
+    ``Retry-After`` header instead of piling up on the connection pool.
+    Health and metrics endpoints are never limited.
+    """
+
+    def __init__(
+        self,
+        app,
+        read_limit: int = ADMISSION_READ_LIMIT,
+        write_limit: int = ADMISSION_WRITE_LIMIT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+        prefix: str = "/api",
+    ):
+        self.app = app
+        self.limiters = {
+            "read": ConcurrencyLimiter(read_limit, queue_size, queue_timeout),
+            "write": ConcurrencyLimiter(write_limit, queue_size, queue_timeout),
+        }
+        self.retry_after = retry_after
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+
+        route_class = "read" if scope["method"] in READ_METHODS else "write"
+        limiter = self.limiters[route_class]
+        refused = await limiter.acquire()
+        if refused:
+            SHED_REQUESTS.inc(route_class, refused)
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+class RateLimitMiddleware:
+    """Token-bucket rate limits per client and route rule.
+
+    The client is the peer address. Request headers are not trusted: a
+    client could pick a new identity, and a fresh bucket, per request.
+    Behind a reverse proxy, run uvicorn with ``--proxy-headers`` and
+    ``--forwarded-allow-ips`` so the peer is the original client. Limited
+    routes get ``RateLimit-*`` headers; refused requests get ``429`` with
+    ``Retry-After``.
+    """
+
+    def __init__(self, app, rules=None, store=None):
+        self.app = app
+        self.rules = parse_rules(RATE_LIMIT_RULES) if rules is None else rules
+        self.store = store if store is not None else get_rate_limit_store()
+
+    @staticmethod
+    def client_id(scope) -> str:
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope, receive, send):
+        rule = None
+        if scope["type"] == "http":
+            rule = find_rule(self.rules, scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        rule_name = f"{rule.method} {rule.pattern}"
+        decision = await self.store.take(f"{rule_name}|{self.client_id(scope)}", rule.rate, rule.burst)
+        headers = rate_limit_headers(rule, decision)
+        if not decision.allowed:
+            RATE_LIMITED_REQUESTS.inc(rule_name)
+            response = JSONResponse({"detail": "Rate limit exceeded"}, status_code=429, headers=headers)
+            return await response(scope, receive, send)
+
+        encoded = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + encoded
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,15 +1,18 @@
 """API routes for the marketplace."""
 
 import uuid
-from typing import List
+from datetime import datetime
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 
-from app.infrastructure.db import get_db
-from app.infrastructure.repositories import UserRepository, OrderRepository
+from app.infrastructure.archive import get_order_archive
+from app.infrastructure.coalescing import get_single_flight
+from app.infrastructure.order_cache import get_order_cache
+from app.infrastructure.unit_of_work import UnitOfWork, get_read_uow, get_uow
 from app.application.user_service import UserService
 from app.application.order_service import OrderService
+from app.domain.order import OrderStatus
 from app.domain.exceptions import (
     DomainException,
     InvalidEmailError,
@@ -18,6 +21,7 @@ from app.domain.exceptions import (
     OrderNotFoundError,
     OrderAlreadyPaidError,
     OrderCancelledError,
+    OrderConflictError,
     InvalidQuantityError,
     InvalidPriceError,
 )
@@ -25,28 +29,53 @@ from app.domain.exceptions import (
 from .schemas import (
     CreateUser,
     UserResponse,
+    UserBatchResponse,
     CreateOrder,
     AddOrderItem,
     OrderResponse,
+    OrderSummaryResponse,
+    OrderFieldsResponse,
     OrderDetailResponse,
+    OrderBatchResponse,
     OrderItemResponse,
     OrderStatusChangeResponse,
+    BulkTransition,
+    BulkTransitionFailure,
+    BulkTransitionResponse,
 )
 
 router = APIRouter()
 
+# Most ids accepted by one multi-get request
+MAX_BATCH_IDS = 100
 
-def get_user_service(db: AsyncSession = Depends(get_db)) -> UserService:
+
+def _check_batch(ids: List[uuid.UUID]):
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_IDS} ids per request",
+        )
+
+
+def get_user_service(uow: UnitOfWork = Depends(get_uow)) -> UserService:
     """Dependency to get UserService."""
-    repo = UserRepository(db)
-    return UserService(repo)
+    return UserService(uow)
 
 
-def get_order_service(db: AsyncSession = Depends(get_db)) -> OrderService:
+def get_order_service(uow: UnitOfWork = Depends(get_uow)) -> OrderService:
     """Dependency to get OrderService."""
-    user_repo = UserRepository(db)
-    order_repo = OrderRepository(db)
-    return OrderService(order_repo, user_repo)
+    return OrderService(uow)
+
+
+def get_read_user_service(uow: UnitOfWork = Depends(get_read_uow)) -> UserService:
+    """Dependency to get UserService for read-only endpoints."""
+    return UserService(uow)
+
+
+def get_read_order_service(uow: UnitOfWork = Depends(get_read_uow)) -> OrderService:
+    """Dependency to get OrderService for read-only endpoints."""
+    return OrderService(uow, get_order_archive(), get_single_flight())
 
 
 # User endpoints
@@ -68,7 +97,7 @@ async def create_user(data: CreateUser, service: UserService = Depends(get_user_
 
 
 @router.get("/users", response_model=List[UserResponse])
-async def list_users(service: UserService = Depends(get_user_service)):
+async def list_users(service: UserService = Depends(get_read_user_service)):
     """List all users."""
     users = await service.list_users()
     return [
@@ -82,8 +111,25 @@ async def list_users(service: UserService = Depends(get_user_service)):
     ]
 
 
+@router.get("/users/batch", response_model=UserBatchResponse)
+async def get_users(
+    ids: List[uuid.UUID] = Query(..., description="repeat for each user: ?ids=...&ids=..."),
+    service: UserService = Depends(get_read_user_service),
+):
+    """Get many users by ID with one query, in the order requested."""
+    _check_batch(ids)
+    users, missing = await service.get_many(ids)
+    return UserBatchResponse(
+        users=[
+            UserResponse(id=u.id, email=u.email, name=u.name, created_at=u.created_at)
+            for u in users
+        ],
+        missing=missing,
+    )
+
+
 @router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: uuid.UUID, service: UserService = Depends(get_user_service)):
+async def get_user(user_id: uuid.UUID, service: UserService = Depends(get_read_user_service)):
     """Get user by ID."""
     try:
         user = await service.get_by_id(user_id)
@@ -108,24 +154,106 @@ async def create_order(data: CreateOrder, service: OrderService = Depends(get_or
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
-@router.get("/orders", response_model=List[OrderResponse])
+ORDER_FIELDS = ("id", "user_id", "status", "total_amount", "created_at", "items")
+
+
+@router.get("/orders", response_model=List[OrderFieldsResponse], response_model_exclude_unset=True)
 async def list_orders(
     user_id: uuid.UUID = None,
-    service: OrderService = Depends(get_order_service),
+    created_from: datetime = None,
+    created_to: datetime = None,
+    after: uuid.UUID = None,
+    limit: int = Query(None, ge=1, le=1000),
+    view: Literal["full", "summary"] = "full",
+    fields: str = Query(None, description=f"comma-separated subset of {', '.join(ORDER_FIELDS)}"),
+    service: OrderService = Depends(get_read_order_service),
+):
+    """List orders, optionally filtered by user and creation date range.
+
+    Orders are sorted by id, i.e. by creation time. For the next page pass
+    the id of the last order received as ``after``.
+
+    ``view=summary`` leaves out the items, ``fields`` returns only the
+    listed fields. Without items the orders are read with a single query.
+    """
+    if fields is not None:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = sorted(set(selected) - set(ORDER_FIELDS))
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested",
+            )
+    elif view == "summary":
+        selected = [f for f in ORDER_FIELDS if f != "items"]
+    else:
+        selected = list(ORDER_FIELDS)
+
+    if "items" in selected:
+        orders = await service.list_orders(user_id, created_from, created_to, after, limit)
+        rows = [_order_to_response(o).model_dump() for o in orders]
+    else:
+        orders = await service.list_order_summaries(user_id, created_from, created_to, after, limit, selected)
+        rows = [
+            {**vars(o), "status": o.status.value if o.status is not None else None}
+            for o in orders
+        ]
+    return [OrderFieldsResponse(**{f: row[f] for f in selected}) for row in rows]
+
+
+@router.get("/orders/batch", response_model=OrderBatchResponse)
+async def get_orders(
+    ids: List[uuid.UUID] = Query(..., description="repeat for each order: ?ids=...&ids=..."),
+    service: OrderService = Depends(get_read_order_service),
+):
+    """Get many orders by ID with full details, in the order requested.
+
+    Reads orders, items and history with one query each.
+    """
+    _check_batch(ids)
+    orders, missing = await service.get_orders(ids)
+    return OrderBatchResponse(orders=[_order_to_detail_response(o) for o in orders], missing=missing)
+
+
+@router.get("/orders/search", response_model=List[OrderSummaryResponse])
+async def search_orders(
+    product: str = Query(..., min_length=3, max_length=200),
+    after: uuid.UUID = None,
+    limit: int = Query(50, ge=1, le=1000),
+    service: OrderService = Depends(get_read_order_service),
 ):
-    """List orders, optionally filtered by user."""
-    orders = await service.list_orders(user_id)
-    return [_order_to_response(o) for o in orders]
+    """Find orders containing a product whose name includes ``product``.
+
+    Returns order rows without items, sorted and paged by id like
+    ``GET /orders``.
+    """
+    orders = await service.search_orders(product, after, limit)
+    return [_order_to_summary_response(o) for o in orders]
 
 
 @router.get("/orders/{order_id}", response_model=OrderDetailResponse)
-async def get_order(order_id: uuid.UUID, service: OrderService = Depends(get_order_service)):
-    """Get order by ID with full details."""
+async def get_order(order_id: uuid.UUID, service: OrderService = Depends(get_read_order_service)):
+    """Get order by ID with full details.
+
+    Rendered responses are cached: cancelled orders until evicted, others
+    briefly and only for reads that may use the replica.
+    """
+    cache = get_order_cache()
+    if cache is not None:
+        body = cache.get(order_id, allow_mutable=service.uow.stale_reads_ok)
+        if body is not None:
+            return Response(body, media_type="application/json")
+        version = cache.version()
     try:
         order = await service.get_order(order_id)
-        return _order_to_detail_response(order)
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    response = _order_to_detail_response(order)
+    if cache is None:
+        return response
+    body = response.model_dump_json().encode()
+    cache.put(order_id, version, body, immutable=order.status == OrderStatus.CANCELLED)
+    return Response(body, media_type="application/json")
 
 
 @router.post("/orders/{order_id}/items", response_model=OrderItemResponse, status_code=status.HTTP_201_CREATED)
@@ -151,6 +279,8 @@ async def add_order_item(
         )
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except OrderConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except OrderCancelledError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except (InvalidQuantityError, InvalidPriceError) as e:
@@ -165,12 +295,32 @@ async def pay_order(order_id: uuid.UUID, service: OrderService = Depends(get_ord
         return _order_to_response(order)
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except OrderConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except OrderAlreadyPaidError as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except OrderCancelledError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
+@router.post("/orders/bulk/{action}", response_model=BulkTransitionResponse)
+async def bulk_transition(
+    action: Literal["ship", "complete", "cancel"],
+    data: BulkTransition,
+    service: OrderService = Depends(get_order_service),
+):
+    """Ship, complete or cancel many orders in one transaction.
+
+    Orders that are missing or not in the required status are reported in
+    ``failed`` and do not prevent the others from changing.
+    """
+    updated, failed = await service.bulk_transition(action, data.ids)
+    return BulkTransitionResponse(
+        updated=[_order_to_summary_response(o) for o in updated],
+        failed=[BulkTransitionFailure(id=order_id, error=error) for order_id, error in failed.items()],
+    )
+
+
 @router.post("/orders/{order_id}/cancel", response_model=OrderResponse)
 async def cancel_order(order_id: uuid.UUID, service: OrderService = Depends(get_order_service)):
     """Cancel an order."""
@@ -179,6 +329,8 @@ async def cancel_order(order_id: uuid.UUID, service: OrderService = Depends(get_
         return _order_to_response(order)
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except OrderConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except OrderAlreadyPaidError as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 
@@ -191,6 +343,8 @@ async def ship_order(order_id: uuid.UUID, service: OrderService = Depends(get_or
         return _order_to_response(order)
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except OrderConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
@@ -203,12 +357,14 @@ async def complete_order(order_id: uuid.UUID, service: OrderService = Depends(ge
         return _order_to_response(order)
     except OrderNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except OrderConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.get("/orders/{order_id}/history", response_model=List[OrderStatusChangeResponse])
-async def get_order_history(order_id: uuid.UUID, service: OrderService = Depends(get_order_service)):
+async def get_order_history(order_id: uuid.UUID, service: OrderService = Depends(get_read_order_service)):
     """Get order status history."""
     try:
         history = await service.get_order_history(order_id)
@@ -225,6 +381,16 @@ async def get_order_history(order_id: uuid.UUID, service: OrderService = Depends
 
 
 # Helper functions
+def _order_to_summary_response(order) -> OrderSummaryResponse:
+    return OrderSummaryResponse(
+        id=order.id,
+        user_id=order.user_id,
+        status=order.status.value,
+        total_amount=order.total_amount,
+        created_at=order.created_at,
+    )
+
+
 def _order_to_response(order) -> OrderResponse:
     """Convert Order domain object to response."""
     return OrderResponse(
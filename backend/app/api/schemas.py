@@ -24,6 +24,11 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class UserBatchResponse(BaseModel):
+    users: List[UserResponse]
+    missing: List[uuid.UUID]
+
+
 # Order schemas
 class CreateOrder(BaseModel):
     user_id: uuid.UUID
@@ -52,22 +57,58 @@ class OrderStatusChangeResponse(BaseModel):
     changed_at: datetime
 
 
-class OrderResponse(BaseModel):
+class OrderSummaryResponse(BaseModel):
     id: uuid.UUID
     user_id: uuid.UUID
     status: str
     total_amount: Decimal
     created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class OrderResponse(OrderSummaryResponse):
     items: List[OrderItemResponse] = []
 
     class Config:
         from_attributes = True
 
 
+class OrderFieldsResponse(BaseModel):
+    """Order in a listing; only the fields that were asked for are present."""
+
+    id: Optional[uuid.UUID] = None
+    user_id: Optional[uuid.UUID] = None
+    status: Optional[str] = None
+    total_amount: Optional[Decimal] = None
+    created_at: Optional[datetime] = None
+    items: Optional[List[OrderItemResponse]] = None
+
+
 class OrderDetailResponse(OrderResponse):
     status_history: List[OrderStatusChangeResponse] = []
 
 
+class OrderBatchResponse(BaseModel):
+    orders: List[OrderDetailResponse]
+    missing: List[uuid.UUID]
+
+
+class BulkTransition(BaseModel):
+    ids: List[uuid.UUID] = Field(..., min_length=1, max_length=5000)
+
+
+class BulkTransitionFailure(BaseModel):
+    id: uuid.UUID
+    error: str
+
+
+class BulkTransitionResponse(BaseModel):
+    updated: List[OrderSummaryResponse]
+    failed: List[BulkTransitionFailure]
+
+
 # Error response
 class ErrorResponse(BaseModel):
     detail: str
@@ -0,0 +1,28 @@
+"""Follow-up work for order state changes.
+
+``OrderService`` enqueues these topics in the transaction that changes the
+order; the handlers run later on the background job queue, off the request
+path. Handlers can run more than once and must stay idempotent.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ORDER_PAID = "order.paid"
+ORDER_SHIPPED = "order.shipped"
+
+
+async def send_payment_receipt(payload: dict):
+    # No mail/ledger integration yet: the log line stands in for it
+    logger.info("Payment receipt for order %s: user %s paid %s", payload["order_id"], payload["user_id"], payload["total_amount"])
+
+
+async def send_shipping_notice(payload: dict):
+    logger.info("Shipping notice for order %s to user %s", payload["order_id"], payload["user_id"])
+
+
+def register_handlers(queue):
+    """Attach the order handlers to a ``JobQueue``."""
+    queue.register(ORDER_PAID)(send_payment_receipt)
+    queue.register(ORDER_SHIPPED)(send_shipping_notice)
@@ -1,68 +1,216 @@
 import uuid
+from datetime import datetime
 from decimal import Decimal
-from typing import List, Optional
-from app.domain.order import Order, OrderItem, OrderStatus, OrderStatusChange
+from typing import Dict, List, Optional, Tuple
+from app.domain.order import TRANSITIONS, Order, OrderItem, OrderStatus, OrderStatusChange
 from app.domain.exceptions import OrderNotFoundError, UserNotFoundError, OrderAlreadyPaidError, OrderCancelledError
+from app.application.order_events import ORDER_PAID, ORDER_SHIPPED
+from app.infrastructure import metrics
+from app.infrastructure.repositories import OrderSummary
 from sqlalchemy.exc import IntegrityError
 
+
+def _event_payload(order: Order) -> dict:
+    return {
+        "order_id": str(order.id),
+        "user_id": str(order.user_id),
+        "status": order.status.value,
+        "total_amount": str(order.total_amount),
+    }
+
+
 class OrderService:
-    def __init__(self, order_repo, user_repo):
-        self.order_repo = order_repo
-        self.user_repo = user_repo
+    def __init__(self, uow, archive=None, flights=None):
+        self.uow = uow
+        self.archive = archive
+        # SingleFlight coalescing identical concurrent reads (read-only units only)
+        self.flights = flights
+
+    async def _read(self, name: str, key, call):
+        """``await call(service)``, shared with identical concurrent reads when allowed.
+
+        A shared read runs in a unit of work of its own, so the request
+        that started it may go away (and close its session) meanwhile.
+        """
+        # Only reads that may be stale anyway are shared: a primary read (for
+        # a client that just wrote) must not join a flight that started
+        # before its write committed
+        if self.flights is None or not self.uow.stale_reads_ok or self.uow.session_factory is None:
+            return await call(self)
+
+        async def flight():
+            async with self.uow.fork() as uow:
+                return await call(OrderService(uow, self.archive))
+
+        return await self.flights.do(name, key, flight, cache=True)
 
     async def create_order(self, user_id: uuid.UUID) -> Order:
-        user = await self.user_repo.find_by_id(user_id)
-        if not user:
-            raise UserNotFoundError(user_id)
-        order = Order(user_id=user_id)
-        return await self.order_repo.save(order)
+        async with self.uow.transaction():
+            user = await self.uow.users.find_by_id(user_id)
+            if not user:
+                raise UserNotFoundError(user_id)
+            order = Order(user_id=user_id)
+            self.uow.add(order)
+        metrics.ORDERS_CREATED.inc()
+        return order
 
     async def get_order(self, order_id: uuid.UUID) -> Order:
-        order = await self.order_repo.find_by_id(order_id)
+        return await self._read("get_order", str(order_id), lambda service: service._get_order(order_id))
+
+    async def _get_order(self, order_id: uuid.UUID) -> Order:
+        async with self.uow.transaction():
+            order = await self.uow.orders.find_by_id(order_id)
+        if not order and self.archive is not None:
+            # Completed and cancelled orders may have been moved to cold storage
+            order = await self.archive.get(order_id)
+        if not order:
+            raise OrderNotFoundError(order_id)
+        return order
+
+    async def get_orders(self, order_ids: List[uuid.UUID]) -> Tuple[List[Order], List[uuid.UUID]]:
+        """Orders found (archive included), in request order, and the ids that do not exist."""
+        order_ids = list(dict.fromkeys(order_ids))
+        async with self.uow.transaction():
+            found = {str(order.id): order for order in await self.uow.orders.find_many(order_ids)}
+        if self.archive is not None:
+            for order_id in order_ids:
+                if str(order_id) not in found:
+                    archived = await self.archive.get(order_id)
+                    if archived is not None:
+                        found[str(order_id)] = archived
+        orders = [found[str(order_id)] for order_id in order_ids if str(order_id) in found]
+        return orders, [order_id for order_id in order_ids if str(order_id) not in found]
+
+    async def _load_order(self, order_id: uuid.UUID) -> Order:
+        """Load an order for modification; archived orders are read-only."""
+        order = await self.uow.orders.find_by_id(order_id)
         if not order:
             raise OrderNotFoundError(order_id)
         return order
 
     async def add_item(self, order_id: uuid.UUID, product_name: str, price: Decimal, quantity: int) -> OrderItem:
-        order = await self.get_order(order_id)
-        if order.status == OrderStatus.CANCELLED:
-            raise OrderCancelledError(order_id)
-        item = order.add_item(product_name, price, quantity)
-        await self.order_repo.save(order)
+        async with self.uow.transaction():
+            order = await self._load_order(order_id)
+            if order.status == OrderStatus.CANCELLED:
+                raise OrderCancelledError(order_id)
+            item = order.add_item(product_name, price, quantity)
+            self.uow.add(order)
+        metrics.ORDER_ITEMS_ADDED.inc()
         return item
 
     async def pay_order(self, order_id: uuid.UUID) -> Order:
-        order = await self.get_order(order_id)
-        try:
-            order.pay()
-        except Exception as e:
-            if "already paid" in str(e): raise OrderAlreadyPaidError(order_id)
-            raise
-            
         try:
-            return await self.order_repo.save(order)
+            async with self.uow.transaction():
+                order = await self._load_order(order_id)
+                try:
+                    order.pay()
+                except Exception as e:
+                    if "already paid" in str(e): raise OrderAlreadyPaidError(order_id)
+                    raise
+                self.uow.add(order)
+                await self.uow.outbox.enqueue(ORDER_PAID, _event_payload(order), user_id=order.user_id)
         except IntegrityError:
             raise OrderAlreadyPaidError(order_id)
+        metrics.ORDERS_PAID.inc()
+        return order
 
     async def cancel_order(self, order_id: uuid.UUID) -> Order:
-        order = await self.get_order(order_id)
-        order.cancel()
-        return await self.order_repo.save(order)
+        async with self.uow.transaction():
+            order = await self._load_order(order_id)
+            order.cancel()
+            self.uow.add(order)
+        metrics.ORDERS_CANCELLED.inc()
+        return order
 
     async def ship_order(self, order_id: uuid.UUID) -> Order:
-        order = await self.get_order(order_id)
-        order.ship()
-        return await self.order_repo.save(order)
+        async with self.uow.transaction():
+            order = await self._load_order(order_id)
+            order.ship()
+            self.uow.add(order)
+            await self.uow.outbox.enqueue(ORDER_SHIPPED, _event_payload(order), user_id=order.user_id)
+        return order
 
     async def complete_order(self, order_id: uuid.UUID) -> Order:
-        order = await self.get_order(order_id)
-        order.complete()
-        return await self.order_repo.save(order)
+        async with self.uow.transaction():
+            order = await self._load_order(order_id)
+            order.complete()
+            self.uow.add(order)
+        return order
+
+    async def bulk_transition(
+        self, action: str, order_ids: List[uuid.UUID]
+    ) -> Tuple[List[OrderSummary], Dict[uuid.UUID, str]]:
+        """Apply ``action`` (a key of ``TRANSITIONS``) to many orders at once.
+
+        Returns the changed orders and, for every other id, why it was not
+        changed. Orders are not loaded; the status check is part of the
+        UPDATE. Single-order changes likewise only write an order that
+        still has the status they loaded (``OrderConflictError``
+        otherwise), so neither path overwrites the other.
+        """
+        expected, target = TRANSITIONS[action]
+        order_ids = list(dict.fromkeys(order_ids))
+        async with self.uow.transaction():
+            changed = await self.uow.orders.transition_many(order_ids, expected, target)
+            changed_ids = {str(order.id) for order in changed}
+            rest = [order_id for order_id in order_ids if str(order_id) not in changed_ids]
+            statuses = await self.uow.orders.find_statuses(rest) if rest else {}
+            if action == "ship":
+                await self.uow.outbox.enqueue_many(
+                    ORDER_SHIPPED, [_event_payload(o) for o in changed], [o.user_id for o in changed]
+                )
+        failed = {}
+        for order_id in rest:
+            current = statuses.get(str(order_id))
+            if current is None:
+                failed[order_id] = str(OrderNotFoundError(order_id))
+            else:
+                failed[order_id] = f"Cannot {action} order in status {current.value}, expected {expected.value}"
+        if action == "cancel":
+            metrics.ORDERS_CANCELLED.inc(amount=len(changed))
+        return changed, failed
+
+    async def list_orders(
+        self,
+        user_id: Optional[uuid.UUID] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[uuid.UUID] = None,
+        limit: Optional[int] = None,
+    ) -> List[Order]:
+        key = (str(user_id) if user_id else None, created_from, created_to, str(after) if after else None, limit)
+        return await self._read(
+            "list_orders", key, lambda service: service._list_orders(user_id, created_from, created_to, after, limit)
+        )
+
+    async def _list_orders(self, user_id, created_from, created_to, after, limit) -> List[Order]:
+        async with self.uow.transaction():
+            if user_id:
+                return await self.uow.orders.find_by_user(user_id, created_from, created_to, after, limit)
+            return await self.uow.orders.find_all(created_from, created_to, after, limit)
+
+    async def list_order_summaries(
+        self,
+        user_id: Optional[uuid.UUID] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[uuid.UUID] = None,
+        limit: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+    ) -> List[OrderSummary]:
+        """Like ``list_orders``, without items and history; optionally only some columns."""
+        async with self.uow.transaction():
+            return await self.uow.orders.find_summaries(user_id, created_from, created_to, after, limit, columns)
 
-    async def list_orders(self, user_id: Optional[uuid.UUID] = None) -> List[Order]:
-        if user_id:
-            return await self.order_repo.find_by_user(user_id)
-        return await self.order_repo.find_all()
+    async def search_orders(
+        self,
+        product: str,
+        after: Optional[uuid.UUID] = None,
+        limit: int = 50,
+    ) -> List[OrderSummary]:
+        """Orders containing an item whose name includes ``product``."""
+        async with self.uow.transaction():
+            return await self.uow.orders.search_by_product(product, after, limit)
 
     async def get_order_history(self, order_id: uuid.UUID) -> List[OrderStatusChange]:
         order = await self.get_order(order_id)
@@ -1,31 +1,38 @@
 import uuid
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from app.domain.user import User
 from app.domain.exceptions import EmailAlreadyExistsError, UserNotFoundError
-from sqlalchemy.exc import IntegrityError
 
 class UserService:
-    def __init__(self, repo):
-        self.repo = repo
+    def __init__(self, uow):
+        self.uow = uow
 
     async def register(self, email: str, name: str = "") -> User:
-        existing = await self.repo.find_by_email(email)
-        if existing:
-            raise EmailAlreadyExistsError(email)
         user = User(email=email, name=name)
-        try:
-            return await self.repo.save(user)
-        except IntegrityError:
+        async with self.uow.transaction():
+            created = await self.uow.users.create(user)
+        if not created:
             raise EmailAlreadyExistsError(email)
+        return user
 
     async def get_by_id(self, user_id: uuid.UUID) -> User:
-        user = await self.repo.find_by_id(user_id)
+        async with self.uow.transaction():
+            user = await self.uow.users.find_by_id(user_id)
         if not user:
             raise UserNotFoundError(user_id)
         return user
 
+    async def get_many(self, user_ids: List[uuid.UUID]) -> Tuple[List[User], List[uuid.UUID]]:
+        """Users found, in request order, and the ids that do not exist."""
+        async with self.uow.transaction():
+            users = await self.uow.users.find_many(user_ids)
+        found = {str(user.id) for user in users}
+        return users, [user_id for user_id in dict.fromkeys(user_ids) if str(user_id) not in found]
+
     async def get_by_email(self, email: str) -> Optional[User]:
-        return await self.repo.find_by_email(email)
+        async with self.uow.transaction():
+            return await self.uow.users.find_by_email(email)
 
     async def list_users(self) -> List[User]:
-        return await self.repo.find_all()
\ No newline at end of file
+        async with self.uow.transaction():
+            return await self.uow.users.find_all()
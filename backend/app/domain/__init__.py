@@ -3,11 +3,13 @@
 
 from .user import User
 from .order import Order, OrderItem, OrderStatus, OrderStatusChange
+from .ids import uuid7
 from .exceptions import (
     DomainException,
     InvalidEmailError,
     OrderAlreadyPaidError,
     OrderCancelledError,
+    OrderConflictError,
     InvalidQuantityError,
     InvalidPriceError,
     InvalidAmountError,
@@ -22,10 +24,12 @@ __all__ = [
     "OrderItem",
     "OrderStatus",
     "OrderStatusChange",
+    "uuid7",
     "DomainException",
     "InvalidEmailError",
     "OrderAlreadyPaidError",
     "OrderCancelledError",
+    "OrderConflictError",
     "InvalidQuantityError",
     "InvalidPriceError",
     "InvalidAmountError",
@@ -38,6 +38,12 @@ class InvalidAmountError(DomainException):
         self.amount = amount
         super().__init__(f"Amount cannot be negative, got: {amount}")
 
+class OrderConflictError(DomainException):
+    """Raised when an order changed in the database since it was loaded."""
+    def __init__(self, order_id):
+        self.order_id = order_id
+        super().__init__(f"Order {order_id} was changed concurrently, reload and retry")
+
 class UserNotFoundError(DomainException):
     """Raised when user is not found."""
     def __init__(self, user_id):
@@ -5,6 +5,7 @@ from decimal import Decimal
 from enum import Enum
 from typing import List, Optional
 
+from .ids import uuid7
 from .exceptions import (
     OrderAlreadyPaidError, 
     OrderCancelledError, 
@@ -19,12 +20,20 @@ class OrderStatus(str, Enum):
     SHIPPED = "shipped"
     COMPLETED = "completed"
 
+# Bulk transitions: the status an order must be in, and the status it moves to.
+# Mirrors the guards in Order.ship/complete/cancel.
+TRANSITIONS = {
+    "ship": (OrderStatus.PAID, OrderStatus.SHIPPED),
+    "complete": (OrderStatus.SHIPPED, OrderStatus.COMPLETED),
+    "cancel": (OrderStatus.CREATED, OrderStatus.CANCELLED),
+}
+
 @dataclass
 class OrderItem:
     product_name: str
     price: Decimal
     quantity: int
-    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    id: uuid.UUID = field(default_factory=uuid7)
     order_id: Optional[uuid.UUID] = None
 
     def __post_init__(self):
@@ -41,12 +50,12 @@ class OrderItem:
 class OrderStatusChange:
     status: OrderStatus
     changed_at: datetime
-    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    id: uuid.UUID = field(default_factory=uuid7)
 
 @dataclass
 class Order:
     user_id: uuid.UUID
-    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    id: uuid.UUID = field(default_factory=uuid7)
     status: OrderStatus = OrderStatus.CREATED
     items: List[OrderItem] = field(default_factory=list)
     total_amount: Decimal = Decimal("0.00")
@@ -4,13 +4,14 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
 
+from .ids import uuid7
 from .exceptions import InvalidEmailError
 
 @dataclass
 class User:
     email: str
     name: str = ""
-    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    id: uuid.UUID = field(default_factory=uuid7)
     created_at: datetime = field(default_factory=datetime.now)
 
     def __post_init__(self):
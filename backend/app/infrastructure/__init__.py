@@ -1,4 +1,4 @@
-from .db import engine, SessionLocal, get_db
+from .db import engine, SessionLocal
 from .repositories import UserRepository, OrderRepository
 
-__all__ = ["engine", "SessionLocal", "get_db", "UserRepository", "OrderRepository"]
+__all__ = ["engine", "SessionLocal", "UserRepository", "OrderRepository"]
@@ -0,0 +1,263 @@
+"""Cold storage for completed and cancelled orders.
+
+Orders in a terminal status never change again, so once they are old
+enough they are moved out of ``orders``/``order_items`` into append-only
+gzip-compressed NDJSON segments on local disk. Every segment has a small
+JSON sidecar index (order id -> line) used to find an order without
+scanning the archive. Lookups of orders that are not in the loaded
+indexes rescan the directory at most every ``ORDER_ARCHIVE_RESCAN_SECONDS``
+(segments written by this process are visible at once), and file reads
+run in a worker thread, off the event loop.
+
+Run the job with ``python -m app.infrastructure.archive``.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.domain.order import Order, OrderItem, OrderStatus, OrderStatusChange
+from app.infrastructure.repositories import OrderRepository
+
+ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "archive")
+ARCHIVE_MIN_AGE_DAYS = int(os.getenv("ORDER_ARCHIVE_MIN_AGE_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_RESCAN_SECONDS = float(os.getenv("ORDER_ARCHIVE_RESCAN_SECONDS", "30"))
+
+TERMINAL_STATUSES = (OrderStatus.COMPLETED, OrderStatus.CANCELLED)
+
+
+def _timestamp(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def order_to_record(order: Order) -> dict:
+    return {
+        "id": str(order.id),
+        "user_id": str(order.user_id),
+        "status": order.status.value,
+        "total_amount": str(order.total_amount),
+        "created_at": _timestamp(order.created_at),
+        "items": [
+            {
+                "id": str(item.id),
+                "product_name": item.product_name,
+                "price": str(item.price),
+                "quantity": item.quantity,
+            }
+            for item in order.items
+        ],
+        "status_history": [
+            {"id": str(h.id), "status": h.status.value, "changed_at": _timestamp(h.changed_at)}
+            for h in order.status_history
+        ],
+    }
+
+
+def record_to_order(record: dict) -> Order:
+    order_id = uuid.UUID(record["id"])
+    return Order(
+        id=order_id,
+        user_id=uuid.UUID(record["user_id"]),
+        status=OrderStatus(record["status"]),
+        total_amount=Decimal(record["total_amount"]),
+        created_at=_parse_timestamp(record["created_at"]),
+        items=[
+            OrderItem(
+                id=uuid.UUID(item["id"]),
+                product_name=item["product_name"],
+                price=Decimal(item["price"]),
+                quantity=item["quantity"],
+                order_id=order_id,
+            )
+            for item in record["items"]
+        ],
+        status_history=[
+            OrderStatusChange(
+                id=uuid.UUID(h["id"]),
+                status=OrderStatus(h["status"]),
+                changed_at=_parse_timestamp(h["changed_at"]),
+            )
+            for h in record["status_history"]
+        ],
+    )
+
+
+class OrderArchive:
+    """Append-only archive of orders in compressed NDJSON segments."""
+
+    SEGMENT_SUFFIX = ".ndjson.gz"
+    INDEX_SUFFIX = ".idx.json"
+    # Decoded segments kept in memory for repeated lookups
+    CACHED_SEGMENTS = 4
+
+    def __init__(
+        self,
+        directory: str = ARCHIVE_DIR,
+        rescan_interval: float = ARCHIVE_RESCAN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.directory = Path(directory)
+        self.rescan_interval = rescan_interval
+        self._clock = clock
+        self._scanned_at: Optional[float] = None
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._loaded_indexes = set()
+        self._segments: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def write_segment(self, orders: Iterable[Order]) -> Optional[Path]:
+        """Write orders to a new segment and return its path.
+
+        The segment and its index are written to temporary files, fsynced and
+        renamed, so a crash never leaves a partially written segment behind.
+        """
+        records = [order_to_record(order) for order in orders]
+        if not records:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"segment-{datetime.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        segment = self.directory / f"{name}{self.SEGMENT_SUFFIX}"
+        index = self.directory / f"{name}{self.INDEX_SUFFIX}"
+
+        tmp_segment = segment.with_name(segment.name + ".tmp")
+        with open(tmp_segment, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                for record in records:
+                    out.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_segment, segment)
+
+        tmp_index = index.with_name(index.name + ".tmp")
+        lines = {record["id"]: line for line, record in enumerate(records)}
+        with open(tmp_index, "w", encoding="utf-8") as out:
+            json.dump(lines, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_index, index)
+        self._add_index(index.name, lines)
+        return segment
+
+    async def get(self, order_id: uuid.UUID) -> Optional[Order]:
+        """Load an archived order, or None if it was never archived."""
+        key = str(order_id)
+        if key not in self._index and self._rescan_due():
+            self._scanned_at = self._clock()
+            await asyncio.to_thread(self._refresh)
+        location = self._index.get(key)
+        if location is None:
+            return None
+        segment, line = location
+        return record_to_order(json.loads((await self._read_segment(segment))[line]))
+
+    def _rescan_due(self) -> bool:
+        return self._scanned_at is None or self._clock() - self._scanned_at >= self.rescan_interval
+
+    def _refresh(self):
+        """Pick up segments written since the last scan (e.g. by the job)."""
+        if not self.directory.is_dir():
+            return
+        for index in sorted(self.directory.glob(f"*{self.INDEX_SUFFIX}")):
+            if index.name in self._loaded_indexes:
+                continue
+            with open(index, encoding="utf-8") as f:
+                self._add_index(index.name, json.load(f))
+
+    def _add_index(self, name: str, lines: Dict[str, int]):
+        segment = name[: -len(self.INDEX_SUFFIX)] + self.SEGMENT_SUFFIX
+        for key, line in lines.items():
+            self._index[key] = (segment, line)
+        self._loaded_indexes.add(name)
+
+    def _load_segment(self, segment: str) -> List[str]:
+        with gzip.open(self.directory / segment, "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    async def _read_segment(self, segment: str) -> List[str]:
+        lines = self._segments.get(segment)
+        if lines is None:
+            lines = await asyncio.to_thread(self._load_segment, segment)
+            self._segments[segment] = lines
+            if len(self._segments) > self.CACHED_SEGMENTS:
+                self._segments.popitem(last=False)
+        else:
+            self._segments.move_to_end(segment)
+        return lines
+
+
+_default_archive: Optional[OrderArchive] = None
+
+
+def get_order_archive() -> OrderArchive:
+    """Process-wide archive used by the API."""
+    global _default_archive
+    if _default_archive is None:
+        _default_archive = OrderArchive()
+    return _default_archive
+
+
+async def archive_orders(
+    session_factory,
+    archive: OrderArchive,
+    min_age: timedelta,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> int:
+    """Move terminal orders created before ``now - min_age`` to the archive.
+
+    Each batch is written to a segment before it is deleted from the
+    database, so an interrupted run at worst archives a batch twice.
+    Returns the number of archived orders.
+    """
+    cutoff = (now or datetime.now()) - min_age
+    archived = 0
+    while True:
+        async with session_factory() as session:
+            repo = OrderRepository(session)
+            ids = await repo.find_ids_by_status(TERMINAL_STATUSES, created_before=cutoff, limit=batch_size)
+            if not ids:
+                return archived
+            orders = [await repo.find_by_id(order_id) for order_id in ids]
+            await asyncio.to_thread(archive.write_segment, [o for o in orders if o is not None])
+            await repo.delete_many(ids)
+            await session.commit()
+        archived += len(ids)
+
+
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive completed and cancelled orders.")
+    parser.add_argument("--min-age-days", type=int, default=ARCHIVE_MIN_AGE_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--directory", default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    from app.infrastructure.db import SessionLocal, engine, init_schema
+
+    try:
+        await init_schema()
+        count = await archive_orders(
+            SessionLocal,
+            OrderArchive(args.directory),
+            timedelta(days=args.min_age_days),
+            batch_size=args.batch_size,
+        )
+        print(f"archived {count} orders to {args.directory}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,119 @@
+"""Coalescing of identical concurrent reads (single-flight).
+
+When many requests ask for the same hot order or listing at once, only
+the first one (the leader) runs the queries; the others wait for its
+result instead of repeating them. The work runs as a separate task, so a
+leader whose client disconnects does not fail the requests waiting on it;
+callers give that task its own database session for the same reason
+(``UnitOfWork.fork``), as the leader's is closed when its request ends.
+Results are shared as is and must not be modified by callers.
+
+With ``READ_CACHE_TTL`` > 0 results are also kept for that many seconds
+(a micro-cache), which flattens bursts that do not overlap exactly.
+Callers only coalesce and cache reads that may be stale anyway (those
+served by the replica); reads on the primary always run their own
+queries, so read-your-writes stickiness still holds.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.infrastructure.metrics import REGISTRY
+
+READ_COALESCING_ENABLED = os.getenv("READ_COALESCING", "1") not in ("0", "false", "no")
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "0"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "10000"))
+
+COALESCED_READS = REGISTRY.counter(
+    "coalesced_reads_total", "Reads by how they were served: leader, coalesced or cached.", ("name", "outcome")
+)
+
+
+class SingleFlight:
+    """In-flight calls and recent results, by key (event loop only, no locking)."""
+
+    def __init__(
+        self,
+        ttl: float = READ_CACHE_TTL,
+        max_entries: int = READ_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._cache: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _cached(self, key: Hashable):
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= self._clock():
+            del self._cache[key]
+            return False, None
+        return True, value
+
+    def _store(self, key: Hashable, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._cache[key] = (self._clock() + self.ttl, task.result())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def do(
+        self,
+        name: str,
+        key: Hashable,
+        call: Callable[[], Awaitable[Any]],
+        cache: bool = False,
+    ):
+        """Return ``await call()``, sharing it with concurrent callers of ``key``.
+
+        ``name`` labels the metrics; ``cache`` allows serving and storing
+        the result in the micro-cache.
+        """
+        key = (name, key)
+        use_cache = cache and self.ttl > 0
+        if use_cache:
+            hit, value = self._cached(key)
+            if hit:
+                COALESCED_READS.inc(name, "cached")
+                return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            COALESCED_READS.inc(name, "coalesced")
+        else:
+            COALESCED_READS.inc(name, "leader")
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+
+            def finished(task: asyncio.Task, key=key):
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+                if use_cache:
+                    self._store(key, task)
+                elif not task.cancelled():
+                    task.exception()  # retrieved, even if every waiter went away
+
+            task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    def clear(self):
+        self._cache.clear()
+
+
+_default_flights: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Process-wide coalescer for read endpoints, or None when disabled."""
+    global _default_flights
+    if _default_flights is None and READ_COALESCING_ENABLED:
+        _default_flights = SingleFlight()
+    return _default_flights
@@ -1,14 +1,52 @@
 """Database connection and session management."""
 
+import asyncio
 import os
+from typing import Optional
+
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import text
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.infrastructure import metrics
+from app.infrastructure.instrumentation import instrument_engine
+from app.infrastructure.migrations import apply_migrations
+from app.infrastructure.replicas import ReplicaRouter, RoutingSession
+from app.infrastructure.sharding import (
+    DATABASE_SHARDS,
+    SHARD_VIRTUAL_NODES,
+    ShardedSession,
+    ShardRouter,
+    parse_shards,
+)
+from app.infrastructure import sqlite
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql+asyncpg://postgres:postgres@db:5432/marketplace"
 )
 
+# Log every SQL statement (useful in development, noisy under load)
+SQL_ECHO = os.getenv("SQL_ECHO", "1") not in ("0", "false", "no")
+
+# Optional read-only replica; GET endpoints are served from it when set
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# Read-your-writes window: a client that just wrote keeps reading from the primary
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "2"))
+# How long an unreachable replica stays out of rotation
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+# Connection pool per engine (Postgres and SQLite files); in-memory SQLite
+# shares one connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_CAPACITY = DB_POOL_SIZE + DB_MAX_OVERFLOW
+# Prepared statements asyncpg keeps per connection (repository statements are
+# module-level constants, so a small cache covers all of them)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
 # For SQLite in-memory databases, use shared cache to allow multiple connections
 # to see the same data (important when conftest.py sets DATABASE_URL)
 _engine_url = DATABASE_URL
@@ -17,111 +55,102 @@ if _engine_url.startswith("sqlite") and ":memory:" in _engine_url:
         separator = "&" if "?" in _engine_url else "?"
         _engine_url = f"{_engine_url}{separator}cache=shared"
 
-engine = create_async_engine(_engine_url, echo=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-# Track if tables have been initialized for SQLite
-_sqlite_tables_initialized = False
+def _engine_options(url: str) -> dict:
+    if sqlite.is_sqlite_file(url):
+        # SQLAlchemy would open a new connection (and reapply pragmas) per checkout
+        return {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+    if url.startswith("sqlite"):
+        return {}
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if "+asyncpg" in url:
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def _create_engine(url: str):
+    created = create_async_engine(url, echo=SQL_ECHO, **_engine_options(url))
+    instrument_engine(created)
+    if sqlite.is_sqlite_file(url):
+        sqlite.configure_engine(created)
+    return created
+
+
+engine = _create_engine(_engine_url)
+
+replica_router = ReplicaRouter(
+    sticky_seconds=REPLICA_STICKY_SECONDS,
+    retry_seconds=REPLICA_RETRY_SECONDS,
+)
+replica_engine = None
+if DATABASE_REPLICA_URL:
+    replica_engine = _create_engine(DATABASE_REPLICA_URL)
 
+    @event.listens_for(replica_engine.sync_engine, "handle_error")
+    def _replica_error(context):
+        """Fall back to the primary when the replica cannot be reached."""
+        if context.is_disconnect or context.connection is None:
+            replica_router.mark_unhealthy()
 
-async def init_sqlite_tables():
-    """Initialize tables for SQLite databases (used in local tests)."""
-    global _sqlite_tables_initialized
-    if _sqlite_tables_initialized:
-        return
-    
-    if not DATABASE_URL.startswith("sqlite"):
+# Optional shards for users and orders (see app.infrastructure.sharding)
+shard_engines = {name: _create_engine(url) for name, url in parse_shards(DATABASE_SHARDS).items()}
+shard_router = ShardRouter(shard_engines, SHARD_VIRTUAL_NODES) if shard_engines else None
+
+
+def _record_pool_usage():
+    metrics.record_pool("primary", engine.pool)
+    if replica_engine is not None:
+        metrics.record_pool("replica", replica_engine.pool)
+    for name, shard_engine in shard_engines.items():
+        metrics.record_pool(f"shard_{name}", shard_engine.pool)
+
+
+metrics.REGISTRY.add_collector(_record_pool_usage)
+
+
+class _Session(ShardedSession, RoutingSession):
+    replica_bind = replica_engine.sync_engine if replica_engine is not None else None
+    router = replica_router
+    shard_router = shard_router
+
+
+SessionLocal = async_sessionmaker(
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=_Session,
+)
+
+# Track if the schema has been migrated by this process
+_schema_initialized = False
+_schema_lock = asyncio.Lock()
+
+
+async def init_schema():
+    """Apply pending schema migrations once per process."""
+    global _schema_initialized
+    if _schema_initialized:
         return
-    
-    _sqlite_tables_initialized = True
-    
-    async with engine.begin() as conn:
-        # Drop old tables that might have wrong schema (from conftest.py or previous runs)
-        # These tables use 'status TEXT' instead of 'status_id INTEGER'
-        await conn.execute(text("DROP TABLE IF EXISTS order_status_history"))
-        await conn.execute(text("DROP TABLE IF EXISTS order_items"))
-        await conn.execute(text("DROP TABLE IF EXISTS orders"))
-        # Keep users table - schema is compatible
-        
-        # Create order_statuses table (PostgreSQL-compatible schema)
-        await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS order_statuses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL
-            )
-        """))
-        
-        # Insert default statuses (idempotent)
-        await conn.execute(text("""
-            INSERT OR IGNORE INTO order_statuses (name) VALUES 
-            ('created'),
-            ('paid'),
-            ('cancelled'),
-            ('shipped'),
-            ('completed')
-        """))
-        
-        # Create users table if not exists
-        await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL
-            )
-        """))
-        
-        # Create orders table with status_id (PostgreSQL-compatible)
-        await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                status_id INTEGER NOT NULL DEFAULT 1,
-                total_amount REAL NOT NULL DEFAULT 0.00,
-                created_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (status_id) REFERENCES order_statuses(id)
-            )
-        """))
-        
-        # Create order_items table
-        await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS order_items (
-                id TEXT PRIMARY KEY,
-                order_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                price REAL NOT NULL,
-                quantity INTEGER NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES orders(id)
-            )
-        """))
-        
-        # Create order_status_history table
-        await conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS order_status_history (
-                id TEXT PRIMARY KEY,
-                order_id TEXT NOT NULL,
-                status_id INTEGER NOT NULL,
-                changed_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES orders(id),
-                FOREIGN KEY (status_id) REFERENCES order_statuses(id)
-            )
-        """))
-
-
-async def get_db():
-    """Dependency for getting database session."""
-    # Initialize tables for SQLite on first connection
-    if DATABASE_URL.startswith("sqlite"):
-        await init_sqlite_tables()
-    
-    async with SessionLocal() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
+
+    async with _schema_lock:
+        if _schema_initialized:
+            return
+        await apply_migrations(engine)
+        for shard_engine in shard_engines.values():
+            await apply_migrations(shard_engine)
+        _schema_initialized = True
+
+
+def client_key(request: Optional[Request]) -> Optional[str]:
+    """Identify the client for read-your-writes stickiness."""
+    if request is None or request.client is None:
+        return None
+    return request.client.host
 
 
 # backend/app/infrastructure/db.py
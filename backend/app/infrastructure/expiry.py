@@ -0,0 +1,102 @@
+"""Cancellation of abandoned orders.
+
+Orders still ``created`` (never paid) ``ORDER_EXPIRY_SECONDS`` after they
+were created are cancelled by a sweeper the API runs in the background.
+Each batch is one ``UPDATE`` of at most ``ORDER_EXPIRY_BATCH_SIZE`` rows in
+its own short transaction. On Postgres the rows are picked with
+``FOR UPDATE SKIP LOCKED``, so several instances can sweep at once without
+waiting on each other; the status history triggers record the
+cancellation as for any other status change.
+
+A payment racing the sweeper cannot resurrect a cancelled order: saving
+an order only updates it while it still has the status it was loaded with,
+so the payment fails with ``OrderConflictError`` instead.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.infrastructure.metrics import REGISTRY
+from app.infrastructure.order_cache import invalidate_orders
+from app.infrastructure.sharding import on_shard, shard_names
+from app.infrastructure.sqlite import write_slot
+
+# 0 disables the sweeper
+ORDER_EXPIRY_SECONDS = float(os.getenv("ORDER_EXPIRY_SECONDS", str(24 * 3600)))
+ORDER_EXPIRY_BATCH_SIZE = int(os.getenv("ORDER_EXPIRY_BATCH_SIZE", "500"))
+ORDER_EXPIRY_INTERVAL = float(os.getenv("ORDER_EXPIRY_INTERVAL", "60"))
+
+ORDERS_EXPIRED = REGISTRY.counter("orders_expired_total", "Unpaid orders cancelled by the expiry sweeper.")
+EXPIRY_BATCH_SIZE = REGISTRY.histogram(
+    "order_expiry_batch_size", "Orders cancelled per expiry batch.",
+    buckets=(0, 1, 10, 50, 100, 250, 500, 1000, 5000),
+)
+# How long past its deadline the oldest order of each batch was cancelled
+EXPIRY_LAG_SECONDS = REGISTRY.histogram(
+    "order_expiry_lag_seconds", "Delay between an order's expiry and its cancellation.",
+    buckets=(1, 10, 60, 300, 900, 3600, 4 * 3600, 24 * 3600),
+)
+
+_EXPIRE = """
+    UPDATE orders
+    SET status_id = (SELECT id FROM order_statuses WHERE name = 'cancelled')
+    WHERE id IN (
+        SELECT id FROM orders
+        WHERE status_id = (SELECT id FROM order_statuses WHERE name = 'created')
+          AND created_at < :cutoff
+        ORDER BY created_at
+        LIMIT :limit
+        {lock}
+    )
+    RETURNING id, created_at
+"""
+# Postgres: concurrent sweepers (and payments) skip rows locked by another transaction
+ORDERS_EXPIRE = {
+    "postgresql": text(_EXPIRE.format(lock="FOR UPDATE SKIP LOCKED")),
+    "sqlite": text(_EXPIRE.format(lock="")),
+}
+
+
+def _as_datetime(value) -> datetime:
+    # SQLite returns timestamps as text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+async def expire_orders(
+    session_factory,
+    ttl: timedelta,
+    batch_size: int = ORDER_EXPIRY_BATCH_SIZE,
+    now: Optional[datetime] = None,
+) -> int:
+    """Cancel orders created before ``now - ttl`` that are still unpaid.
+
+    Runs batches on each shard until one comes back short and returns the
+    number of cancelled orders.
+    """
+    now = now or datetime.now()
+    cutoff = now - ttl
+    expired = 0
+    async with session_factory() as session:
+        shards = shard_names(session)
+    for shard in shards:
+        while True:
+            async with session_factory() as session, write_slot(session, shard):
+                query = ORDERS_EXPIRE[session.get_bind().dialect.name]
+                result = await session.execute(
+                    query, {"cutoff": cutoff, "limit": batch_size}, bind_arguments=on_shard(shard)
+                )
+                rows = result.all()
+                await session.commit()
+            invalidate_orders(row.id for row in rows)
+            EXPIRY_BATCH_SIZE.observe(len(rows))
+            if rows:
+                oldest = min(_as_datetime(row.created_at) for row in rows)
+                EXPIRY_LAG_SECONDS.observe(max(0.0, (cutoff - oldest).total_seconds()))
+                ORDERS_EXPIRED.inc(amount=len(rows))
+            expired += len(rows)
+            if len(rows) < batch_size:
+                break
+    return expired
@@ -0,0 +1,83 @@
+"""Readiness checks for the load balancer.
+
+An instance is ready when the primary database answers within
+``READINESS_TIMEOUT`` seconds and its connection pool is below
+``READINESS_MAX_POOL_SATURATION``. Flipping to not-ready before the pool is
+fully exhausted lets the balancer shed load while requests still complete.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.infrastructure.instrumentation import recent_latency
+
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "1"))
+READINESS_MAX_POOL_SATURATION = float(os.getenv("READINESS_MAX_POOL_SATURATION", "0.9"))
+
+
+def pool_usage(pool) -> Optional[Dict[str, float]]:
+    """Checked-out connections against pool capacity, if the pool is bounded."""
+    if not hasattr(pool, "checkedout"):
+        return None  # NullPool/StaticPool: no shared limit to saturate
+    capacity = pool.size() + pool._max_overflow
+    if pool._max_overflow < 0 or capacity <= 0:
+        return None
+    checked_out = pool.checkedout()
+    return {
+        "checked_out": checked_out,
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3),
+    }
+
+
+async def _ping(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def check_engine(engine: AsyncEngine, timeout: float = READINESS_TIMEOUT) -> dict:
+    """Run ``SELECT 1`` with a deadline and report latency and pool usage."""
+    result = {"pool": pool_usage(engine.pool)}
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(_ping(engine), timeout)
+    except asyncio.TimeoutError:
+        result.update(status="down", error=f"no response within {timeout}s")
+    except Exception as e:
+        result.update(status="down", error=type(e).__name__)
+    else:
+        result["status"] = "up"
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+async def readiness(
+    engine: AsyncEngine,
+    replica_engine: Optional[AsyncEngine] = None,
+    max_saturation: float = READINESS_MAX_POOL_SATURATION,
+    timeout: float = READINESS_TIMEOUT,
+) -> Tuple[bool, dict]:
+    """Check the databases and decide whether to accept traffic.
+
+    Only the primary decides: reads fall back to it when the replica is
+    down, so a replica failure is reported but does not fail the probe.
+    """
+    checks = {"primary": await check_engine(engine, timeout)}
+    if replica_engine is not None:
+        checks["replica"] = await check_engine(replica_engine, timeout)
+
+    primary = checks["primary"]
+    ready = primary["status"] == "up"
+    if primary["pool"] is not None and primary["pool"]["saturation"] >= max_saturation:
+        ready = False
+        primary["status"] = "saturated"
+    return ready, {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "queries": recent_latency(),
+    }
@@ -0,0 +1,123 @@
+"""Per-request SQL statement counting.
+
+Engine events record every statement into the ``QueryStats`` that is
+active in the current context. ``QueryStatsMiddleware`` opens one per HTTP
+request; tests and scripts can open their own with ``track_queries`` or
+``assert_max_queries``. Scopes nest: a statement is counted in every
+enclosing scope. Durations of the most recent statements, in or out of a
+scope, are kept for the readiness probe.
+"""
+
+import contextlib
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@dataclass
+class QueryStats:
+    """Statements executed within one scope (usually one request)."""
+
+    count: int = 0
+    duration: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    parent: Optional["QueryStats"] = field(default=None, repr=False)
+
+    def record(self, statement: str, duration: float):
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats.statements[statement] += 1
+            stats = stats.parent
+
+    def most_repeated(self) -> Tuple[Optional[str], int]:
+        """Return the statement executed most often and how many times.
+
+        The same statement running once per row of an earlier result is the
+        signature of an N+1 query pattern.
+        """
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# Durations (seconds) of the latest statements on any instrumented engine
+recent_durations: deque = deque(maxlen=1000)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count statements executed in this context until the block exits."""
+    stats = QueryStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+    """Fail if the block executes more than ``limit`` SQL statements."""
+    with track_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        statements = "\n".join(f"  {n}x {' '.join(s.split())}" for s, n in stats.statements.most_common())
+        raise AssertionError(f"expected at most {limit} queries, got {stats.count}:\n{statements}")
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Attach statement counting to ``engine``."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._query_started
+        recent_durations.append(duration)
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, duration)
+
+
+def recent_latency() -> Dict[str, float]:
+    """Count and p50/p95/max latency (ms) of the most recent statements."""
+    ordered = sorted(recent_durations)
+    if not ordered:
+        return {"count": 0}
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {"count": len(ordered), "p50_ms": pct(0.5), "p95_ms": pct(0.95), "max_ms": pct(1.0)}
+
+
+def server_timing(stats: QueryStats, total: float) -> str:
+    """Render a ``Server-Timing`` header value (durations in ms)."""
+    return f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", app;dur={total * 1000:.2f}'
+
+
+def parse_server_timing(value: str) -> Dict[str, Dict[str, str]]:
+    """Parse a ``Server-Timing`` header into ``{metric: {param: value}}``."""
+    metrics = {}
+    for entry in value.split(","):
+        name, *params = [part.strip() for part in entry.split(";")]
+        metrics[name] = dict(
+            (key, raw.strip('"')) for key, _, raw in (param.partition("=") for param in params)
+        )
+    return metrics
@@ -0,0 +1,324 @@
+"""Background jobs fed from a transactional outbox.
+
+Services enqueue jobs with ``OutboxRepository.enqueue`` inside the same
+transaction as the state change that caused them, so a job exists if and
+only if the change was committed. ``JobQueue`` claims due rows with a
+lease, runs the registered handler for each topic on a pool of worker
+tasks and deletes the row on success. Failures are retried with
+exponential backoff; after ``max_attempts`` the row is kept with status
+``dead`` for inspection (dead-letter).
+
+Handlers may run more than once (a worker can die after the handler but
+before the delete), so they must be idempotent.
+
+With shards, a job is written to the shard of the user it concerns (the
+one its state change commits on) and the queue claims jobs from every
+shard.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.domain.ids import uuid7
+from app.infrastructure.metrics import REGISTRY
+from app.infrastructure.sharding import on_shard, shard_names, shard_of
+from app.infrastructure.sqlite import write_slot
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS", "1") not in ("0", "false", "no")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Retry n waits JOB_RETRY_BASE * 2**(n-1) seconds, at most JOB_RETRY_MAX
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "300"))
+# A claimed job is handed to another worker if not finished within the lease
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+JOBS_PROCESSED = REGISTRY.counter(
+    "jobs_processed_total", "Background jobs processed by outcome.", ("topic", "outcome")
+)
+
+OUTBOX_INSERT = text("""
+    INSERT INTO outbox (id, topic, payload, status, attempts, available_at, created_at)
+    VALUES (:id, :topic, :payload, 'pending', 0, :available_at, :created_at)
+""")
+_CLAIM = """
+    UPDATE outbox
+    SET locked_until = :lease_until, attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM outbox
+        WHERE status = 'pending'
+          AND available_at <= :now
+          AND (locked_until IS NULL OR locked_until < :now)
+        ORDER BY available_at
+        LIMIT :limit
+        {lock}
+    )
+    RETURNING id, topic, payload, attempts
+"""
+# Postgres: concurrent workers skip rows another transaction is claiming
+OUTBOX_CLAIM = {
+    "postgresql": text(_CLAIM.format(lock="FOR UPDATE SKIP LOCKED")),
+    "sqlite": text(_CLAIM.format(lock="")),
+}
+OUTBOX_DELETE = text("DELETE FROM outbox WHERE id = :id")
+OUTBOX_RETRY = text("""
+    UPDATE outbox
+    SET available_at = :available_at, locked_until = NULL, last_error = :error
+    WHERE id = :id
+""")
+OUTBOX_DEAD = text("""
+    UPDATE outbox
+    SET status = 'dead', locked_until = NULL, last_error = :error
+    WHERE id = :id
+""")
+
+
+@dataclass
+class Job:
+    id: str
+    topic: str
+    payload: Dict[str, Any]
+    attempts: int
+    # Shard holding the outbox row (None when not sharded)
+    shard: Optional[str] = None
+
+
+class OutboxRepository:
+    """Repository for outbox rows."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def enqueue(
+        self,
+        topic: str,
+        payload: Dict[str, Any],
+        delay: float = 0,
+        user_id: Optional[uuid.UUID] = None,
+    ) -> uuid.UUID:
+        """Add a job to the current transaction.
+
+        ``user_id`` is the user whose data the transaction changes; with
+        shards the job is written to that user's shard, so it commits
+        together with the change.
+        """
+        job_id = uuid7()
+        now = datetime.now()
+        await self.session.execute(OUTBOX_INSERT, {
+            "id": str(job_id),
+            "topic": topic,
+            "payload": json.dumps(payload, default=str),
+            "available_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }, bind_arguments=on_shard(shard_of(self.session, user_id) if user_id is not None else None))
+        self.session.info["outbox_enqueued"] = True
+        return job_id
+
+    async def enqueue_many(
+        self,
+        topic: str,
+        payloads: List[Dict[str, Any]],
+        user_ids: Optional[List[uuid.UUID]] = None,
+    ) -> List[uuid.UUID]:
+        """Add one job per payload with a single batched insert (per shard).
+
+        ``user_ids``, parallel to ``payloads``, place each job like ``enqueue``.
+        """
+        if not payloads:
+            return []
+        now = datetime.now()
+        by_shard: Dict[Optional[str], list] = {}
+        ids = []
+        for n, payload in enumerate(payloads):
+            row = {
+                "id": str(uuid7()),
+                "topic": topic,
+                "payload": json.dumps(payload, default=str),
+                "available_at": now,
+                "created_at": now,
+            }
+            shard = shard_of(self.session, user_ids[n]) if user_ids is not None else None
+            by_shard.setdefault(shard, []).append(row)
+            ids.append(uuid.UUID(row["id"]))
+        for shard, rows in by_shard.items():
+            await self.session.execute(OUTBOX_INSERT, rows, bind_arguments=on_shard(shard))
+        self.session.info["outbox_enqueued"] = True
+        return ids
+
+    async def claim(self, limit: int, lease: float, now: datetime, shard: Optional[str] = None) -> List[Job]:
+        """Lease up to ``limit`` due jobs (of ``shard``) to the caller."""
+        query = OUTBOX_CLAIM[self.session.get_bind().dialect.name]
+        result = await self.session.execute(query, {
+            "now": now,
+            "lease_until": now + timedelta(seconds=lease),
+            "limit": limit,
+        }, bind_arguments=on_shard(shard))
+        return [
+            Job(str(row.id), row.topic, json.loads(row.payload), row.attempts, shard)
+            for row in result.all()
+        ]
+
+    async def complete(self, job: Job):
+        await self.session.execute(OUTBOX_DELETE, {"id": job.id}, bind_arguments=on_shard(job.shard))
+
+    async def retry(self, job: Job, error: str, available_at: datetime):
+        await self.session.execute(
+            OUTBOX_RETRY,
+            {"id": job.id, "error": error, "available_at": available_at},
+            bind_arguments=on_shard(job.shard),
+        )
+
+    async def bury(self, job: Job, error: str):
+        """Move a job to the dead-letter state."""
+        await self.session.execute(OUTBOX_DEAD, {"id": job.id, "error": error}, bind_arguments=on_shard(job.shard))
+
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def retry_delay(attempts: int, base: float = JOB_RETRY_BASE, maximum: float = JOB_RETRY_MAX) -> float:
+    return min(maximum, base * 2 ** (attempts - 1))
+
+
+class JobQueue:
+    """Claims outbox jobs and runs them on ``concurrency`` worker tasks."""
+
+    def __init__(
+        self,
+        session_factory,
+        concurrency: int = JOB_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        lease: float = JOB_LEASE_SECONDS,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._clock = clock
+        self.handlers: Dict[str, Handler] = {}
+        self._wakeup = asyncio.Event()
+        self._next_shard = 0
+
+    def register(self, topic: str):
+        """Decorator registering the handler for ``topic``."""
+        def decorator(handler: Handler) -> Handler:
+            self.handlers[topic] = handler
+            return handler
+        return decorator
+
+    def notify(self):
+        """Poll now instead of waiting for the next interval (new jobs committed)."""
+        self._wakeup.set()
+
+    async def _claim(self, limit: int) -> List[Job]:
+        async with self.session_factory() as session:
+            shards = shard_names(session)
+        # Start from a different shard each time so none is starved
+        self._next_shard = (self._next_shard + 1) % len(shards)
+        jobs = []
+        for shard in shards[self._next_shard:] + shards[:self._next_shard]:
+            if len(jobs) >= limit:
+                break
+            async with self.session_factory() as session, write_slot(session, shard):
+                jobs += await OutboxRepository(session).claim(limit - len(jobs), self.lease, self._clock(), shard)
+                await session.commit()
+        return jobs
+
+    async def run_pending(self) -> int:
+        """Claim one batch of due jobs, process it and return its size."""
+        jobs = await self._claim(self.concurrency)
+        await asyncio.gather(*(self._process(job) for job in jobs))
+        return len(jobs)
+
+    async def _process(self, job: Job):
+        handler = self.handlers.get(job.topic)
+        error = None
+        if handler is None:
+            error = f"no handler for topic {job.topic!r}"
+        else:
+            try:
+                await handler(job.payload)
+            except Exception as e:
+                logger.exception("Job %s (%s) failed on attempt %d", job.id, job.topic, job.attempts)
+                error = f"{type(e).__name__}: {e}"
+
+        if error is None:
+            outcome = "done"
+        elif handler is None or job.attempts >= self.max_attempts:
+            outcome = "dead"
+        else:
+            outcome = "retry"
+        try:
+            async with self.session_factory() as session, write_slot(session, job.shard):
+                outbox = OutboxRepository(session)
+                if outcome == "done":
+                    await outbox.complete(job)
+                elif outcome == "dead":
+                    await outbox.bury(job, error)
+                else:
+                    delay = retry_delay(job.attempts)
+                    await outbox.retry(job, error, self._clock() + timedelta(seconds=delay))
+                await session.commit()
+        except Exception:
+            # The lease expires and the job is claimed again
+            logger.exception("Failed to record the outcome of job %s", job.id)
+            return
+        JOBS_PROCESSED.inc(job.topic, outcome)
+
+    async def run(self):
+        """Keep up to ``concurrency`` jobs running until cancelled."""
+        running = set()
+        try:
+            while True:
+                self._wakeup.clear()
+                free = self.concurrency - len(running)
+                if free > 0:
+                    try:
+                        jobs = await self._claim(free)
+                    except Exception:
+                        logger.exception("Failed to claim outbox jobs")
+                        jobs = []
+                    for job in jobs:
+                        task = asyncio.create_task(self._process(job))
+                        running.add(task)
+                        task.add_done_callback(running.discard)
+                if len(running) >= self.concurrency:
+                    # All workers busy: claim more as soon as one finishes
+                    await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+_default_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue used by the API."""
+    global _default_queue
+    if _default_queue is None:
+        from app.infrastructure.db import SessionLocal
+
+        _default_queue = JobQueue(SessionLocal)
+    return _default_queue
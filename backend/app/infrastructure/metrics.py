@@ -0,0 +1,242 @@
+"""In-process metrics with Prometheus text exposition.
+
+Metrics are updated from the event loop thread only, so counters and
+histogram buckets are plain dicts and lists without locks. Each worker
+aggregates its own samples; when ``METRICS_DIR`` is set, workers write
+snapshots there (``<pid>.json``) and ``/metrics`` on any worker sums the
+snapshots of all of them, the way multi-worker uvicorn/gunicorn deployments
+need it.
+"""
+
+import bisect
+import functools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Directory shared by all workers for multi-process aggregation (unset: single process)
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.series[labels] = self.series.get(labels, 0.0) + amount
+
+
+class Gauge(Counter):
+    """Point-in-time value; summed across workers."""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.series[labels] = value
+
+
+class Histogram:
+    """Bucketed observations.
+
+    Each series is ``[count per bucket..., count above the last bucket, sum]``;
+    buckets are made cumulative only when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+class Registry:
+    """A set of metrics plus collectors that refresh gauges before export."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else None
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def snapshot(self, gauges: bool = True) -> dict:
+        """Return this process' samples as a JSON-serialisable dict."""
+        for collector in self.collectors:
+            collector()
+        snapshot = {}
+        for metric in self.metrics.values():
+            if metric.kind == "gauge" and not gauges:
+                continue
+            snapshot[metric.name] = {
+                "kind": metric.kind,
+                "help": metric.help,
+                "labels": list(metric.labels),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "series": [[list(labels), value] for labels, value in metric.series.items()],
+            }
+        return snapshot
+
+    def write_snapshot(self, final: bool = False):
+        """Publish this worker's samples to ``directory``.
+
+        The final snapshot of a stopping worker leaves its gauges out, so
+        pool usage of dead workers does not linger; counters are kept.
+        """
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot(gauges=not final)), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def collect(self) -> dict:
+        """Samples of this worker, merged with every other worker's snapshot."""
+        if self.directory is None:
+            return self.snapshot()
+        self.write_snapshot()
+        snapshots = []
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue  # worker is rewriting it right now
+        return merge(snapshots)
+
+    def render(self) -> str:
+        return render(self.collect())
+
+
+def merge(snapshots: List[dict]) -> dict:
+    """Sum samples of the same metric and label values across snapshots."""
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "series": {}})
+            for labels, value in metric["series"]:
+                key = tuple(labels)
+                if key not in target["series"]:
+                    target["series"][key] = value
+                elif isinstance(value, list):
+                    target["series"][key] = [a + b for a, b in zip(target["series"][key], value)]
+                else:
+                    target["series"][key] += value
+    for metric in merged.values():
+        metric["series"] = [[list(labels), value] for labels, value in metric["series"].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(snapshot: dict) -> str:
+    """Render a (merged) snapshot in the Prometheus text format."""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labels"]
+        for values, value in sorted(metric["series"]):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{name}_bucket{_labels(names, values, (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, values)} {value[-1]!r}")
+            lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(METRICS_DIR)
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+REPOSITORY_SECONDS = REGISTRY.histogram(
+    "repository_duration_seconds", "Time spent in repository methods.", ("method",)
+)
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "db_pool_connections", "Connections in the SQLAlchemy pool by state.", ("engine", "state")
+)
+ORDERS_CREATED = REGISTRY.counter("orders_created_total", "Orders created.")
+ORDERS_PAID = REGISTRY.counter("orders_paid_total", "Orders paid.")
+ORDERS_CANCELLED = REGISTRY.counter("orders_cancelled_total", "Orders cancelled.")
+ORDER_ITEMS_ADDED = REGISTRY.counter("order_items_added_total", "Items added to orders.")
+
+
+def timed(method):
+    """Record the duration of a repository coroutine as ``Class.method``."""
+    label = method.__qualname__
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            REPOSITORY_SECONDS.observe(time.perf_counter() - started, label)
+
+    return wrapper
+
+
+def record_pool(name: str, pool):
+    """Export checked-out/idle connection counts of a pool that tracks them."""
+    if not hasattr(pool, "checkedout"):
+        return  # NullPool/StaticPool keep no count
+    DB_POOL_CONNECTIONS.set(pool.checkedout(), name, "checked_out")
+    DB_POOL_CONNECTIONS.set(pool.checkedin(), name, "idle")
@@ -0,0 +1,158 @@
+"""Versioned schema migrations for PostgreSQL and SQLite.
+
+Migrations live in ``backend/migrations``: ``NNN_name.sql`` files are the
+PostgreSQL schema (the same files are mounted into the Postgres
+docker-entrypoint), ``sqlite/NNN_name.sql`` holds the SQLite equivalent of
+each version. Applied versions are recorded in ``schema_migrations``, so
+every file is run once per database.
+
+Run manually with ``python -m app.infrastructure.migrations``.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+_DOLLAR_QUOTE = re.compile(r"\$[A-Za-z_]*\$")
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate one at a time
+_ADVISORY_LOCK_KEY = 727_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    def statements(self) -> List[str]:
+        return split_statements(self.path.read_text(encoding="utf-8"))
+
+
+def discover(dialect: str, directory: Optional[Path] = None) -> List[Migration]:
+    """List migrations for ``dialect`` ordered by version."""
+    directory = directory or MIGRATIONS_DIR
+    if dialect == "sqlite":
+        directory = directory / "sqlite"
+    migrations = []
+    for path in directory.glob("*.sql"):
+        match = _FILENAME.match(path.name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), path))
+    return sorted(migrations, key=lambda m: m.version)
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a SQL script into single statements.
+
+    Drivers prepare one statement at a time, so scripts are split on ``;``
+    while skipping comments, string literals, ``$$`` function bodies and
+    SQLite ``BEGIN ... END`` trigger bodies.
+    """
+    statements = []
+    current = []
+    i = 0
+    while i < len(sql):
+        ch = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = len(sql) if end == -1 else end + 1
+            continue
+        if ch == "'":
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == "'" and sql.startswith("''", end):
+                    end += 2
+                    continue
+                if sql[end] == "'":
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+            continue
+        if ch == "$":
+            tag = _DOLLAR_QUOTE.match(sql, i)
+            if tag:
+                end = sql.find(tag.group(0), tag.end())
+                end = len(sql) if end == -1 else end + len(tag.group(0))
+                current.append(sql[i:end])
+                i = end
+                continue
+        if ch == ";":
+            statement = "".join(current).strip()
+            if _inside_trigger_body(statement):
+                current.append(ch)
+                i += 1
+                continue
+            if statement:
+                statements.append(statement)
+            current = []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def _inside_trigger_body(statement: str) -> bool:
+    head = statement.upper()
+    if not re.match(r"CREATE\s+(TEMP\s+|TEMPORARY\s+)?TRIGGER\b", head):
+        return False
+    return re.search(r"\bBEGIN\b", head) is not None and not re.search(r"\bEND$", head)
+
+
+async def apply_migrations(engine: AsyncEngine, directory: Optional[Path] = None) -> List[Migration]:
+    """Apply pending migrations in one transaction and return them."""
+    dialect = engine.dialect.name
+    async with engine.begin() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+        """))
+        result = await conn.execute(text("SELECT version FROM schema_migrations"))
+        applied = {row[0] for row in result}
+
+        pending = [m for m in discover(dialect, directory) if m.version not in applied]
+        for migration in pending:
+            for statement in migration.statements():
+                await conn.exec_driver_sql(statement)
+            await conn.execute(
+                text("""
+                    INSERT INTO schema_migrations (version, name, applied_at)
+                    VALUES (:version, :name, :applied_at)
+                """),
+                {"version": migration.version, "name": migration.name, "applied_at": datetime.now()},
+            )
+    return pending
+
+
+async def _main():
+    from app.infrastructure.db import engine
+
+    applied = await apply_migrations(engine)
+    for migration in applied:
+        print(f"applied {migration.version:03d}_{migration.name}")
+    if not applied:
+        print("schema is up to date")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,137 @@
+"""Cache of rendered order-detail responses.
+
+``GET /orders/{id}`` stores the serialized response body here. Cancelled
+orders never change, so their entries live until evicted; other orders
+(completed ones included: items can still be added to them) expire after
+``ORDER_CACHE_TTL`` seconds, which bounds how stale another instance's
+copy can get. Writes in this process invalidate
+entries right away: repositories record the orders they change in
+``session.info`` and the unit of work invalidates them after the commit.
+
+Every invalidation takes a new version number. A response rendered from
+data read before the latest invalidation of its order is not stored, so
+a slow reader cannot put an outdated body back. Entries are evicted
+least recently used first once their total size exceeds
+``ORDER_CACHE_MAX_BYTES``.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+from app.infrastructure.metrics import REGISTRY
+
+ORDER_CACHE_ENABLED = os.getenv("ORDER_CACHE", "1") not in ("0", "false", "no")
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "5"))
+ORDER_CACHE_MAX_BYTES = int(os.getenv("ORDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+ORDER_CACHE_REQUESTS = REGISTRY.counter(
+    "order_cache_requests_total", "Order detail cache lookups by outcome (hit, miss).", ("outcome",)
+)
+ORDER_CACHE_SIZE = REGISTRY.gauge(
+    "order_cache_size", "Order detail cache usage (entries, bytes).", ("unit",)
+)
+
+
+class OrderCache:
+    """LRU of response bodies by order id (event loop only, no locking)."""
+
+    # Invalidations remembered individually; older ones collapse into a floor
+    MAX_TRACKED_INVALIDATIONS = 10_000
+
+    def __init__(
+        self,
+        max_bytes: int = ORDER_CACHE_MAX_BYTES,
+        ttl: float = ORDER_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._floor = 0
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Number of entries and their total size in bytes."""
+        return len(self._entries), self._bytes
+
+    def version(self) -> int:
+        """Take before reading the order; pass to ``put`` with the rendered body."""
+        return self._version
+
+    def get(self, order_id, allow_mutable: bool = True) -> Optional[bytes]:
+        """Cached body, if fresh. ``allow_mutable=False`` only serves immutable orders."""
+        key = str(order_id)
+        body, expires = self._entries.get(key, (None, None))
+        if expires is not None and expires <= self._clock():
+            self._remove(key)
+            body = None
+        elif expires is not None and not allow_mutable:
+            body = None
+        elif body is not None:
+            self._entries.move_to_end(key)
+        ORDER_CACHE_REQUESTS.inc("hit" if body is not None else "miss")
+        return body
+
+    def put(self, order_id, version: int, body: bytes, immutable: bool):
+        key = str(order_id)
+        if version < self._invalidated.get(key, self._floor):
+            return  # rendered from data older than the last change
+        if len(body) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (body, None if immutable else self._clock() + self.ttl)
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, order_ids: Iterable):
+        for order_id in order_ids:
+            key = str(order_id)
+            self._version += 1
+            self._remove(key)
+            self._invalidated.pop(key, None)
+            self._invalidated[key] = self._version
+        while len(self._invalidated) > self.MAX_TRACKED_INVALIDATIONS:
+            _, version = self._invalidated.popitem(last=False)
+            self._floor = version
+
+    def clear(self):
+        self.invalidate(list(self._entries))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+_default_cache: Optional[OrderCache] = None
+
+
+def get_order_cache() -> Optional[OrderCache]:
+    """Process-wide cache used by the API, or None when disabled."""
+    global _default_cache
+    if _default_cache is None and ORDER_CACHE_ENABLED:
+        _default_cache = OrderCache()
+    return _default_cache
+
+
+def invalidate_orders(order_ids: Iterable):
+    """Drop cached responses of orders that changed (no-op when disabled)."""
+    if _default_cache is not None:
+        _default_cache.invalidate(order_ids)
+
+
+def _record_cache_size():
+    if _default_cache is not None:
+        entries, size = _default_cache.size
+        ORDER_CACHE_SIZE.set(entries, "entries")
+        ORDER_CACHE_SIZE.set(size, "bytes")
+
+
+REGISTRY.add_collector(_record_cache_size)
@@ -0,0 +1,224 @@
+"""Maintenance of monthly partitions on PostgreSQL.
+
+Migration 004 turns ``orders``, ``order_items`` and ``order_status_history``
+into tables range-partitioned by month. This module keeps partitions for
+upcoming months in place and detaches old ones so the hot tables stay small.
+Rows written before their month's partition existed land in the DEFAULT
+partitions; ``ensure`` moves them out when it creates that partition.
+
+Usage::
+
+    python -m app.infrastructure.partitions ensure --months-ahead 3
+    python -m app.infrastructure.partitions detach --before 2024-01 [--drop]
+"""
+
+import argparse
+import asyncio
+import re
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Detach children before parents: order_items references orders
+PARTITIONED_TABLES = ("order_items", "order_status_history", "orders")
+
+PARTITION_KEYS = {"orders": "created_at", "order_items": "created_at", "order_status_history": "changed_at"}
+
+ARCHIVE_SCHEMA = "archive"
+
+_PARTITION_NAME = re.compile(r"^(?P<parent>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Return the first day of the month stored in partition ``name``."""
+    match = _PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return date(int(match.group("year")), int(match.group("month")), 1)
+
+
+async def is_partitioned(engine: AsyncEngine) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    async with engine.connect() as conn:
+        # Compared in SQL: asyncpg returns the "char" relkind as bytes
+        result = await conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'orders'::regclass"))
+        return bool(result.scalar())
+
+
+async def ensure_future_partitions(engine: AsyncEngine, months_ahead: int = 3) -> bool:
+    """Create partitions up to ``months_ahead`` months from now.
+
+    Postgres refuses to create a partition while the DEFAULT partition
+    holds rows of its range, so those rows are moved into the new
+    partition first (see ``_adopt_default_rows``).
+
+    Returns False when the database is not partitioned (e.g. SQLite).
+    """
+    if not await is_partitioned(engine):
+        return False
+    async with engine.begin() as conn:
+        result = await conn.execute(text("SELECT CAST(date_trunc('month', NOW()) AS date)"))
+        month = result.scalar()
+        months = [month]
+        for _ in range(months_ahead):
+            months.append(_next_month(months[-1]))
+        await _adopt_default_rows(conn, months)
+        await conn.execute(text("SELECT ensure_monthly_partitions(:months)"), {"months": months_ahead})
+    return True
+
+
+async def _adopt_default_rows(conn, months: List[date]) -> List[str]:
+    """Create the missing partitions of ``months`` that have rows in DEFAULT.
+
+    The DEFAULT partitions are detached while the rows move: deleting from
+    an attached ``orders_default`` would cascade to the order items, and
+    inserting through ``orders`` would fire the status history trigger.
+    Rows are copied into plain tables which are then attached together
+    with the DEFAULT partitions, so their foreign keys are checked again.
+    Returns the names of the new partitions.
+    """
+    pending = []
+    for month in months:
+        for parent in PARTITIONED_TABLES:
+            name = f"{parent}_p{month:%Y_%m}"
+            result = await conn.execute(text("SELECT to_regclass(:name) IS NULL"), {"name": name})
+            if not result.scalar():
+                continue
+            key = PARTITION_KEYS[parent]
+            result = await conn.execute(
+                text(f'SELECT EXISTS (SELECT 1 FROM "{parent}_default" WHERE "{key}" >= :start AND "{key}" < :end)'),
+                {"start": month, "end": _next_month(month)},
+            )
+            if result.scalar():
+                pending.append((parent, name, month))
+    if not pending:
+        return []
+
+    for parent in PARTITIONED_TABLES:
+        await conn.execute(text(f'ALTER TABLE "{parent}" DETACH PARTITION "{parent}_default"'))
+        # Attaching recreates it; merging the leftover copy breaks later detaches
+        for constraint in await _foreign_keys_to_orders(conn, f"{parent}_default"):
+            await conn.execute(text(f'ALTER TABLE "{parent}_default" DROP CONSTRAINT "{constraint}"'))
+    for parent, name, month in pending:
+        key = PARTITION_KEYS[parent]
+        await conn.execute(text(f'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+        await conn.execute(
+            text(f"""
+                WITH moved AS (
+                    DELETE FROM "{parent}_default" WHERE "{key}" >= :start AND "{key}" < :end RETURNING *
+                )
+                INSERT INTO "{name}" SELECT * FROM moved
+            """),
+            {"start": month, "end": _next_month(month)},
+        )
+    # Attach parents first: attaching order_items checks its foreign key to orders
+    for parent in reversed(PARTITIONED_TABLES):
+        for table, name, month in pending:
+            if table == parent:
+                await conn.execute(
+                    text(
+                        f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" '
+                        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+                    )
+                )
+        await conn.execute(text(f'ALTER TABLE "{parent}" ATTACH PARTITION "{parent}_default" DEFAULT'))
+    return [name for _, name, _ in pending]
+
+
+async def detach_partitions_before(
+    engine: AsyncEngine,
+    before: date,
+    drop: bool = False,
+    schema: str = ARCHIVE_SCHEMA,
+) -> List[str]:
+    """Detach monthly partitions that end on or before ``before``.
+
+    Detached partitions are moved to ``schema`` (where they can be dumped
+    or queried ad hoc) or dropped when ``drop`` is set. Returns their names.
+
+    A detached partition keeps its foreign keys as plain constraints; the
+    one from an order_items partition to ``orders`` would make detaching
+    the matching orders partition fail, so it is dropped.
+    """
+    if not await is_partitioned(engine):
+        return []
+
+    detached = []
+    async with engine.begin() as conn:
+        if not drop:
+            await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        for parent in PARTITIONED_TABLES:
+            result = await conn.execute(
+                text("""
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = CAST(:parent AS regclass)
+                """),
+                {"parent": parent},
+            )
+            for (name,) in result.all():
+                month = partition_month(name)
+                if month is None or not name.startswith(f"{parent}_p") or not _month_ends_by(month, before):
+                    continue
+                await conn.execute(text(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}"'))
+                if drop:
+                    await conn.execute(text(f'DROP TABLE "{name}"'))
+                else:
+                    for constraint in await _foreign_keys_to_orders(conn, name):
+                        await conn.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT "{constraint}"'))
+                    await conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"'))
+                detached.append(name)
+    return detached
+
+
+async def _foreign_keys_to_orders(conn, table: str) -> List[str]:
+    result = await conn.execute(
+        text("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = CAST(:table AS regclass)
+              AND contype = 'f'
+              AND confrelid = CAST('orders' AS regclass)
+        """),
+        {"table": table},
+    )
+    return [name for (name,) in result.all()]
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _month_ends_by(month: date, before: date) -> bool:
+    return _next_month(month) <= before
+
+
+async def _main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create partitions for upcoming months")
+    ensure.add_argument("--months-ahead", type=int, default=3)
+    detach = commands.add_parser("detach", help="detach partitions older than a month")
+    detach.add_argument("--before", required=True, help="first month to keep, YYYY-MM")
+    detach.add_argument("--drop", action="store_true", help="drop instead of moving to the archive schema")
+    args = parser.parse_args(argv)
+
+    from app.infrastructure.db import engine
+
+    try:
+        if args.command == "ensure":
+            if not await ensure_future_partitions(engine, args.months_ahead):
+                print("orders is not partitioned, nothing to do")
+        else:
+            year, month = (int(part) for part in args.before.split("-"))
+            for name in await detach_partitions_before(engine, date(year, month, 1), drop=args.drop):
+                print(f"detached {name}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,163 @@
+"""Token-bucket rate limiting.
+
+Each client gets a bucket per rule that refills at ``rate`` tokens per
+second up to ``burst``; a request takes one token. Bucket state lives in a
+store: ``MemoryTokenBucketStore`` keeps it in the worker process, and
+``RedisTokenBucketStore`` shares it between workers and instances when
+``RATE_LIMIT_REDIS_URL`` is set. Neither touches the database.
+"""
+
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1") not in ("0", "false", "no")
+# "METHOD /path/pattern=rate/burst" rules separated by ";"; "*" matches one path segment
+RATE_LIMIT_RULES = os.getenv(
+    "RATE_LIMIT_RULES",
+    "POST /api/orders/*/items=10/20; GET /api/orders=20/40",
+)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    method: str
+    pattern: str
+    rate: float
+    burst: int
+
+    def __post_init__(self):
+        regex = "/".join("[^/]+" if part == "*" else re.escape(part) for part in self.pattern.split("/"))
+        object.__setattr__(self, "_regex", re.compile(f"{regex}/?"))
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self._regex.fullmatch(path) is not None
+
+
+def parse_rules(spec: str) -> List[RateLimitRule]:
+    """Parse ``RATE_LIMIT_RULES``, e.g. ``"GET /api/orders=20/40"``."""
+    rules = []
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        route, _, limit = entry.rpartition("=")
+        method, _, pattern = route.strip().partition(" ")
+        rate, _, burst = limit.partition("/")
+        rules.append(RateLimitRule(method.upper(), pattern.strip(), float(rate), int(burst or rate)))
+    return rules
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: int
+    # Seconds until the next token (when refused) and until the bucket is full
+    retry_after: float
+    reset: float
+
+
+def _decide(allowed: bool, tokens: float, rate: float, burst: int) -> Decision:
+    return Decision(
+        allowed=allowed,
+        remaining=int(tokens),
+        retry_after=0.0 if allowed else (1 - tokens) / rate,
+        reset=(burst - tokens) / rate,
+    )
+
+
+class MemoryTokenBucketStore:
+    """Buckets in a dict owned by this process (no locking: event loop only)."""
+
+    # Least recently used buckets beyond this are forgotten (they refill anyway)
+    MAX_BUCKETS = 100_000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key: str, rate: float, burst: int) -> Decision:
+        now = self._clock()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.MAX_BUCKETS:
+            del self._buckets[next(iter(self._buckets))]
+        return _decide(allowed, tokens, rate, burst)
+
+
+class RedisTokenBucketStore:
+    """Buckets in Redis, updated atomically by a Lua script.
+
+    ``client`` is a ``redis.asyncio.Redis``; the script reads the server
+    clock so workers with skewed clocks agree on refills.
+    """
+
+    SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> Decision:
+        allowed, tokens = await self._script(keys=[self.prefix + key], args=[rate, burst])
+        return _decide(bool(allowed), float(tokens), rate, burst)
+
+
+_default_store = None
+
+
+def get_rate_limit_store():
+    """Process-wide store: Redis when ``RATE_LIMIT_REDIS_URL`` is set."""
+    global _default_store
+    if _default_store is None:
+        if RATE_LIMIT_REDIS_URL:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed")
+            _default_store = RedisTokenBucketStore(redis.from_url(RATE_LIMIT_REDIS_URL))
+        else:
+            _default_store = MemoryTokenBucketStore()
+    return _default_store
+
+
+def rate_limit_headers(rule: RateLimitRule, decision: Decision) -> Dict[str, str]:
+    """``RateLimit-*`` headers (IETF draft), plus ``Retry-After`` when refused."""
+    headers = {
+        "RateLimit-Limit": str(rule.burst),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset)),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(decision.retry_after)))
+    return headers
+
+
+def find_rule(rules: List[RateLimitRule], method: str, path: str) -> Optional[RateLimitRule]:
+    for rule in rules:
+        if rule.matches(method, path):
+            return rule
+    return None
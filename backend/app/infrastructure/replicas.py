@@ -0,0 +1,87 @@
+"""Read replica routing for read-only sessions."""
+
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+
+class ReplicaRouter:
+    """Decides whether a read-only session may be served by the replica.
+
+    Two things keep a read on the primary:
+
+    * read-your-writes: a client that wrote recently sticks to the primary
+      for ``sticky_seconds`` so it never observes replication lag;
+    * health: after a connection error the replica is taken out of rotation
+      for ``retry_seconds`` and reads fall back to the primary.
+    """
+
+    # Upper bound on remembered writers before expired entries are pruned.
+    MAX_TRACKED_CLIENTS = 10_000
+
+    def __init__(
+        self,
+        sticky_seconds: float = 2.0,
+        retry_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self._clock = clock
+        self._last_write: Dict[str, float] = {}
+        self._down_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self._clock() >= self._down_until
+
+    def mark_unhealthy(self):
+        """Take the replica out of rotation for ``retry_seconds``."""
+        self._down_until = self._clock() + self.retry_seconds
+
+    def mark_write(self, client_key: Optional[str]):
+        """Remember that ``client_key`` has just committed a write."""
+        if not client_key or self.sticky_seconds <= 0:
+            return
+        now = self._clock()
+        if len(self._last_write) >= self.MAX_TRACKED_CLIENTS:
+            horizon = now - self.sticky_seconds
+            self._last_write = {k: t for k, t in self._last_write.items() if t > horizon}
+        self._last_write[client_key] = now
+
+    def is_sticky(self, client_key: Optional[str]) -> bool:
+        if not client_key:
+            return False
+        written_at = self._last_write.get(client_key)
+        return written_at is not None and self._clock() - written_at < self.sticky_seconds
+
+    def use_replica(self, client_key: Optional[str] = None) -> bool:
+        """Return True if a read-only session for ``client_key`` may use the replica."""
+        return self.healthy and not self.is_sticky(client_key)
+
+
+class RoutingSession(Session):
+    """Session that sends read-only work to the replica engine.
+
+    The choice is made per session: ``get_read_uow`` sets
+    ``info["use_replica"]``, everything else runs on the primary bind.
+    """
+
+    replica_bind = None
+    router: Optional[ReplicaRouter] = None
+
+    @property
+    def reads_replica(self) -> bool:
+        """Whether this session's statements currently go to the replica."""
+        return bool(
+            self.replica_bind is not None
+            and self.info.get("use_replica")
+            and self.router is not None
+            and self.router.healthy
+        )
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.reads_replica:
+            return self.replica_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
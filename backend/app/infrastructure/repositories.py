@@ -1,16 +1,21 @@
 """Repository implementations using SQLAlchemy."""
 
+import functools
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List, Tuple
 import os
 
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.domain.user import User
+from app.domain.exceptions import OrderConflictError
 from app.domain.order import Order, OrderItem, OrderStatus, OrderStatusChange
+from app.infrastructure.metrics import timed
+from app.infrastructure.sharding import merge, on_shard, scatter, shard_names, shard_of, shard_router
 
 
 def _to_float(value):
@@ -20,51 +25,433 @@ def _to_float(value):
     return value
 
 
+def _to_decimal(value):
+    """Convert driver numbers (REAL on SQLite) back to Decimal for the domain."""
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _where(conditions: List[str]) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _created_range(created_from: Optional[datetime], created_to: Optional[datetime]):
+    """Build a created_at filter; a range on the partition key enables pruning."""
+    conditions, params = [], {}
+    if created_from is not None:
+        conditions.append("created_at >= :created_from")
+        params["created_from"] = created_from
+    if created_to is not None:
+        conditions.append("created_at < :created_to")
+        params["created_to"] = created_to
+    return conditions, params
+
+
+# Statements are built once at import: SQLAlchemy keys its compiled cache on
+# them and asyncpg keeps them prepared per connection, so per-call cost is
+# only parameter binding. Variable filters are cached per combination.
+USER_UPSERT = text("""
+    INSERT INTO users (id, email, name, created_at)
+    VALUES (:id, :email, :name, :created_at)
+    ON CONFLICT (id) DO UPDATE
+    SET email = EXCLUDED.email, name = EXCLUDED.name
+""")
+USER_CREATE = text("""
+    INSERT INTO users (id, email, name, created_at)
+    VALUES (:id, :email, :name, :created_at)
+    ON CONFLICT (email) DO NOTHING
+    RETURNING id
+""")
+USER_BY_ID = text("SELECT id, email, name, created_at FROM users WHERE id = :id")
+USER_BY_EMAIL = text("SELECT id, email, name, created_at FROM users WHERE email = :email")
+USER_ALL = text("SELECT id, email, name, created_at FROM users")
+
+# An existing order is only updated while it still has the status it was
+# loaded with; no row back means a concurrent change won
+ORDER_UPSERT = text("""
+    INSERT INTO orders (id, user_id, status_id, total_amount, created_at)
+    VALUES (
+        :id,
+        :user_id,
+        (SELECT id FROM order_statuses WHERE name = :status),
+        :total_amount,
+        :created_at
+    )
+    ON CONFLICT (id, created_at) DO UPDATE
+    SET status_id = EXCLUDED.status_id,
+        total_amount = EXCLUDED.total_amount
+    WHERE orders.status_id = (SELECT id FROM order_statuses WHERE name = :expected)
+    RETURNING id
+""")
+ORDER_ITEMS_DELETE = text("DELETE FROM order_items WHERE order_id = :id")
+ORDER_ITEM_INSERT = text("""
+    INSERT INTO order_items (id, order_id, product_name, price, quantity, created_at)
+    VALUES (:id, :order_id, :product_name, :price, :quantity, :created_at)
+""")
+ORDER_BY_ID = text("""
+    SELECT o.id, o.user_id, o.total_amount, o.created_at, s.name as status_name
+    FROM orders o
+    JOIN order_statuses s ON o.status_id = s.id
+    WHERE o.id = :id
+""")
+# Items share the order's created_at, which lets Postgres prune partitions
+ORDER_ITEMS_BY_ORDER = text("""
+    SELECT id, product_name, price, quantity FROM order_items
+    WHERE order_id = :id AND created_at = :created_at
+""")
+ORDER_HISTORY_BY_ORDER = text("""
+    SELECT h.id, s.name, h.changed_at
+    FROM order_status_history h
+    JOIN order_statuses s ON h.status_id = s.id
+    WHERE h.order_id = :id ORDER BY h.changed_at
+""")
+ORDERS_DELETE = tuple(
+    text(statement).bindparams(bindparam("ids", expanding=True))
+    for statement in (
+        "DELETE FROM order_status_history WHERE order_id IN :ids",
+        "DELETE FROM order_items WHERE order_id IN :ids",
+        "DELETE FROM orders WHERE id IN :ids",
+    )
+)
+
+
+def _keyset(after: Optional[uuid.UUID], limit: Optional[int]):
+    """Page condition for listings ordered by id (UUIDv7: creation order)."""
+    conditions, params = [], {}
+    if after is not None:
+        conditions.append("id > :after")
+        params["after"] = str(after)
+    if limit is not None:
+        params["limit"] = limit
+    return conditions, params
+
+
+# Set-based status changes: one statement for the whole batch. The
+# status history triggers fire per updated row inside it.
+_TRANSITION = """
+    UPDATE orders
+    SET status_id = (SELECT id FROM order_statuses WHERE name = :target)
+    WHERE {ids} AND status_id = (SELECT id FROM order_statuses WHERE name = :expected)
+    RETURNING id, user_id, total_amount, created_at
+"""
+_STATUSES = """
+    SELECT o.id, s.name FROM orders o
+    JOIN order_statuses s ON o.status_id = s.id
+    WHERE {ids}
+"""
+
+
+def _by_ids(statement: str, column: str):
+    """Postgres binds the ids as one array; SQLite expands them into IN (...)."""
+    return {
+        "postgresql": text(statement.format(ids=f"{column} = ANY(:ids)")),
+        "sqlite": text(statement.format(ids=f"{column} IN :ids")).bindparams(bindparam("ids", expanding=True)),
+    }
+
+
+ORDERS_TRANSITION = _by_ids(_TRANSITION, "id")
+ORDER_STATUSES_BY_IDS = _by_ids(_STATUSES, "o.id")
+USERS_BY_IDS = _by_ids("SELECT id, email, name, created_at FROM users WHERE {ids}", "id")
+ORDERS_BY_IDS = _by_ids("""
+    SELECT o.id, o.user_id, o.total_amount, o.created_at, s.name as status_name
+    FROM orders o
+    JOIN order_statuses s ON o.status_id = s.id
+    WHERE {ids}
+""", "o.id")
+ORDER_ITEMS_BY_ORDERS = _by_ids(
+    "SELECT id, order_id, product_name, price, quantity FROM order_items WHERE {ids}", "order_id"
+)
+ORDER_HISTORY_BY_ORDERS = _by_ids("""
+    SELECT h.id, h.order_id, s.name, h.changed_at
+    FROM order_status_history h
+    JOIN order_statuses s ON h.status_id = s.id
+    WHERE {ids} ORDER BY h.changed_at
+""", "h.order_id")
+
+
+@functools.lru_cache(maxsize=None)
+def _select_order_ids(conditions: Tuple[str, ...], limited: bool = False):
+    query = "SELECT id FROM orders" + _where(list(conditions)) + " ORDER BY id"
+    return text(query + " LIMIT :limit" if limited else query)
+
+
+@functools.lru_cache(maxsize=None)
+def _select_order_ids_by_status(created_before: bool):
+    conditions = ["status_id IN (SELECT id FROM order_statuses WHERE name IN :statuses)"]
+    if created_before:
+        conditions.append("created_at < :created_before")
+    return text(
+        "SELECT id, created_at FROM orders" + _where(conditions) + " ORDER BY created_at LIMIT :limit"
+    ).bindparams(bindparam("statuses", expanding=True))
+
+
+# Product search: trigram index behind ILIKE on Postgres, FTS5 trigram table on SQLite
+_PRODUCT_MATCH = {
+    "postgresql": "SELECT order_id FROM order_items WHERE product_name ILIKE :pattern ESCAPE '\\'",
+    "sqlite": "SELECT order_id FROM order_items_fts WHERE order_items_fts MATCH :pattern",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _search_orders_by_product(dialect: str, paged: bool):
+    conditions = [f"o.id IN ({_PRODUCT_MATCH[dialect]})"]
+    if paged:
+        conditions.append("o.id > :after")
+    return text(f"""
+        SELECT o.id, o.user_id, o.total_amount, o.created_at, s.name as status_name
+        FROM orders o
+        JOIN order_statuses s ON o.status_id = s.id
+        {_where(conditions)}
+        ORDER BY o.id LIMIT :limit
+    """)
+
+
+def _product_pattern(dialect: str, query: str) -> str:
+    if dialect == "postgresql":
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{escaped}%"
+    # An FTS5 string token is matched as a substring by the trigram tokenizer
+    return '"' + query.replace('"', '""') + '"'
+
+
+@dataclass
+class OrderSummary:
+    """Order row without items and history, for listings and search results.
+
+    Listings may select only some columns; the others are left as None.
+    """
+
+    id: uuid.UUID
+    user_id: Optional[uuid.UUID] = None
+    status: Optional[OrderStatus] = None
+    total_amount: Optional[Decimal] = None
+    created_at: Optional[datetime] = None
+
+
+# Columns of OrderSummary that listings can select
+ORDER_SUMMARY_COLUMNS = {
+    "id": "id",
+    "user_id": "user_id",
+    "status": "(SELECT name FROM order_statuses s WHERE s.id = orders.status_id) AS status",
+    "total_amount": "total_amount",
+    "created_at": "created_at",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _select_order_summaries(columns: Tuple[str, ...], conditions: Tuple[str, ...], limited: bool):
+    select = ", ".join(ORDER_SUMMARY_COLUMNS[column] for column in columns)
+    query = f"SELECT {select} FROM orders" + _where(list(conditions)) + " ORDER BY id"
+    return text(query + " LIMIT :limit" if limited else query)
+
+
+def _order_summary(row) -> OrderSummary:
+    summary = OrderSummary(id=row["id"])
+    if "user_id" in row:
+        summary.user_id = row["user_id"]
+    if "status" in row:
+        summary.status = OrderStatus(row["status"])
+    if "total_amount" in row:
+        summary.total_amount = _to_decimal(row["total_amount"])
+    if "created_at" in row:
+        summary.created_at = row["created_at"]
+    return summary
+
+
+def _new_order(row) -> Order:
+    """Order from an ``ORDER_BY_ID`` row; items and history are filled in by the caller."""
+    order = object.__new__(Order)
+    order.id = row['id']
+    order.user_id = row['user_id']
+    order.status = OrderStatus(row['status_name'])
+    order.total_amount = _to_decimal(row['total_amount'])
+    order.created_at = row['created_at']
+    order.items = []
+    order.status_history = []
+    return order
+
+
+def _item(row, order_id) -> OrderItem:
+    return OrderItem(
+        id=row['id'],
+        product_name=row['product_name'],
+        price=_to_decimal(row['price']),
+        quantity=row['quantity'],
+        order_id=order_id
+    )
+
+
+def _change(row) -> OrderStatusChange:
+    return OrderStatusChange(id=row['id'], status=OrderStatus(row['name']), changed_at=row['changed_at'])
+
+
+class IdentityMap:
+    """Aggregates loaded or saved through one session.
+
+    Repeated lookups of the same id return the same instance, and each
+    instance keeps a snapshot of its last persisted state so ``save`` can
+    skip aggregates that did not change.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._snapshots = {}
+
+    def get(self, kind: type, obj_id):
+        return self._objects.get((kind, str(obj_id)))
+
+    def add(self, obj, snapshot=None):
+        key = (type(obj), str(obj.id))
+        self._objects[key] = obj
+        if snapshot is None:
+            self._snapshots.pop(key, None)
+        else:
+            self._snapshots[key] = snapshot
+
+    def is_clean(self, obj, snapshot) -> bool:
+        return self.snapshot(obj) == snapshot
+
+    def snapshot(self, obj):
+        """Last persisted state of ``obj``, or None if it was never loaded or saved."""
+        return self._snapshots.get((type(obj), str(obj.id)))
+
+    def discard(self, kind: type, obj_id):
+        key = (kind, str(obj_id))
+        self._objects.pop(key, None)
+        self._snapshots.pop(key, None)
+
+    def clear(self):
+        self._objects.clear()
+        self._snapshots.clear()
+
+
+def identity_map(session: AsyncSession) -> IdentityMap:
+    """The identity map of ``session`` (one per session, shared by repositories)."""
+    return session.info.setdefault("identity_map", IdentityMap())
+
+
+def mark_orders_changed(session: AsyncSession, order_ids: Iterable):
+    """Record written orders; the unit of work invalidates their cached responses on commit."""
+    session.info.setdefault("changed_orders", set()).update(str(order_id) for order_id in order_ids)
+
+
+def _everywhere(session: AsyncSession, params: dict) -> Dict[Optional[str], dict]:
+    """The same parameters for every shard of ``session``."""
+    return {shard: params for shard in shard_names(session)}
+
+
+def _by_id(row) -> str:
+    return str(row["id"])
+
+
+def _user_state(user: User):
+    return (user.email, user.name)
+
+
+def _order_state(order: Order):
+    return (
+        order.status,
+        order.total_amount,
+        tuple((str(i.id), i.product_name, i.price, i.quantity) for i in order.items),
+    )
+
+
 class UserRepository:
     """Repository for User."""
 
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.identity_map = identity_map(session)
 
+    @timed
     async def save(self, user: User) -> User:
-        """Save user to database."""
-        query = text("""
-            INSERT INTO users (id, email, name, created_at)
-            VALUES (:id, :email, :name, :created_at)
-            ON CONFLICT (id) DO UPDATE 
-            SET email = EXCLUDED.email, name = EXCLUDED.name
-        """)
-        await self.session.execute(query, {
+        """Save user to database (no-op if unchanged since loaded)."""
+        state = _user_state(user)
+        if self.identity_map.is_clean(user, state):
+            return user
+        await self.session.execute(USER_UPSERT, {
             "id": str(user.id), 
             "email": user.email, 
             "name": user.name, 
             "created_at": user.created_at
-        })
+        }, bind_arguments=on_shard(shard_of(self.session, user.id)))
+        self.identity_map.add(user, state)
         return user
 
+    @timed
+    async def create(self, user: User) -> bool:
+        """Insert a new user; return False if the email is already taken.
+
+        The unique index on email decides atomically, so concurrent signups
+        with the same email cannot both succeed. With shards the index only
+        covers the user's shard: other shards are checked first, which
+        catches all but concurrent signups landing on different shards.
+        """
+        if shard_router(self.session) is not None and await self.find_by_email(user.email) is not None:
+            return False
+        result = await self.session.execute(USER_CREATE, {
+            "id": str(user.id),
+            "email": user.email,
+            "name": user.name,
+            "created_at": user.created_at
+        }, bind_arguments=on_shard(shard_of(self.session, user.id)))
+        if result.first() is None:
+            return False
+        self.identity_map.add(user, _user_state(user))
+        return True
+
+    def _load(self, row) -> User:
+        user = self.identity_map.get(User, row["id"])
+        if user is None:
+            user = User(**row)
+            self.identity_map.add(user, _user_state(user))
+        return user
+
+    @timed
     async def find_by_id(self, user_id: uuid.UUID) -> Optional[User]:
         """Find user by ID."""
-        query = text("SELECT id, email, name, created_at FROM users WHERE id = :id")
-        result = await self.session.execute(query, {"id": str(user_id)})
+        user = self.identity_map.get(User, user_id)
+        if user is not None:
+            return user
+        result = await self.session.execute(
+            USER_BY_ID, {"id": str(user_id)}, bind_arguments=on_shard(shard_of(self.session, user_id))
+        )
         row = result.mappings().first()
         if row:
-            return User(**row)
+            return self._load(row)
         return None
 
+    @timed
+    async def find_many(self, user_ids: List[uuid.UUID]) -> List[User]:
+        """Find users by id with one query (per shard), in the order given; missing ids are skipped."""
+        ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        missing = [user_id for user_id in ids if self.identity_map.get(User, user_id) is None]
+        if missing:
+            dialect = self.session.get_bind().dialect.name
+            by_shard = {}
+            for user_id in missing:
+                by_shard.setdefault(shard_of(self.session, user_id), []).append(user_id)
+            params = {shard: {"ids": shard_ids} for shard, shard_ids in by_shard.items()}
+            for rows in await scatter(self.session, USERS_BY_IDS[dialect], params):
+                for row in rows:
+                    self._load(row)
+        found = (self.identity_map.get(User, user_id) for user_id in ids)
+        return [user for user in found if user is not None]
+
+    @timed
     async def find_by_email(self, email: str) -> Optional[User]:
         """Find user by email."""
-        query = text("SELECT id, email, name, created_at FROM users WHERE email = :email")
-        result = await self.session.execute(query, {"email": email})
-        row = result.mappings().first()
-        if row:
-            return User(**row)
+        for rows in await scatter(self.session, USER_BY_EMAIL, _everywhere(self.session, {"email": email})):
+            if rows:
+                return self._load(rows[0])
         return None
 
+    @timed
     async def find_all(self) -> List[User]:
         """Find all users."""
-        query = text("SELECT id, email, name, created_at FROM users")
-        result = await self.session.execute(query)
-        return [User(**row) for row in result.mappings().all()]
+        shards = await scatter(self.session, USER_ALL, _everywhere(self.session, {}))
+        return [self._load(row) for rows in shards for row in rows]
 
 
 class OrderRepository:
@@ -72,125 +459,292 @@ class OrderRepository:
 
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.identity_map = identity_map(session)
 
+    def track(self, order: Order):
+        """Register a new order so lookups in this session return it."""
+        if self.identity_map.get(Order, order.id) is not order:
+            self.identity_map.add(order)
+
+    @timed
     async def save(self, order: Order) -> Order:
-        """Save order to database."""
-        query_order = text("""
-            INSERT INTO orders (id, user_id, status_id, total_amount, created_at)
-            VALUES (
-                :id, 
-                :user_id, 
-                (SELECT id FROM order_statuses WHERE name = :status), 
-                :total_amount, 
-                :created_at
-            )
-            ON CONFLICT (id) DO UPDATE 
-            SET status_id = EXCLUDED.status_id,
-                total_amount = EXCLUDED.total_amount
-        """)
-        await self.session.execute(query_order, {
+        """Save order to database (no-op if unchanged since loaded or saved).
+
+        Raises ``OrderConflictError`` if the stored order no longer has the
+        status it was loaded with (e.g. the expiry sweeper cancelled it).
+        """
+        state = _order_state(order)
+        persisted = self.identity_map.snapshot(order)
+        if persisted == state:
+            return order
+        expected = persisted[0] if persisted is not None else order.status
+        shard = on_shard(shard_of(self.session, order.user_id))
+        result = await self.session.execute(ORDER_UPSERT, {
             "id": str(order.id), 
             "user_id": str(order.user_id),
             "status": order.status.value, 
+            "expected": expected.value,
             "total_amount": _to_float(order.total_amount),
             "created_at": order.created_at
-        })
+        }, bind_arguments=shard)
+        if result.first() is None:
+            self.identity_map.discard(Order, order.id)
+            raise OrderConflictError(order.id)
 
         # Delete old items and insert new ones
-        await self.session.execute(
-            text("DELETE FROM order_items WHERE order_id = :id"), 
-            {"id": str(order.id)}
-        )
-        
-        for item in order.items:
-            await self.session.execute(text("""
-                INSERT INTO order_items (id, order_id, product_name, price, quantity)
-                VALUES (:id, :order_id, :product_name, :price, :quantity)
-            """), {
-                "id": str(item.id), 
-                "order_id": str(order.id),
-                "product_name": item.product_name, 
-                "price": _to_float(item.price),
-                "quantity": item.quantity
-            })
-            
+        await self.session.execute(ORDER_ITEMS_DELETE, {"id": str(order.id)}, bind_arguments=shard)
+
+        # One executemany for all items instead of a round trip per item
+        if order.items:
+            await self.session.execute(ORDER_ITEM_INSERT, [
+                {
+                    "id": str(item.id),
+                    "order_id": str(order.id),
+                    "product_name": item.product_name,
+                    "price": _to_float(item.price),
+                    "quantity": item.quantity,
+                    "created_at": order.created_at
+                }
+                for item in order.items
+            ], bind_arguments=shard)
+
+        self.identity_map.add(order, state)
+        mark_orders_changed(self.session, [order.id])
         return order
 
+    @timed
     async def find_by_id(self, order_id: uuid.UUID) -> Optional[Order]:
-        """Find order by ID with all items and history."""
-        query = text("""
-            SELECT o.id, o.user_id, o.total_amount, o.created_at, s.name as status_name
-            FROM orders o
-            JOIN order_statuses s ON o.status_id = s.id
-            WHERE o.id = :id
-        """)
-        result = await self.session.execute(query, {"id": str(order_id)})
-        row = result.mappings().first()
-        if not row:
-            return None
+        """Find order by ID with all items and history (looked up on every shard)."""
+        return await self._find_by_id(order_id, shard_names(self.session))
 
-        order = object.__new__(Order)
-        order.id = row['id']
-        order.user_id = row['user_id']
-        order.status = OrderStatus(row['status_name'])
-        order.total_amount = row['total_amount']
-        order.created_at = row['created_at']
-        order.items = []
-        order.status_history = []
+    async def _find_by_id(self, order_id, shards: List[Optional[str]]) -> Optional[Order]:
+        cached = self.identity_map.get(Order, order_id)
+        if cached is not None:
+            return cached
+        params = {shard: {"id": str(order_id)} for shard in shards}
+        rows_by_shard = await scatter(self.session, ORDER_BY_ID, params)
+        found = [(shard, rows[0]) for shard, rows in zip(shards, rows_by_shard) if rows]
+        if not found:
+            return None
 
+        shard, row = found[0]
+        order = _new_order(row)
         items_res = await self.session.execute(
-            text("SELECT id, product_name, price, quantity FROM order_items WHERE order_id = :id"), 
-            {"id": str(order_id)}
+            ORDER_ITEMS_BY_ORDER,
+            {"id": str(order_id), "created_at": row['created_at']},
+            bind_arguments=on_shard(shard),
         )
-        for r in items_res.mappings().all():
-            item = OrderItem(
-                id=r['id'], 
-                product_name=r['product_name'], 
-                price=r['price'], 
-                quantity=r['quantity'], 
-                order_id=order_id
-            )
-            order.items.append(item)
-
+        order.items = [_item(r, order_id) for r in items_res.mappings().all()]
         hist_res = await self.session.execute(
-            text("""
-                SELECT h.id, s.name, h.changed_at 
-                FROM order_status_history h
-                JOIN order_statuses s ON h.status_id = s.id
-                WHERE h.order_id = :id ORDER BY h.changed_at
-            """), 
-            {"id": str(order_id)}
+            ORDER_HISTORY_BY_ORDER, {"id": str(order_id)}, bind_arguments=on_shard(shard)
         )
-        for r in hist_res.mappings().all():
-            change = OrderStatusChange(
-                id=r['id'], 
-                status=OrderStatus(r['name']), 
-                changed_at=r['changed_at']
-            )
-            order.status_history.append(change)
+        order.status_history = [_change(r) for r in hist_res.mappings().all()]
 
+        self.identity_map.add(order, _order_state(order))
         return order
 
-    async def find_by_user(self, user_id: uuid.UUID) -> List[Order]:
-        """Find all orders for a user."""
-        query = text("SELECT id FROM orders WHERE user_id = :user_id")
-        result = await self.session.execute(query, {"user_id": str(user_id)})
-        rows = result.mappings().all()
-        orders = []
-        for r in rows:
-            order = await self.find_by_id(r['id'])
-            if order: 
-                orders.append(order)
-        return orders
-
-    async def find_all(self) -> List[Order]:
-        """Find all orders."""
-        query = text("SELECT id FROM orders")
-        result = await self.session.execute(query)
-        rows = result.mappings().all()
-        orders = []
-        for r in rows:
-            order = await self.find_by_id(r['id'])
-            if order: 
-                orders.append(order)
-        return orders
+    @timed
+    async def find_many(self, order_ids: List[uuid.UUID]) -> List[Order]:
+        """Find orders by id with items and history, in the order given.
+
+        Takes three queries (orders, items, history) per shard however many
+        ids are asked for; missing ids are skipped.
+        """
+        return await self._find_many(order_ids, shard_names(self.session))
+
+    async def _find_many(self, order_ids, shards: List[Optional[str]]) -> List[Order]:
+        ids = list(dict.fromkeys(str(order_id) for order_id in order_ids))
+        missing = [order_id for order_id in ids if self.identity_map.get(Order, order_id) is None]
+        if missing:
+            dialect = self.session.get_bind().dialect.name
+            found = await scatter(self.session, ORDERS_BY_IDS[dialect], {shard: {"ids": missing} for shard in shards})
+            loaded, params = {}, {}
+            for shard, rows in zip(shards, found):
+                for row in rows:
+                    loaded[_by_id(row)] = _new_order(row)
+                    params.setdefault(shard, {"ids": []})["ids"].append(_by_id(row))
+            if loaded:
+                for rows in await scatter(self.session, ORDER_ITEMS_BY_ORDERS[dialect], params):
+                    for r in rows:
+                        order = loaded[str(r['order_id'])]
+                        order.items.append(_item(r, order.id))
+                for rows in await scatter(self.session, ORDER_HISTORY_BY_ORDERS[dialect], params):
+                    for r in rows:
+                        loaded[str(r['order_id'])].status_history.append(_change(r))
+            for order in loaded.values():
+                self.identity_map.add(order, _order_state(order))
+        found = (self.identity_map.get(Order, order_id) for order_id in ids)
+        return [order for order in found if order is not None]
+
+    @timed
+    async def find_by_user(
+        self,
+        user_id: uuid.UUID,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[uuid.UUID] = None,
+        limit: Optional[int] = None,
+    ) -> List[Order]:
+        """Find orders for a user, optionally within a creation date range.
+
+        Orders come sorted by id; pass the last id of a page as ``after``
+        to get the next ``limit`` orders.
+        """
+        conditions, params = _created_range(created_from, created_to)
+        page, page_params = _keyset(after, limit)
+        query = _select_order_ids(("user_id = :user_id", *conditions, *page), limit is not None)
+        shard = shard_of(self.session, user_id)
+        result = await self.session.execute(
+            query, {"user_id": str(user_id), **params, **page_params}, bind_arguments=on_shard(shard)
+        )
+        return await self._find_many([r['id'] for r in result.mappings().all()], [shard])
+
+    @timed
+    async def find_all(
+        self,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[uuid.UUID] = None,
+        limit: Optional[int] = None,
+    ) -> List[Order]:
+        """Find orders, optionally within a creation date range, paged like ``find_by_user``.
+
+        With shards, each shard returns its page and the pages are merged by id.
+        """
+        conditions, params = _created_range(created_from, created_to)
+        page, page_params = _keyset(after, limit)
+        query = _select_order_ids((*conditions, *page), limit is not None)
+        shards = shard_names(self.session)
+        found = await scatter(self.session, query, _everywhere(self.session, {**params, **page_params}))
+        rows = merge(
+            [[(shard, row) for row in rows] for shard, rows in zip(shards, found)],
+            key=lambda entry: _by_id(entry[1]),
+            limit=limit,
+        )
+        return await self._find_many(
+            [r['id'] for _, r in rows], list(dict.fromkeys(shard for shard, _ in rows))
+        )
+
+    @timed
+    async def find_summaries(
+        self,
+        user_id: Optional[uuid.UUID] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[uuid.UUID] = None,
+        limit: Optional[int] = None,
+        columns: Optional[Iterable[str]] = None,
+    ) -> List[OrderSummary]:
+        """Like ``find_by_user``/``find_all``, but one query for order rows only.
+
+        ``columns`` picks the ``ORDER_SUMMARY_COLUMNS`` to read (all by
+        default; ``id`` always); items and history are not loaded. Without
+        a user, every shard is queried and the pages merged by id.
+        """
+        wanted = set(ORDER_SUMMARY_COLUMNS if columns is None else columns) | {"id"}
+        columns = tuple(c for c in ORDER_SUMMARY_COLUMNS if c in wanted)
+        conditions, params = _created_range(created_from, created_to)
+        shards = shard_names(self.session)
+        if user_id is not None:
+            conditions.insert(0, "user_id = :user_id")
+            params["user_id"] = str(user_id)
+            shards = [shard_of(self.session, user_id)]
+        page, page_params = _keyset(after, limit)
+        query = _select_order_summaries(columns, (*conditions, *page), limit is not None)
+        found = await scatter(self.session, query, {shard: {**params, **page_params} for shard in shards})
+        return [_order_summary(row) for row in merge(found, key=_by_id, limit=limit)]
+
+    @timed
+    async def search_by_product(
+        self,
+        query: str,
+        after: Optional[uuid.UUID] = None,
+        limit: int = 50,
+    ) -> List[OrderSummary]:
+        """Find orders with an item whose product name contains ``query``.
+
+        Case-insensitive; sorted by id and paged like ``find_by_user``. Only
+        order rows are read, items and history are not loaded.
+        """
+        dialect = self.session.get_bind().dialect.name
+        params = {"pattern": _product_pattern(dialect, query), "limit": limit}
+        if after is not None:
+            params["after"] = str(after)
+        statement = _search_orders_by_product(dialect, after is not None)
+        found = await scatter(self.session, statement, _everywhere(self.session, params))
+        return [
+            OrderSummary(
+                id=r["id"],
+                user_id=r["user_id"],
+                status=OrderStatus(r["status_name"]),
+                total_amount=_to_decimal(r["total_amount"]),
+                created_at=r["created_at"],
+            )
+            for r in merge(found, key=_by_id, limit=limit)
+        ]
+
+    @timed
+    async def transition_many(
+        self,
+        order_ids: List[uuid.UUID],
+        expected: OrderStatus,
+        target: OrderStatus,
+    ) -> List[OrderSummary]:
+        """Move the given orders from ``expected`` to ``target`` in one statement.
+
+        Orders in any other status are left alone; the changed ones are
+        returned.
+        """
+        dialect = self.session.get_bind().dialect.name
+        ids = [str(order_id) for order_id in order_ids]
+        for order_id in ids:
+            self.identity_map.discard(Order, order_id)
+        found = await scatter(self.session, ORDERS_TRANSITION[dialect], _everywhere(self.session, {
+            "ids": ids, "expected": expected.value, "target": target.value,
+        }))
+        changed = [
+            OrderSummary(
+                id=r["id"],
+                user_id=r["user_id"],
+                status=target,
+                total_amount=_to_decimal(r["total_amount"]),
+                created_at=r["created_at"],
+            )
+            for rows in found
+            for r in rows
+        ]
+        mark_orders_changed(self.session, (order.id for order in changed))
+        return changed
+
+    @timed
+    async def find_statuses(self, order_ids: List[uuid.UUID]) -> Dict[str, OrderStatus]:
+        """Current status of each existing order, keyed by the id as a string."""
+        dialect = self.session.get_bind().dialect.name
+        params = _everywhere(self.session, {"ids": [str(order_id) for order_id in order_ids]})
+        found = await scatter(self.session, ORDER_STATUSES_BY_IDS[dialect], params)
+        return {_by_id(row): OrderStatus(row["name"]) for rows in found for row in rows}
+
+    @timed
+    async def find_ids_by_status(
+        self,
+        statuses: Iterable[OrderStatus],
+        created_before: Optional[datetime] = None,
+        limit: int = 1000,
+    ) -> List[uuid.UUID]:
+        """Find ids of orders in the given statuses, oldest first."""
+        params = {"statuses": [s.value for s in statuses], "limit": limit}
+        if created_before is not None:
+            params["created_before"] = created_before
+        query = _select_order_ids_by_status(created_before is not None)
+        found = await scatter(self.session, query, _everywhere(self.session, params))
+        return [row["id"] for row in merge(found, key=lambda row: row["created_at"], limit=limit)]
+
+    @timed
+    async def delete_many(self, order_ids: List[uuid.UUID]) -> None:
+        """Delete orders together with their items and status history."""
+        ids = [str(order_id) for order_id in order_ids]
+        for order_id in ids:
+            self.identity_map.discard(Order, order_id)
+        for query in ORDERS_DELETE:
+            await scatter(self.session, query, _everywhere(self.session, {"ids": ids}))
+        mark_orders_changed(self.session, ids)
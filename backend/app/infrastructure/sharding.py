@@ -0,0 +1,151 @@
+"""Horizontal sharding of users and orders by user id.
+
+Set ``DATABASE_SHARDS`` to ``name=url`` pairs separated by commas
+(``a=postgresql+asyncpg://db-a/app,b=postgresql+asyncpg://db-b/app``) to
+spread users and their orders over several databases. Each user id is
+placed on a consistent hash ring with ``SHARD_VIRTUAL_NODES`` points per
+shard, so adding a shard moves only about ``1/N`` of the users (to the new
+shard); shard names, not their order, decide placement, so keep them
+stable. A user's orders, items and history live on the user's shard.
+
+Repositories send statements keyed by a user id to its shard; lookups by
+order id and listings across users run on every shard at once and merge
+the rows (``scatter``). Outbox jobs go to the shard of the user whose
+change enqueued them, in the same transaction, and the job queue polls
+every shard. ``DATABASE_URL`` stays the default bind for statements
+without a shard. A transaction that writes to several shards commits
+them one after another, not atomically.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import heapq
+import itertools
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+DATABASE_SHARDS = os.getenv("DATABASE_SHARDS", "")
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "256"))
+
+
+def parse_shards(value: str) -> Dict[str, str]:
+    """``name=url,name=url`` to a dict of database URLs by shard name."""
+    shards = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, url = entry.partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"invalid shard {entry!r}, expected name=url")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def _point(value: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with ``vnodes`` points per shard."""
+
+    def __init__(self, shards: Iterable[str], vnodes: int = SHARD_VIRTUAL_NODES):
+        points = sorted((_point(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes))
+        if not points:
+            raise ValueError("a hash ring needs at least one shard")
+        self._points = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key) -> str:
+        """Shard owning ``key``: the first point clockwise from its hash."""
+        index = bisect.bisect(self._points, _point(str(key)))
+        return self._shards[index % len(self._shards)]
+
+
+class ShardRouter:
+    """Shard engines and the ring that assigns user ids to them."""
+
+    def __init__(self, engines: Dict[str, AsyncEngine], vnodes: int = SHARD_VIRTUAL_NODES):
+        self.engines = dict(engines)
+        self.ring = HashRing(self.engines, vnodes)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.engines)
+
+    def shard_for(self, user_id) -> str:
+        return self.ring.shard_for(str(user_id))
+
+
+class ShardedSession(Session):
+    """Session that runs a statement on the shard named in its bind arguments.
+
+    ``session.execute(statement, params, bind_arguments={"shard": name})``
+    goes to that shard's engine; statements without a shard use the
+    session's default bind. A transaction keeps one connection per shard.
+    """
+
+    shard_router: Optional[ShardRouter] = None
+
+    def get_bind(self, mapper=None, clause=None, shard=None, **kw):
+        if shard is not None and self.shard_router is not None:
+            return self.shard_router.engines[shard].sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def shard_router(session: AsyncSession) -> Optional[ShardRouter]:
+    """Router of ``session``, or None when the database is not sharded."""
+    return getattr(session.sync_session, "shard_router", None)
+
+
+def shard_of(session: AsyncSession, user_id) -> Optional[str]:
+    """Shard holding ``user_id``'s data (None when not sharded)."""
+    router = shard_router(session)
+    return None if router is None else router.shard_for(user_id)
+
+
+def shard_names(session: AsyncSession) -> List[Optional[str]]:
+    """Every shard of ``session`` (``[None]`` when not sharded)."""
+    router = shard_router(session)
+    return [None] if router is None else router.names
+
+
+def on_shard(shard: Optional[str]) -> Optional[dict]:
+    """``bind_arguments`` for a statement on ``shard``."""
+    return None if shard is None else {"shard": shard}
+
+
+async def scatter(session: AsyncSession, statement, params_by_shard: Dict[Optional[str], dict]) -> List[list]:
+    """Run ``statement`` on each shard of ``params_by_shard`` at once.
+
+    Returns the row mappings of each shard (empty for statements without
+    rows), in the order of the dict. Every shard runs on its own
+    connection of the session's transaction.
+    """
+    if list(params_by_shard) == [None]:
+        results = [await session.execute(statement, params_by_shard[None])]
+        return [_rows(result) for result in results]
+    connections = [
+        await session.connection(bind_arguments=on_shard(shard)) for shard in params_by_shard
+    ]
+    results = await asyncio.gather(*(
+        connection.execute(statement, params)
+        for connection, params in zip(connections, params_by_shard.values())
+    ))
+    return [_rows(result) for result in results]
+
+
+def _rows(result) -> list:
+    return result.mappings().all() if result.returns_rows else []
+
+
+def merge(rows_by_shard: List[list], key: Callable, limit: Optional[int] = None) -> list:
+    """Merge per-shard rows sorted by ``key`` into one list, keeping ``limit``.
+
+    With keyset paging every shard returns its first ``limit`` rows after
+    the cursor, so the first ``limit`` merged rows are the global page.
+    """
+    merged = heapq.merge(*rows_by_shard, key=key)
+    return list(merged if limit is None else itertools.islice(merged, limit))
@@ -0,0 +1,103 @@
+"""SQLite settings for single-node deployments.
+
+Point ``DATABASE_URL`` at a file (``sqlite+aiosqlite:////var/lib/marketplace/db.sqlite``)
+to run without Postgres. File databases get a connection pool and, on
+every new connection, pragmas suited to a web workload: WAL journaling so
+readers never block the writer, ``synchronous=NORMAL`` (durable at WAL
+checkpoints), a larger page cache and memory-mapped reads.
+
+SQLite allows one writer at a time. Instead of letting concurrent write
+transactions collide and spin on ``busy_timeout``, write transactions in
+this process queue for the database's ``write_slot`` (FIFO), while reads
+run concurrently on other connections. With shards every shard file has
+its own slot.
+"""
+
+import asyncio
+import contextlib
+import os
+import weakref
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app.infrastructure.sharding import on_shard, shard_names
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Negative values are KiB: 64 MB of page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Waits for locks held by other processes (e.g. the archive job)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SINGLE_WRITER = os.getenv("SQLITE_SINGLE_WRITER", "1") not in ("0", "false", "no")
+
+
+def is_sqlite_file(url: str) -> bool:
+    """Whether ``url`` is an on-disk SQLite database (not ``:memory:``)."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return False
+    return parsed.database not in (None, "", ":memory:") and parsed.query.get("mode") != "memory"
+
+
+def pragmas() -> list:
+    return [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def configure_engine(engine):
+    """Apply the pragmas to every new connection of a file-backed engine."""
+    database = make_url(str(engine.url)).database
+    Path(database).parent.mkdir(parents=True, exist_ok=True)
+    statements = pragmas()
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+_write_locks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def write_slot(session, shard: Optional[str] = None):
+    """Context held for the length of a write transaction on ``session``.
+
+    On SQLite, one holder per database (the default bind, or ``shard``'s)
+    at a time, in arrival order; on other databases it does nothing.
+    """
+    bind = session.get_bind(**(on_shard(shard) or {}))
+    if not SQLITE_SINGLE_WRITER or bind.dialect.name != "sqlite":
+        return contextlib.nullcontext()
+    lock = _write_locks.get(bind)
+    if lock is None:
+        lock = _write_locks[bind] = asyncio.Lock()
+    return lock
+
+
+@contextlib.asynccontextmanager
+async def write_slots(session):
+    """Write slots of every database ``session`` can write to.
+
+    For transactions that do not know their shards up front. Slots are
+    taken in a fixed order, so two holders cannot deadlock.
+    """
+    slots = {}
+    for shard in [None] + [shard for shard in shard_names(session) if shard is not None]:
+        # The default bind may also be one of the shards
+        slots.setdefault(session.get_bind(**(on_shard(shard) or {})), write_slot(session, shard))
+    async with contextlib.AsyncExitStack() as stack:
+        for slot in slots.values():
+            await stack.enter_async_context(slot)
+        yield
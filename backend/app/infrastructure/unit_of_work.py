@@ -0,0 +1,155 @@
+"""Unit of work: the transaction around one use case."""
+
+import contextlib
+import uuid
+from typing import Dict
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.domain.order import Order
+from app.infrastructure.db import SessionLocal, client_key, init_schema, replica_router
+from app.infrastructure.jobs import OutboxRepository, get_job_queue
+from app.infrastructure.order_cache import invalidate_orders
+from app.infrastructure.repositories import OrderRepository, UserRepository, identity_map
+from app.infrastructure.sqlite import write_slots
+
+
+class UnitOfWork:
+    """Repositories sharing one session, and the transaction around them.
+
+    Services wrap each use case in ``async with uow.transaction():``. Blocks
+    nest and only the outermost one ends the transaction, so a caller can
+    group several service calls by opening a block around them. Orders
+    changed inside are registered with ``add`` and saved once, right before
+    the commit, however many times they were modified. The repositories'
+    identity map hands the same instance to every lookup in the unit, so
+    no change is lost, and unchanged orders are not written at all.
+
+    A read-only unit never commits; on Postgres its transaction is started
+    ``READ ONLY`` (as part of BEGIN, without an extra round trip). On SQLite
+    a writing unit holds the database's write slot from its first
+    statement to the commit, so write transactions do not collide.
+
+    Background jobs enqueued through ``outbox`` commit or roll back with the
+    rest of the unit; the job queue is woken up after a commit, and cached
+    responses of the orders written are invalidated.
+    """
+
+    def __init__(self, session: AsyncSession, read_only: bool = False, session_factory=None):
+        self.session = session
+        self.read_only = read_only
+        # Factory of ``session``, for work forked off this unit (see ``fork``)
+        self.session_factory = session_factory
+        self.users = UserRepository(session)
+        self.orders = OrderRepository(session)
+        self.outbox = OutboxRepository(session)
+        self.committed = False
+        self._depth = 0
+        self._pending: Dict[uuid.UUID, Order] = {}
+
+    def add(self, order: Order):
+        """Save ``order`` when the transaction commits."""
+        if self.read_only:
+            raise RuntimeError("cannot write in a read-only unit of work")
+        self._pending[order.id] = order
+        self.orders.track(order)
+
+    async def flush(self):
+        """Write registered orders now, inside the open transaction."""
+        pending, self._pending = list(self._pending.values()), {}
+        for order in pending:
+            await self.orders.save(order)
+
+    @property
+    def stale_reads_ok(self) -> bool:
+        """Whether this unit reads from the replica, i.e. may see slightly old data.
+
+        False without a configured (and healthy) replica: the primary is
+        read, so results must not be served from per-process caches.
+        """
+        return self.read_only and getattr(self.session.sync_session, "reads_replica", False)
+
+    @contextlib.asynccontextmanager
+    async def fork(self):
+        """Read-only unit of work on a new session, routed like this one.
+
+        For reads shared with other requests, which must not depend on this
+        unit's session staying open.
+        """
+        async with self.session_factory() as session:
+            session.info["use_replica"] = self.session.info.get("use_replica", False)
+            yield UnitOfWork(session, read_only=True, session_factory=self.session_factory)
+
+    async def _begin_read_only(self):
+        bind = self.session.sync_session.get_bind()
+        if bind.dialect.name == "postgresql":
+            await self.session.connection(execution_options={"postgresql_readonly": True})
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        if self._depth > 0 or self.read_only:
+            async with self._transaction():
+                yield self
+            return
+        async with write_slots(self.session):
+            async with self._transaction():
+                yield self
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self):
+        if self._depth == 0 and self.read_only:
+            await self._begin_read_only()
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                await self._rollback()
+            raise
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if self.read_only:
+            # Nothing to persist: end the read transaction without a commit
+            await self.session.rollback()
+            return
+        try:
+            await self.flush()
+            await self.session.commit()
+        except BaseException:
+            await self._rollback()
+            raise
+        self.committed = True
+        invalidate_orders(self.session.info.pop("changed_orders", ()))
+        if self.session.info.pop("outbox_enqueued", False):
+            get_job_queue().notify()
+
+    async def _rollback(self):
+        # Loaded aggregates may hold changes that were never persisted
+        self._pending.clear()
+        self.session.info.pop("outbox_enqueued", None)
+        self.session.info.pop("changed_orders", None)
+        identity_map(self.session).clear()
+        await self.session.rollback()
+
+
+async def get_uow(request: Request = None):
+    """Dependency for a unit of work on the primary."""
+    await init_schema()
+
+    async with SessionLocal() as session:
+        uow = UnitOfWork(session)
+        yield uow
+    if uow.committed:
+        replica_router.mark_write(client_key(request))
+
+
+async def get_read_uow(request: Request = None):
+    """Dependency for a read-only unit of work, served by the replica when possible."""
+    await init_schema()
+
+    async with SessionLocal() as session:
+        session.info["use_replica"] = replica_router.use_replica(client_key(request))
+        yield UnitOfWork(session, read_only=True, session_factory=SessionLocal)
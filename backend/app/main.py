@@ -1,14 +1,95 @@
 """Main FastAPI application."""
 
-from fastapi import FastAPI
+import asyncio
+import contextlib
+import logging
+import os
+from datetime import timedelta
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.middleware import (
+    ADMISSION_CONTROL_ENABLED,
+    QUERY_STATS_ENABLED,
+    AdmissionControlMiddleware,
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+    RateLimitMiddleware,
+)
 from app.api.routes import router
+from app.application.order_events import register_handlers
+from app.infrastructure import metrics
+from app.infrastructure.db import SessionLocal, engine, init_schema, replica_engine
+from app.infrastructure.expiry import ORDER_EXPIRY_INTERVAL, ORDER_EXPIRY_SECONDS, expire_orders
+from app.infrastructure.health import readiness
+from app.infrastructure.jobs import JOBS_ENABLED, get_job_queue
+from app.infrastructure.partitions import ensure_future_partitions
+from app.infrastructure.ratelimit import RATE_LIMIT_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions are created this many months in advance (Postgres only)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", str(24 * 3600)))
+
+
+async def _maintain_partitions():
+    """Keep future monthly partitions in place while the app is running."""
+    while True:
+        try:
+            if not await ensure_future_partitions(engine, PARTITION_MONTHS_AHEAD):
+                return
+        except Exception:
+            logger.exception("Failed to create future partitions")
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+
+
+async def _expire_orders():
+    """Cancel unpaid orders past their TTL while the app is running."""
+    while True:
+        try:
+            await expire_orders(SessionLocal, timedelta(seconds=ORDER_EXPIRY_SECONDS))
+        except Exception:
+            logger.exception("Failed to expire unpaid orders")
+        await asyncio.sleep(ORDER_EXPIRY_INTERVAL)
+
+
+async def _flush_metrics():
+    """Publish this worker's metrics for multi-process aggregation."""
+    while True:
+        await asyncio.sleep(metrics.METRICS_FLUSH_INTERVAL)
+        try:
+            metrics.REGISTRY.write_snapshot()
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_schema()
+    tasks = [asyncio.create_task(_maintain_partitions())]
+    if metrics.REGISTRY.directory is not None:
+        tasks.append(asyncio.create_task(_flush_metrics()))
+    if ORDER_EXPIRY_SECONDS > 0:
+        tasks.append(asyncio.create_task(_expire_orders()))
+    if JOBS_ENABLED:
+        queue = get_job_queue()
+        register_handlers(queue)
+        tasks.append(asyncio.create_task(queue.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    metrics.REGISTRY.write_snapshot(final=True)
+
 
 app = FastAPI(
     title="Marketplace API",
     description="DDD-based marketplace API for lab work",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS for frontend
@@ -20,11 +101,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+if ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+# Outside admission control: rejecting a client over its limit must not cost a slot
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Include routes
 app.include_router(router, prefix="/api")
 
 
 @app.get("/health")
+@app.get("/health/live")
 async def health():
-    """Health check endpoint."""
+    """Liveness check: the process is up and serving requests."""
     return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready(response: Response):
+    """Readiness check: database reachable and pool not saturated."""
+    ready, report = await readiness(engine, replica_engine)
+    if not ready:
+        response.status_code = 503
+    return report
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus metrics, aggregated over all workers when METRICS_DIR is set."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
@@ -8,10 +8,17 @@ if "DATABASE_URL" not in os.environ:
 import asyncio
 import pytest
 import uuid
+from datetime import datetime
+from decimal import Decimal
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy import text
 
-from app.infrastructure.db import get_db
+from app.domain.order import Order, OrderStatus
+from app.domain.user import User
+from app.infrastructure.db import init_schema
+from app.infrastructure import instrumentation
+from app.infrastructure.migrations import apply_migrations
+from app.infrastructure.repositories import OrderRepository, UserRepository
 
 
 @pytest.fixture(scope="session")
@@ -92,4 +99,54 @@ async def db_session(test_session_factory):
 @pytest.fixture
 def sample_user_id():
     """Create a sample user ID."""
-    return uuid.uuid4()
\ No newline at end of file
+    return uuid.uuid4()
+
+
+@pytest.fixture
+async def assert_max_queries():
+    """Context manager asserting an upper bound on SQL statements in a block.
+
+    The schema is migrated first so one-off migration statements are not
+    counted against the block.
+    """
+    await init_schema()
+    return instrumentation.assert_max_queries
+
+
+@pytest.fixture
+async def session_factory(tmp_path):
+    """Session factory over a fresh, migrated SQLite file with statement counting."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    instrumentation.instrument_engine(engine)
+    await apply_migrations(engine)
+    yield async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
+
+
+@pytest.fixture
+def make_user(session_factory):
+    """Create and commit a user with a unique email."""
+    async def make_user():
+        async with session_factory() as session:
+            user = User(email=f"{uuid.uuid4().hex}@example.com")
+            await UserRepository(session).create(user)
+            await session.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_order(session_factory, make_user):
+    """Create and commit an order with one item for ``user`` (a new user by default)."""
+    async def make_order(status=OrderStatus.CREATED, created_at=None, user=None):
+        user = user or await make_user()
+        order = Order(user_id=user.id, created_at=created_at or datetime.now())
+        order.add_item("Widget", Decimal("2.50"), 2)
+        order.status = status
+        async with session_factory() as session:
+            await OrderRepository(session).save(order)
+            await session.commit()
+        return order
+
+    return make_order
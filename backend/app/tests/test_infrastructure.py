@@ -0,0 +1,1222 @@
+"""
+Tests for infrastructure components (routing, storage, instrumentation).
+
+To run: pytest app/tests/test_infrastructure.py -v
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.application.order_events import ORDER_PAID
+from app.application.order_service import OrderService
+from app.domain.exceptions import OrderAlreadyPaidError, OrderCancelledError, OrderConflictError, OrderNotFoundError
+from app.domain.ids import uuid7, uuid7_time
+from app.domain.order import Order, OrderStatus
+from app.domain.user import User
+from app.infrastructure import expiry, health, jobs, metrics, ratelimit, sqlite
+from app.infrastructure.archive import OrderArchive, archive_orders
+from app.infrastructure.coalescing import SingleFlight
+from app.infrastructure.order_cache import OrderCache
+from app.infrastructure.instrumentation import (
+    QueryStats,
+    assert_max_queries,
+    instrument_engine,
+    parse_server_timing,
+    server_timing,
+    track_queries,
+)
+from app.infrastructure.jobs import JobQueue, OutboxRepository
+from app.infrastructure.migrations import apply_migrations, discover, split_statements
+from app.infrastructure.partitions import detach_partitions_before, ensure_future_partitions, partition_month
+from app.infrastructure.replicas import ReplicaRouter, RoutingSession
+from app.infrastructure.sharding import HashRing, ShardedSession, ShardRouter, parse_shards
+from app.infrastructure.repositories import OrderRepository, UserRepository
+from app.infrastructure.unit_of_work import UnitOfWork
+
+
+# Optional scratch Postgres database for the Postgres-only tests
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIdentifiers:
+    """Tests for time-ordered UUIDv7 ids."""
+
+    def test_version_and_timestamp(self):
+        before = datetime.now().timestamp()
+        value = uuid7()
+        assert value.version == 7
+        assert value.variant == uuid.RFC_4122
+        assert before - 0.001 <= uuid7_time(value) <= datetime.now().timestamp() + 1
+
+    def test_ids_increase_within_a_millisecond(self):
+        ids = [uuid7() for _ in range(10_000)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        # SQLite stores ids as text: string order must agree
+        assert [str(i) for i in ids] == sorted(str(i) for i in ids)
+
+    def test_ids_increase_when_clock_steps_back(self, monkeypatch):
+        first = uuid7()
+        monkeypatch.setattr("app.domain.ids.time.time_ns", lambda: 0)
+        assert uuid7() > first
+
+    def test_domain_factories_use_uuid7(self):
+        order = Order(user_id=uuid7())
+        item = order.add_item("Widget", Decimal("1.00"), 1)
+        assert User(email="ids@example.com").id.version == 7
+        assert order.id.version == item.id.version == 7
+
+
+class TestReplicaRouter:
+    """Tests for read replica routing decisions."""
+
+    def test_reads_use_replica_by_default(self):
+        router = ReplicaRouter(clock=FakeClock())
+        assert router.use_replica("10.0.0.1")
+
+    def test_client_sticks_to_primary_after_write(self):
+        clock = FakeClock()
+        router = ReplicaRouter(sticky_seconds=2, clock=clock)
+        router.mark_write("10.0.0.1")
+        assert not router.use_replica("10.0.0.1")
+        assert router.use_replica("10.0.0.2")
+        clock.now += 2.5
+        assert router.use_replica("10.0.0.1")
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        clock = FakeClock()
+        router = ReplicaRouter(retry_seconds=30, clock=clock)
+        router.mark_unhealthy()
+        assert not router.use_replica("10.0.0.1")
+        clock.now += 31
+        assert router.use_replica("10.0.0.1")
+
+    @pytest.mark.asyncio
+    async def test_routing_session_picks_bind(self, tmp_path):
+        primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+        replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+        for eng, name in ((primary, "primary"), (replica, "replica")):
+            async with eng.begin() as conn:
+                await conn.execute(text("CREATE TABLE origin (name TEXT)"))
+                await conn.execute(text("INSERT INTO origin VALUES (:name)"), {"name": name})
+
+        router = ReplicaRouter(clock=FakeClock())
+
+        class Session(RoutingSession):
+            replica_bind = replica.sync_engine
+
+        Session.router = router
+        factory = async_sessionmaker(primary, class_=AsyncSession, sync_session_class=Session)
+
+        async def origin(use_replica):
+            async with factory() as session:
+                session.info["use_replica"] = use_replica
+                return (await session.execute(text("SELECT name FROM origin"))).scalar()
+
+        try:
+            assert await origin(True) == "replica"
+            assert await origin(False) == "primary"
+            router.mark_unhealthy()
+            assert await origin(True) == "primary"
+        finally:
+            await primary.dispose()
+            await replica.dispose()
+
+    @pytest.mark.asyncio
+    async def test_stale_reads_only_when_the_replica_is_read(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+        router = ReplicaRouter(clock=FakeClock())
+
+        class WithReplica(RoutingSession):
+            replica_bind = engine.sync_engine
+
+        WithReplica.router = router
+
+        async def stale_ok(session_class):
+            factory = async_sessionmaker(engine, class_=AsyncSession, sync_session_class=session_class)
+            async with factory() as session:
+                # What get_read_uow sets for a client that has not written recently
+                session.info["use_replica"] = router.use_replica("10.0.0.1")
+                return UnitOfWork(session, read_only=True).stale_reads_ok
+
+        try:
+            assert await stale_ok(WithReplica)
+            # No replica configured: reads hit the primary and must not be cached
+            assert not await stale_ok(RoutingSession)
+            router.mark_unhealthy()
+            assert not await stale_ok(WithReplica)
+        finally:
+            await engine.dispose()
+
+
+class TestMigrations:
+    """Tests for the migrations runner and the hot-query indexes."""
+
+    HOT_QUERIES = {
+        "orders": "SELECT id FROM orders WHERE user_id = :id",
+        "order_items": "SELECT id, product_name, price, quantity FROM order_items WHERE order_id = :id AND created_at = :id",
+        "order_status_history": """
+            SELECT h.id, s.name, h.changed_at
+            FROM order_status_history h
+            JOIN order_statuses s ON h.status_id = s.id
+            WHERE h.order_id = :id ORDER BY h.changed_at
+        """,
+    }
+
+    @pytest.fixture
+    async def engine(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'schema.db'}")
+        yield engine
+        await engine.dispose()
+
+    def test_split_statements_keeps_function_and_trigger_bodies(self):
+        sql = """
+            -- comment; with semicolon
+            CREATE TABLE t (note TEXT DEFAULT 'a;b');
+            CREATE FUNCTION f() RETURNS TRIGGER AS $$ BEGIN RETURN NEW; END; $$ LANGUAGE plpgsql;
+            CREATE TRIGGER trg AFTER INSERT ON t BEGIN SELECT 1; SELECT 2; END;
+        """
+        statements = split_statements(sql)
+        assert len(statements) == 3
+        assert statements[0].endswith("'a;b')")
+        assert statements[2].endswith("END")
+
+    @pytest.mark.asyncio
+    async def test_migrations_are_applied_once(self, engine):
+        applied = await apply_migrations(engine)
+        assert [m.version for m in applied] == [m.version for m in discover("sqlite")]
+        assert await apply_migrations(engine) == []
+
+    @pytest.mark.asyncio
+    async def test_hot_queries_use_indexes(self, engine):
+        await apply_migrations(engine)
+        async with engine.connect() as conn:
+            for table, query in self.HOT_QUERIES.items():
+                plan = await conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), {"id": "x"})
+                details = [row[-1] for row in plan]
+                assert any(
+                    "USING INDEX" in d or "USING COVERING INDEX" in d for d in details
+                ), (table, details)
+                assert not any(d.startswith("SCAN") for d in details), (table, details)
+            plan = await conn.execute(
+                text("EXPLAIN QUERY PLAN SELECT id FROM orders WHERE created_at >= :since"),
+                {"since": "2024-01-01"},
+            )
+            assert any("idx_orders_created_at" in row[-1] for row in plan)
+
+
+class TestPartitions:
+    """Tests for partition maintenance helpers."""
+
+    def test_partition_month_parses_names(self):
+        assert partition_month("order_items_p2024_03") == date(2024, 3, 1)
+        assert partition_month("orders_default") is None
+
+    @pytest.mark.asyncio
+    async def test_maintenance_is_noop_on_sqlite(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'plain.db'}")
+        try:
+            assert not await ensure_future_partitions(engine)
+            assert await detach_partitions_before(engine, date(2024, 1, 1)) == []
+        finally:
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(not TEST_POSTGRES_URL, reason="set TEST_POSTGRES_URL to a scratch Postgres database")
+    async def test_detach_to_archive_with_items_on_postgres(self):
+        engine = create_async_engine(TEST_POSTGRES_URL)
+        try:
+            await apply_migrations(engine)
+            month = date(2001, 1, 1)
+            async with engine.begin() as conn:
+                for parent in ("orders", "order_items"):
+                    await conn.execute(text("SELECT create_monthly_partition(:parent, :month)"), {
+                        "parent": parent, "month": month,
+                    })
+            async with async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)() as session:
+                user = User(email=f"{uuid.uuid4().hex}@example.com")
+                await UserRepository(session).create(user)
+                order = Order(user_id=user.id, created_at=datetime(2001, 1, 15))
+                order.add_item("Lamp", Decimal("10"), 1)
+                await OrderRepository(session).save(order)
+                await session.commit()
+
+            detached = await detach_partitions_before(engine, date(2001, 2, 1))
+            assert {"orders_p2001_01", "order_items_p2001_01"} <= set(detached)
+            async with engine.connect() as conn:
+                count = await conn.execute(text('SELECT count(*) FROM "archive".order_items_p2001_01'))
+                assert count.scalar() == 1
+        finally:
+            async with engine.begin() as conn:
+                for name in ("order_items_p2001_01", "orders_p2001_01"):
+                    await conn.execute(text(f'DROP TABLE IF EXISTS "archive"."{name}"'))
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(not TEST_POSTGRES_URL, reason="set TEST_POSTGRES_URL to a scratch Postgres database")
+    async def test_ensure_moves_rows_out_of_default_on_postgres(self):
+        engine = create_async_engine(TEST_POSTGRES_URL)
+        order = None
+        try:
+            await apply_migrations(engine)
+            async with engine.begin() as conn:
+                result = await conn.execute(
+                    text("SELECT CAST(date_trunc('month', NOW()) + interval '3 months' AS date)")
+                )
+                month = result.scalar()
+                for parent in ("order_items", "order_status_history", "orders"):
+                    name = f"{parent}_p{month:%Y_%m}"
+                    exists = await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+                    if exists.scalar():
+                        await conn.execute(text(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}"'))
+                        await conn.execute(text(f'DROP TABLE "{name}"'))
+            async with async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)() as session:
+                user = User(email=f"{uuid.uuid4().hex}@example.com")
+                await UserRepository(session).create(user)
+                order = Order(user_id=user.id, created_at=datetime(month.year, month.month, 15))
+                order.add_item("Lamp", Decimal("10"), 1)
+                await OrderRepository(session).save(order)
+                await session.commit()
+
+            assert await ensure_future_partitions(engine, months_ahead=3)
+            async with engine.connect() as conn:
+                for parent in ("orders", "order_items"):
+                    moved = await conn.execute(text(f'SELECT count(*) FROM "{parent}_p{month:%Y_%m}"'))
+                    assert moved.scalar() == 1
+                    left = await conn.execute(text(f'SELECT count(*) FROM "{parent}_default"'))
+                    assert left.scalar() == 0
+                history = await conn.execute(
+                    text("SELECT count(*) FROM order_status_history WHERE order_id = :id"), {"id": order.id}
+                )
+                assert history.scalar() == 1
+        finally:
+            if order is not None:
+                async with engine.begin() as conn:
+                    await conn.execute(text("DELETE FROM order_status_history WHERE order_id = :id"), {"id": order.id})
+                    await conn.execute(text("DELETE FROM orders WHERE id = :id"), {"id": order.id})
+            await engine.dispose()
+
+
+class TestOrderArchive:
+    """Tests for archiving terminal orders to cold storage."""
+
+    @pytest.mark.asyncio
+    async def test_segment_round_trip(self, tmp_path):
+        order = Order(user_id=uuid.uuid4())
+        order.add_item("Widget", Decimal("2.50"), 2)
+        order.cancel()
+        archive = OrderArchive(tmp_path)
+        archive.write_segment([order])
+
+        restored = await OrderArchive(tmp_path).get(order.id)
+        assert restored.status == OrderStatus.CANCELLED
+        assert restored.total_amount == Decimal("5.00")
+        assert [i.product_name for i in restored.items] == ["Widget"]
+        assert await archive.get(uuid.uuid4()) is None
+
+    @pytest.mark.asyncio
+    async def test_misses_rescan_the_directory_at_most_once_per_interval(self, tmp_path, monkeypatch):
+        now = [0.0]
+        reader = OrderArchive(tmp_path, rescan_interval=30, clock=lambda: now[0])
+        scans = []
+        refresh = reader._refresh
+        monkeypatch.setattr(reader, "_refresh", lambda: scans.append(now[0]) or refresh())
+
+        for _ in range(5):
+            assert await reader.get(uuid.uuid4()) is None
+        assert scans == [0.0]
+
+        order = Order(user_id=uuid.uuid4())
+        order.add_item("Widget", Decimal("1"), 1)
+        order.cancel()
+        OrderArchive(tmp_path).write_segment([order])
+        assert await reader.get(order.id) is None
+        now[0] = 30.0
+        assert (await reader.get(order.id)).id == order.id
+        assert scans == [0.0, 30.0]
+
+    @pytest.mark.asyncio
+    async def test_archive_job_moves_old_terminal_orders(self, session_factory, make_order, tmp_path):
+        old = datetime(2020, 1, 1)
+        completed = await make_order(OrderStatus.COMPLETED, old)
+        paid = await make_order(OrderStatus.PAID, old)
+        recent = await make_order(OrderStatus.CANCELLED, datetime.now())
+
+        archive = OrderArchive(tmp_path / "segments")
+        count = await archive_orders(session_factory, archive, timedelta(days=30))
+        assert count == 1
+
+        async with session_factory() as session:
+            service = OrderService(UnitOfWork(session), archive)
+            assert await OrderRepository(session).find_by_id(completed.id) is None
+            restored = await service.get_order(completed.id)
+            assert restored.status == OrderStatus.COMPLETED
+            assert restored.items[0].quantity == 2
+            assert (await service.get_order(paid.id)).status == OrderStatus.PAID
+            assert (await service.get_order(recent.id)).status == OrderStatus.CANCELLED
+            with pytest.raises(OrderNotFoundError):
+                await service.cancel_order(completed.id)
+
+
+class TestOrderExpiry:
+    """Tests for cancelling abandoned unpaid orders."""
+
+    @pytest.mark.asyncio
+    async def test_expires_only_old_unpaid_orders_in_batches(self, session_factory, make_user):
+        now = datetime(2024, 6, 1, 12, 0)
+        user = await make_user()
+        async with session_factory() as session:
+            repository = OrderRepository(session)
+            stale = [Order(user_id=user.id, created_at=now - timedelta(hours=30 + n)) for n in range(5)]
+            fresh = Order(user_id=user.id, created_at=now - timedelta(hours=1))
+            paid = Order(user_id=user.id, created_at=now - timedelta(hours=30))
+            paid.pay()
+            for order in stale + [fresh, paid]:
+                await repository.save(order)
+            await session.commit()
+
+        def batches():
+            return sum(expiry.EXPIRY_BATCH_SIZE.series.get((), [0, 0])[:-1])
+
+        before = batches()
+        expired = await expiry.expire_orders(session_factory, timedelta(hours=24), batch_size=2, now=now)
+        assert expired == 5
+        assert batches() - before == 3  # 2 + 2 + 1
+
+        async with session_factory() as session:
+            repository = OrderRepository(session)
+            for order in stale:
+                found = await repository.find_by_id(order.id)
+                assert found.status == OrderStatus.CANCELLED
+                assert [h.status for h in found.status_history] == [OrderStatus.CREATED, OrderStatus.CANCELLED]
+            assert (await repository.find_by_id(fresh.id)).status == OrderStatus.CREATED
+            assert (await repository.find_by_id(paid.id)).status == OrderStatus.PAID
+
+        assert await expiry.expire_orders(session_factory, timedelta(hours=24), now=now) == 0
+
+    @pytest.mark.asyncio
+    async def test_payment_loaded_before_a_sweep_does_not_revive_the_order(self, session_factory, make_order):
+        now = datetime.now()
+        order = await make_order(created_at=now - timedelta(hours=30))
+
+        async with session_factory() as session:
+            service = OrderService(UnitOfWork(session))
+            repository = OrderRepository(session)
+            loaded = await repository.find_by_id(order.id)
+            # The sweep commits between the payment's read and its write
+            assert await expiry.expire_orders(session_factory, timedelta(hours=24), now=now) == 1
+            loaded.pay()
+            with pytest.raises(OrderConflictError):
+                await repository.save(loaded)
+            await session.rollback()
+            with pytest.raises(OrderCancelledError):
+                await service.pay_order(order.id)
+
+        async with session_factory() as session:
+            assert (await OrderRepository(session).find_by_id(order.id)).status == OrderStatus.CANCELLED
+
+
+class TestSqliteFile:
+    """Tests for file-backed SQLite engines (pragmas, single writer)."""
+
+    @pytest.fixture
+    async def engine(self, tmp_path):
+        url = f"sqlite+aiosqlite:///{tmp_path / 'data' / 'app.db'}"
+        engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=5)
+        sqlite.configure_engine(engine)
+        await apply_migrations(engine)
+        yield engine
+        await engine.dispose()
+
+    def test_detects_file_databases(self):
+        assert sqlite.is_sqlite_file("sqlite+aiosqlite:////var/lib/app.db")
+        assert not sqlite.is_sqlite_file("sqlite+aiosqlite:///:memory:")
+        assert not sqlite.is_sqlite_file("sqlite+aiosqlite:///file:test?mode=memory&cache=shared&uri=true")
+        assert not sqlite.is_sqlite_file("postgresql+asyncpg://localhost/app")
+
+    @pytest.mark.asyncio
+    async def test_pragmas_applied_on_connect(self, engine):
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            assert (await conn.execute(text("PRAGMA cache_size"))).scalar() == sqlite.SQLITE_CACHE_SIZE
+
+    @pytest.mark.asyncio
+    async def test_concurrent_write_units_are_serialized(self, engine):
+        factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        async with factory() as session:
+            user = User(email="writer@example.com")
+            await UserRepository(session).create(user)
+            await session.commit()
+
+        writers = []
+
+        async def place_order():
+            async with factory() as session:
+                uow = UnitOfWork(session)
+                async with uow.transaction():
+                    writers.append(session)
+                    assert await uow.users.find_by_id(user.id) is not None
+                    await asyncio.sleep(0)
+                    assert writers == [session]
+                    order = Order(user_id=user.id)
+                    order.add_item("Lamp", Decimal("10"), 1)
+                    uow.add(order)
+                    writers.remove(session)
+
+        await asyncio.gather(*(place_order() for _ in range(20)))
+
+        async with factory() as session:
+            assert len(await OrderRepository(session).find_by_user(user.id)) == 20
+
+    @pytest.mark.asyncio
+    async def test_reads_do_not_wait_for_the_writer(self, engine):
+        factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        async with factory() as writer:
+            async with sqlite.write_slot(writer):
+                async with factory() as reader:
+                    uow = UnitOfWork(reader, read_only=True)
+                    async with uow.transaction():
+                        assert await uow.users.find_by_email("nobody@example.com") is None
+
+
+class TestSharding:
+    """Tests for the shard ring and repositories over several SQLite files."""
+
+    def test_parse_shards(self):
+        assert parse_shards("a=sqlite:///a.db, b=postgresql://h/db?x=1") == {
+            "a": "sqlite:///a.db", "b": "postgresql://h/db?x=1",
+        }
+        assert parse_shards("") == {}
+        with pytest.raises(ValueError):
+            parse_shards("sqlite:///a.db")
+
+    def test_ring_spreads_keys_and_moves_few_on_growth(self):
+        keys = [str(uuid.UUID(int=n * 7919)) for n in range(6000)]
+        ring = HashRing(["a", "b", "c"], vnodes=256)
+        placement = {key: ring.shard_for(key) for key in keys}
+        for shard in "abc":
+            assert 0.25 < list(placement.values()).count(shard) / len(keys) < 0.42
+
+        grown = HashRing(["a", "b", "c", "d"], vnodes=256)
+        moved = [key for key in keys if grown.shard_for(key) != placement[key]]
+        assert all(grown.shard_for(key) == "d" for key in moved)
+        assert 0.15 < len(moved) / len(keys) < 0.35
+        # Placement depends on names, not on the order shards are listed in
+        reordered = HashRing(["c", "a", "b"], vnodes=256)
+        assert all(reordered.shard_for(key) == placement[key] for key in keys)
+
+    @pytest.fixture
+    async def sharded(self, tmp_path):
+        engines = {
+            name: create_async_engine(f"sqlite+aiosqlite:///{tmp_path / f'shard-{name}.db'}")
+            for name in ("a", "b", "c")
+        }
+        for engine in engines.values():
+            await apply_migrations(engine)
+        router = ShardRouter(engines, vnodes=64)
+
+        class Session(ShardedSession):
+            shard_router = router
+
+        factory = async_sessionmaker(
+            engines["a"], expire_on_commit=False, class_=AsyncSession, sync_session_class=Session
+        )
+        yield factory, router
+        for engine in engines.values():
+            await engine.dispose()
+
+    async def _populate(self, factory, users=9, orders_per_user=3):
+        created = []
+        async with factory() as session:
+            uow = UnitOfWork(session)
+            async with uow.transaction():
+                for n in range(users):
+                    user = User(email=f"shard{n}@example.com")
+                    assert await uow.users.create(user)
+                    for _ in range(orders_per_user):
+                        order = Order(user_id=user.id)
+                        order.add_item(f"Lamp {n}", Decimal("10"), 1)
+                        uow.add(order)
+                        created.append(order)
+        return created
+
+    @pytest.mark.asyncio
+    async def test_keyed_operations_stay_on_the_users_shard(self, sharded):
+        factory, router = sharded
+        orders = await self._populate(factory)
+
+        for name, engine in router.engines.items():
+            async with engine.connect() as conn:
+                rows = (await conn.execute(text("SELECT id, user_id FROM orders"))).all()
+                users = {row[0] for row in await conn.execute(text("SELECT id FROM users"))}
+            assert all(router.shard_for(row.user_id) == name and row.user_id in users for row in rows)
+        assert len({router.shard_for(o.user_id) for o in orders}) > 1
+
+        async with factory() as session:
+            users, orders_repo = UserRepository(session), OrderRepository(session)
+            order = orders[-1]
+            assert (await users.find_by_id(order.user_id)).email.startswith("shard")
+            assert [str(o.id) for o in await orders_repo.find_by_user(order.user_id)] == sorted(
+                str(o.id) for o in orders if o.user_id == order.user_id
+            )
+            found = await orders_repo.find_by_id(order.id)
+            assert found.items[0].product_name == order.items[0].product_name
+            assert found.status_history[0].status == OrderStatus.CREATED
+            assert await users.find_by_email("shard4@example.com") is not None
+            assert len(await users.find_all()) == 9
+            assert not await users.create(User(email="shard4@example.com"))
+
+    @pytest.mark.asyncio
+    async def test_listings_merge_keyset_pages_across_shards(self, sharded):
+        factory, _ = sharded
+        orders = await self._populate(factory)
+        expected = sorted(str(o.id) for o in orders)
+
+        async with factory() as session:
+            repository = OrderRepository(session)
+            pages, after = [], None
+            while True:
+                page = await repository.find_summaries(after=after, limit=4)
+                pages.append([str(s.id) for s in page])
+                if len(page) < 4:
+                    break
+                after = page[-1].id
+            assert [order_id for page in pages for order_id in page] == expected
+            assert [str(o.id) for o in await repository.find_all(limit=5)] == expected[:5]
+            assert len(await repository.search_by_product("Lamp")) == len(orders)
+
+            many = await repository.find_many([o.id for o in reversed(orders)])
+            assert [str(o.id) for o in many] == [str(o.id) for o in reversed(orders)]
+            assert all(len(o.items) == 1 for o in many)
+
+    @pytest.mark.asyncio
+    async def test_bulk_changes_reach_every_shard(self, sharded):
+        factory, _ = sharded
+        orders = await self._populate(factory)
+        ids = [o.id for o in orders]
+
+        async with factory() as session:
+            repository = OrderRepository(session)
+            changed = await repository.transition_many(ids, OrderStatus.CREATED, OrderStatus.CANCELLED)
+            await session.commit()
+        assert len(changed) == len(orders)
+
+        async with factory() as session:
+            repository = OrderRepository(session)
+            statuses = await repository.find_statuses(ids)
+            assert set(statuses.values()) == {OrderStatus.CANCELLED}
+            assert len(await repository.find_ids_by_status([OrderStatus.CANCELLED], limit=100)) == len(orders)
+            await repository.delete_many(ids)
+            await session.commit()
+            assert await repository.find_statuses(ids) == {}
+
+    @pytest.mark.asyncio
+    async def test_outbox_jobs_commit_on_the_orders_shard(self, sharded):
+        factory, router = sharded
+        orders = await self._populate(factory, users=6, orders_per_user=1)
+        for order in orders:
+            async with factory() as session:
+                await OrderService(UnitOfWork(session)).pay_order(order.id)
+
+        for name, engine in router.engines.items():
+            async with engine.connect() as conn:
+                payloads = (await conn.execute(text("SELECT payload FROM outbox"))).scalars().all()
+            owners = {json.loads(payload)["user_id"] for payload in payloads}
+            assert owners == {str(o.user_id) for o in orders if router.shard_for(o.user_id) == name}
+
+        queue = JobQueue(factory)
+        seen = []
+
+        @queue.register(ORDER_PAID)
+        async def on_paid(payload):
+            seen.append(payload["order_id"])
+
+        while await queue.run_pending():
+            pass
+        assert sorted(seen) == sorted(str(o.id) for o in orders)
+        for engine in router.engines.values():
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT COUNT(*) FROM outbox"))).scalar() == 0
+
+
+class TestQueryInstrumentation:
+    """Tests for per-scope SQL statement counting."""
+
+    @pytest.mark.asyncio
+    async def test_nested_scopes_and_repeats(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+        instrument_engine(engine)
+        try:
+            async with engine.connect() as conn:
+                with track_queries() as outer:
+                    await conn.execute(text("SELECT 1"))
+                    with track_queries() as inner:
+                        for _ in range(3):
+                            await conn.execute(text("SELECT 2"))
+            assert (outer.count, inner.count) == (4, 3)
+            assert inner.most_repeated() == ("SELECT 2", 3)
+            assert outer.duration >= inner.duration > 0
+
+            with pytest.raises(AssertionError, match="at most 1 queries, got 2"):
+                async with engine.connect() as conn:
+                    with assert_max_queries(1):
+                        await conn.execute(text("SELECT 1"))
+                        await conn.execute(text("SELECT 1"))
+        finally:
+            await engine.dispose()
+
+    def test_server_timing_round_trip(self):
+        stats = QueryStats(count=2, duration=0.0125)
+        parsed = parse_server_timing(server_timing(stats, 0.05))
+        assert parsed == {"db": {"dur": "12.50", "desc": "2 queries"}, "app": {"dur": "50.00"}}
+
+
+class TestMetrics:
+    """Tests for the metrics registry and multi-process aggregation."""
+
+    def test_histogram_exposition(self):
+        registry = metrics.Registry()
+        latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(value, "/a")
+
+        lines = metrics.render(registry.collect()).splitlines()
+        assert lines[:2] == ["# HELP latency_seconds Latency.", "# TYPE latency_seconds histogram"]
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+        assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum{route="/a"} 2.65' in lines
+        assert 'latency_seconds_count{route="/a"} 4' in lines
+
+    def test_workers_are_aggregated(self, tmp_path):
+        other = metrics.Registry(tmp_path)
+        other.counter("orders_total", "Orders.").inc(amount=3)
+        other.gauge("pool", "Pool.").set(2)
+        (tmp_path / "1.json").write_text(json.dumps(other.snapshot()))
+
+        registry = metrics.Registry(tmp_path)
+        registry.counter("orders_total", "Orders.").inc()
+        registry.gauge("pool", "Pool.").set(1)
+        body = registry.render()
+        assert "\norders_total 4\n" in body
+        assert "\npool 3\n" in body
+
+        # A stopped worker keeps its counters but drops its gauges
+        registry.write_snapshot(final=True)
+        merged = metrics.merge([json.loads(p.read_text()) for p in tmp_path.glob("*.json")])
+        assert merged["orders_total"]["series"] == [[[], 4.0]]
+        assert merged["pool"]["series"] == [[[], 2]]
+
+
+class TestReadiness:
+    """Tests for the readiness probe."""
+
+    @pytest.mark.asyncio
+    async def test_not_ready_when_pool_saturated(self, tmp_path):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'ready.db'}",
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=2,
+            max_overflow=0,
+        )
+        try:
+            ready, report = await health.readiness(engine, timeout=1)
+            assert ready
+            assert report["checks"]["primary"]["pool"]["capacity"] == 2
+
+            async with engine.connect():
+                ready, report = await health.readiness(engine, max_saturation=0.5, timeout=1)
+            assert not ready
+            assert report["status"] == "not_ready"
+            assert report["checks"]["primary"]["status"] == "saturated"
+            assert report["checks"]["primary"]["pool"]["saturation"] == 0.5
+        finally:
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_database_timeout(self, tmp_path):
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}",
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=5,
+        )
+        try:
+            async with engine.connect():
+                # The only connection is taken: the ping waits and times out
+                check = await health.check_engine(engine, timeout=0.05)
+            assert check["status"] == "down"
+            assert "0.05s" in check["error"]
+        finally:
+            await engine.dispose()
+
+
+class TestRateLimit:
+    """Tests for token buckets and rule parsing."""
+
+    def test_parse_rules(self):
+        rules = ratelimit.parse_rules("POST /api/orders/*/items=10/20; get /api/orders=5")
+        assert rules[0].matches("POST", f"/api/orders/{uuid.uuid4()}/items")
+        assert not rules[0].matches("POST", "/api/orders/a/b/items")
+        assert not rules[0].matches("GET", "/api/orders/a/items")
+        assert (rules[1].method, rules[1].rate, rules[1].burst) == ("GET", 5.0, 5)
+        assert ratelimit.find_rule(rules, "GET", "/api/orders/") is rules[1]
+        assert ratelimit.find_rule(rules, "GET", "/api/users") is None
+
+    @pytest.mark.asyncio
+    async def test_bucket_refills_at_rate(self):
+        clock = FakeClock()
+        store = ratelimit.MemoryTokenBucketStore(clock=clock)
+
+        decisions = [await store.take("client", rate=2, burst=3) for _ in range(4)]
+        assert [d.allowed for d in decisions] == [True, True, True, False]
+        assert decisions[2].remaining == 0
+        assert decisions[3].retry_after == pytest.approx(0.5)
+
+        clock.now += 0.5
+        assert (await store.take("client", rate=2, burst=3)).allowed
+        assert not (await store.take("client", rate=2, burst=3)).allowed
+        # Buckets are per key
+        assert (await store.take("other", rate=2, burst=3)).allowed
+
+        clock.now += 100
+        decision = await store.take("client", rate=2, burst=3)
+        assert decision.remaining == 2  # capped at burst, minus this request
+
+    @pytest.mark.asyncio
+    async def test_redis_store_script(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")  # fakeredis runs Lua scripts through lupa
+        client = fakeredis.FakeAsyncRedis()
+        store = ratelimit.RedisTokenBucketStore(client)
+
+        decisions = [await store.take("client", rate=0.01, burst=3) for _ in range(4)]
+        assert [d.allowed for d in decisions] == [True, True, True, False]
+        assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+        assert decisions[3].retry_after > 90
+        assert (await store.take("other", rate=0.01, burst=3)).allowed
+        # Idle buckets expire once they would be full again
+        assert 0 < await client.pttl("ratelimit:client") <= 301_000
+
+        await client.hset("ratelimit:client", "updated", "0")  # last refill long ago
+        assert (await store.take("client", rate=0.01, burst=3)).remaining == 2
+        await client.aclose()
+
+
+class TestProductSearch:
+    """Tests for order search by product name."""
+
+    @pytest.fixture
+    async def session(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            session.info["user"] = user
+            yield session
+
+    async def _order(self, session, *products):
+        order = Order(user_id=session.info["user"].id)
+        for product in products:
+            order.add_item(product, Decimal("1.00"), 1)
+        await OrderRepository(session).save(order)
+        return order
+
+    @pytest.mark.asyncio
+    async def test_substring_match_case_insensitive(self, session):
+        widget = await self._order(session, "Red Widget", "Blue Widget")
+        await self._order(session, "Gadget")
+        repository = OrderRepository(session)
+
+        found = await repository.search_by_product("WIDG")
+        assert [o.id for o in found] == [str(widget.id)]
+        assert found[0].status == OrderStatus.CREATED
+        assert found[0].total_amount == Decimal("2.00")
+        assert await repository.search_by_product('5" "screw') == []
+
+    @pytest.mark.asyncio
+    async def test_index_follows_item_changes(self, session):
+        order = await self._order(session, "Old Name")
+        repository = OrderRepository(session)
+        order.items.clear()
+        order.add_item("New Name", Decimal("1.00"), 1)
+        await repository.save(order)
+
+        assert await repository.search_by_product("Old") == []
+        assert [o.id for o in await repository.search_by_product("New")] == [str(order.id)]
+
+    @pytest.mark.asyncio
+    async def test_pages_by_id(self, session):
+        orders = [await self._order(session, f"Lamp {n}") for n in range(5)]
+        repository = OrderRepository(session)
+        first = await repository.search_by_product("lamp", limit=3)
+        rest = await repository.search_by_product("lamp", after=first[-1].id, limit=3)
+        assert [o.id for o in first + rest] == [str(o.id) for o in orders]
+
+    @pytest.mark.asyncio
+    async def test_index_survives_rowid_renumbering(self, session):
+        kept = await self._order(session, "Bucket")
+        lamp = await self._order(session, "Lamp")
+        repository = OrderRepository(session)
+        # What VACUUM may do to the implicit rowids of order_items
+        await session.execute(text("UPDATE order_items SET rowid = 1000 - rowid"))
+
+        assert [o.id for o in await repository.search_by_product("Bucket")] == [str(kept.id)]
+        lamp.items[0].product_name = "Torch"
+        await repository.save(lamp)
+        assert await repository.search_by_product("Lamp") == []
+        assert [o.id for o in await repository.search_by_product("Torch")] == [str(lamp.id)]
+        assert [o.id for o in await repository.search_by_product("Bucket")] == [str(kept.id)]
+
+
+class TestSingleFlight:
+    """Tests for coalescing concurrent identical reads."""
+
+    @staticmethod
+    def _slow_call(calls, result="value", error=None):
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_execution(self):
+        flights, calls = SingleFlight(), []
+        results = await asyncio.gather(*(flights.do("read", "k", self._slow_call(calls)) for _ in range(10)))
+        assert results == ["value"] * 10
+        assert len(calls) == 1
+        # Nothing is kept once the call finished (no TTL)
+        await flights.do("read", "k", self._slow_call(calls))
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_waiter(self):
+        flights, calls = SingleFlight(), []
+        results = await asyncio.gather(
+            *(flights.do("read", "k", self._slow_call(calls, error=OrderNotFoundError("x"))) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, OrderNotFoundError) for r in results)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_does_not_fail_followers(self):
+        flights, calls = SingleFlight(), []
+        leader = asyncio.ensure_future(flights.do("read", "k", self._slow_call(calls)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("read", "k", self._slow_call(calls)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "value"
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_shared_order_read_outlives_the_leaders_session(self, session_factory, make_order, monkeypatch):
+        order = await make_order()
+        engine = session_factory.kw["bind"]
+
+        class Session(RoutingSession):
+            replica_bind = engine.sync_engine
+            router = ReplicaRouter(clock=FakeClock())
+
+        factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=Session)
+        flights, sessions, used = SingleFlight(), {}, []
+        reading, release = asyncio.Event(), asyncio.Event()
+        find_by_id = OrderRepository.find_by_id
+
+        async def slow_read(repository, *args, **kwargs):
+            used.append(repository.session)
+            reading.set()
+            await release.wait()
+            return await find_by_id(repository, *args, **kwargs)
+
+        monkeypatch.setattr(OrderRepository, "find_by_id", slow_read)
+
+        async def get_order(name):
+            async with factory() as session:
+                sessions[name] = session
+                session.info["use_replica"] = True
+                uow = UnitOfWork(session, read_only=True, session_factory=factory)
+                return await OrderService(uow, flights=flights).get_order(order.id)
+
+        leader = asyncio.ensure_future(get_order("leader"))
+        await reading.wait()
+        follower = asyncio.ensure_future(get_order("follower"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        release.set()
+
+        found = await follower
+        assert str(found.id) == str(order.id) and found.items[0].product_name == "Widget"
+        # The flight ran on a session of its own, not the leader's (closed) one
+        assert len(used) == 1 and used[0] not in sessions.values()
+
+    @pytest.mark.asyncio
+    async def test_micro_cache_only_when_allowed(self):
+        clock = FakeClock()
+        flights, calls = SingleFlight(ttl=1, clock=clock), []
+        await flights.do("read", "k", self._slow_call(calls), cache=True)
+        await flights.do("read", "k", self._slow_call(calls), cache=True)
+        assert len(calls) == 1
+        await flights.do("read", "other", self._slow_call(calls))
+        await flights.do("read", "other", self._slow_call(calls))
+        assert len(calls) == 3
+
+        clock.now += 1
+        await flights.do("read", "k", self._slow_call(calls), cache=True)
+        assert len(calls) == 4
+
+
+class TestOrderCache:
+    """Tests for the rendered order-detail cache."""
+
+    def test_immutable_orders_never_expire(self):
+        clock = FakeClock()
+        cache = OrderCache(ttl=5, clock=clock)
+        cache.put("done", cache.version(), b"done", immutable=True)
+        cache.put("open", cache.version(), b"open", immutable=False)
+        assert cache.get("open") == b"open"
+        assert cache.get("open", allow_mutable=False) is None
+        assert cache.get("done", allow_mutable=False) == b"done"
+
+        clock.now += 5
+        assert cache.get("open") is None
+        assert cache.get("done") == b"done"
+
+    def test_render_older_than_invalidation_is_not_stored(self):
+        cache = OrderCache()
+        version = cache.version()
+        cache.invalidate(["a"])  # written while "a" was being rendered
+        cache.put("a", version, b"stale", immutable=True)
+        cache.put("b", version, b"fine", immutable=True)
+        assert cache.get("a") is None
+        assert cache.get("b") == b"fine"
+
+        cache.put("a", cache.version(), b"fresh", immutable=True)
+        assert cache.get("a") == b"fresh"
+        cache.invalidate(["a"])
+        assert cache.get("a") is None
+
+    def test_lru_eviction_by_size(self):
+        cache = OrderCache(max_bytes=10)
+        for key in "abc":
+            cache.put(key, cache.version(), b"xxxx", immutable=True)
+        assert cache.size == (2, 8)
+        assert cache.get("a") is None
+        cache.get("b")  # now most recently used
+        cache.put("d", cache.version(), b"xxxx", immutable=True)
+        assert cache.get("b") == b"xxxx"
+        assert cache.get("c") is None
+
+
+class TestUnitOfWork:
+    """Tests for transaction scoping across service calls."""
+
+    @pytest.mark.asyncio
+    async def test_grouped_calls_save_once(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            uow = UnitOfWork(session)
+            service = OrderService(uow)
+            with track_queries() as stats:
+                async with uow.transaction():
+                    order = await service.create_order(user.id)
+                    await service.add_item(order.id, "A", Decimal("1.00"), 1)
+                    await service.add_item(order.id, "B", Decimal("2.00"), 1)
+                    assert not uow.committed
+            assert uow.committed
+        inserts = [n for s, n in stats.statements.items() if s.lstrip().startswith("INSERT INTO orders")]
+        assert inserts == [1]  # once at commit, not once per call
+
+        async with session_factory() as session:
+            saved = await OrderRepository(session).find_by_id(order.id)
+        assert [i.product_name for i in saved.items] == ["A", "B"]
+        assert saved.total_amount == Decimal("3.00")
+
+    @pytest.mark.asyncio
+    async def test_identity_map_and_dirty_tracking(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            order = Order(user_id=user.id)
+            order.add_item("A", Decimal("1.00"), 1)
+            await OrderRepository(session).save(order)
+            await session.commit()
+
+        async with session_factory() as session:
+            uow = UnitOfWork(session)
+            with track_queries() as stats:
+                first = await uow.orders.find_by_id(order.id)
+                assert await OrderRepository(session).find_by_id(order.id) is first
+                assert await uow.users.find_by_id(user.id) is await uow.users.find_by_id(user.id)
+                assert stats.count == 4  # three for the order, one for the user
+
+                await uow.orders.save(first)
+                await uow.users.save(await uow.users.find_by_id(user.id))
+                assert stats.count == 4  # unchanged aggregates are not written
+
+                first.pay()
+                await uow.orders.save(first)
+                assert stats.count == 7
+
+    @pytest.mark.asyncio
+    async def test_listings_load_orders_in_batches(self, session_factory, make_user, make_order):
+        user = await make_user()
+        orders = [await make_order(user=user) for _ in range(5)]
+        await make_order()
+
+        async with session_factory() as session:
+            with track_queries() as stats:
+                found = await OrderRepository(session).find_by_user(user.id)
+            assert [str(o.id) for o in found] == [str(o.id) for o in orders]
+            assert all(len(o.items) == 1 and len(o.status_history) == 1 for o in found)
+            assert stats.count == 4  # ids, orders, items, history
+
+        async with session_factory() as session:
+            with track_queries() as stats:
+                assert len(await OrderRepository(session).find_all(limit=3)) == 3
+            assert stats.count == 4
+
+    @pytest.mark.asyncio
+    async def test_failure_rolls_back_group(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            uow = UnitOfWork(session)
+            service = OrderService(uow)
+            with pytest.raises(OrderNotFoundError):
+                async with uow.transaction():
+                    order = await service.create_order(user.id)
+                    await service.cancel_order(uuid.uuid4())
+            assert not uow.committed
+
+        async with session_factory() as session:
+            assert await OrderRepository(session).find_by_id(order.id) is None
+
+    @pytest.mark.asyncio
+    async def test_single_order_change_does_not_overwrite_a_bulk_result(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            order = await OrderService(UnitOfWork(session)).create_order(user.id)
+
+        async with session_factory() as session:
+            repository = OrderRepository(session)
+            loaded = await repository.find_by_id(order.id)
+            async with session_factory() as other:
+                changed, _ = await OrderService(UnitOfWork(other)).bulk_transition("cancel", [order.id])
+            assert [str(o.id) for o in changed] == [str(order.id)]
+            loaded.pay()
+            with pytest.raises(OrderConflictError):
+                await repository.save(loaded)
+
+    @pytest.mark.asyncio
+    async def test_read_only_never_writes(self, session_factory, make_user):
+        user = await make_user()
+        async with session_factory() as session:
+            service = OrderService(UnitOfWork(session, read_only=True))
+            assert await service.list_orders(user.id) == []
+            with pytest.raises(RuntimeError, match="read-only"):
+                await service.create_order(user.id)
+
+
+class TestJobQueue:
+    """Tests for the outbox-backed background job queue."""
+
+    async def _enqueue(self, session_factory, topic, payload):
+        async with session_factory() as session:
+            await OutboxRepository(session).enqueue(topic, payload)
+            await session.commit()
+
+    async def _rows(self, session_factory):
+        async with session_factory() as session:
+            result = await session.execute(text("SELECT topic, status, attempts, last_error FROM outbox"))
+            return result.all()
+
+    @pytest.mark.asyncio
+    async def test_jobs_run_and_are_removed(self, session_factory):
+        queue = JobQueue(session_factory, concurrency=2)
+        seen = []
+
+        @queue.register("greet")
+        async def greet(payload):
+            seen.append(payload["name"])
+
+        for name in ("a", "b", "c"):
+            await self._enqueue(session_factory, "greet", {"name": name})
+        assert await queue.run_pending() == 2
+        assert await queue.run_pending() == 1
+        assert await queue.run_pending() == 0
+        assert sorted(seen) == ["a", "b", "c"]
+        assert await self._rows(session_factory) == []
+
+    @pytest.mark.asyncio
+    async def test_retry_with_backoff_then_dead_letter(self, session_factory):
+        now = [datetime(2030, 1, 1)]
+        queue = JobQueue(session_factory, max_attempts=3, clock=lambda: now[0])
+
+        @queue.register("flaky")
+        async def flaky(payload):
+            raise RuntimeError("downstream unavailable")
+
+        await self._enqueue(session_factory, "flaky", {})
+        await self._enqueue(session_factory, "unknown", {})
+        assert await queue.run_pending() == 2
+
+        # The unknown topic is dead-lettered at once, the failure waits for its retry
+        rows = sorted(await self._rows(session_factory))
+        assert [(r.topic, r.status, r.attempts) for r in rows] == [("flaky", "pending", 1), ("unknown", "dead", 1)]
+        assert rows[0].last_error == "RuntimeError: downstream unavailable"
+        assert await queue.run_pending() == 0
+
+        now[0] += timedelta(seconds=jobs.retry_delay(1))
+        assert await queue.run_pending() == 1
+        now[0] += timedelta(seconds=jobs.retry_delay(2))
+        assert await queue.run_pending() == 1
+        rows = sorted(await self._rows(session_factory))
+        assert [(r.status, r.attempts) for r in rows] == [("dead", 3), ("dead", 1)]
+
+    @pytest.mark.asyncio
+    async def test_payment_enqueues_job_transactionally(self, session_factory, make_user):
+        user = await make_user()
+
+        async with session_factory() as session:
+            service = OrderService(UnitOfWork(session))
+            order = await service.create_order(user.id)
+            await service.pay_order(order.id)
+            with pytest.raises(OrderAlreadyPaidError):
+                await service.pay_order(order.id)
+
+        queue = JobQueue(session_factory)
+        payloads = []
+
+        @queue.register(ORDER_PAID)
+        async def record(payload):
+            payloads.append(payload)
+
+        assert await queue.run_pending() == 1
+        assert payloads == [{
+            "order_id": str(order.id),
+            "user_id": str(user.id),
+            "status": "paid",
+            "total_amount": "0.00",
+        }]
@@ -7,9 +7,19 @@ They require a running database.
 To run: pytest app/tests/test_integration.py -v
 """
 
+import asyncio
+import uuid
+from decimal import Decimal
+
 import pytest
 from httpx import AsyncClient, ASGITransport
+from starlette.responses import JSONResponse
 
+from app.api.middleware import AdmissionControlMiddleware, RateLimitMiddleware
+from app.infrastructure import ratelimit
+from app.infrastructure.db import SessionLocal
+from app.infrastructure.instrumentation import parse_server_timing
+from app.infrastructure.repositories import OrderRepository
 from app.main import app
 
 
@@ -27,6 +37,20 @@ class TestHealthEndpoint:
             assert response.status_code == 200
             assert response.json() == {"status": "ok"}
 
+    @pytest.mark.asyncio
+    async def test_readiness_endpoint(self):
+        """GET /health/ready should check the database."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            response = await client.get("/health/ready")
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "ready"
+            assert data["checks"]["primary"]["status"] == "up"
+            assert data["queries"]["count"] > 0
+
 
 class TestAPIEndpointsExist:
     """Test that all required endpoints exist."""
@@ -116,3 +140,493 @@ class TestAPIEndpointsExist:
                 f"/api/orders/{order_id}/cancel"
             )
             assert response.status_code != 404
+
+
+class TestOrderListing:
+    """Test order listing filters."""
+
+    @pytest.mark.asyncio
+    async def test_list_orders_by_creation_date(self):
+        """GET /api/orders filters by created_from / created_to."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "listdates@example.com", "name": "List Dates"}
+            )
+            user_id = user_response.json()["id"]
+            order_response = await client.post("/api/orders", json={"user_id": user_id})
+            order_id = order_response.json()["id"]
+
+            response = await client.get(
+                "/api/orders",
+                params={"user_id": user_id, "created_from": "2000-01-01T00:00:00"}
+            )
+            assert [o["id"] for o in response.json()] == [order_id]
+
+            response = await client.get(
+                "/api/orders",
+                params={"user_id": user_id, "created_to": "2000-01-01T00:00:00"}
+            )
+            assert response.json() == []
+
+    @pytest.mark.asyncio
+    async def test_list_orders_keyset_pages(self):
+        """GET /api/orders pages by id with after/limit, in creation order."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "listpages@example.com", "name": "List Pages"}
+            )
+            user_id = user_response.json()["id"]
+            created = []
+            for _ in range(5):
+                response = await client.post("/api/orders", json={"user_id": user_id})
+                created.append(response.json()["id"])
+
+            pages, after = [], None
+            while True:
+                params = {"user_id": user_id, "limit": 2}
+                if after:
+                    params["after"] = after
+                page = [o["id"] for o in (await client.get("/api/orders", params=params)).json()]
+                if not page:
+                    break
+                pages.append(page)
+                after = page[-1]
+
+            assert pages == [created[0:2], created[2:4], created[4:]]
+
+    @pytest.mark.asyncio
+    async def test_search_orders_by_product(self):
+        """GET /api/orders/search returns order rows containing the product."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "search@example.com", "name": "Search"}
+            )
+            user_id = user_response.json()["id"]
+            order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+            await client.post(
+                f"/api/orders/{order_id}/items",
+                json={"product_name": "Zebra Striped Mug", "price": "5.00", "quantity": 2}
+            )
+
+            response = await client.get("/api/orders/search", params={"product": "striped mug"})
+            assert response.status_code == 200
+            [found] = response.json()
+            assert (found["id"], found["user_id"], found["status"]) == (order_id, user_id, "created")
+            assert float(found["total_amount"]) == 10
+            assert "items" not in found
+
+            response = await client.get("/api/orders/search", params={"product": "ze"})
+            assert response.status_code == 422
+
+
+class TestUserRegistration:
+    """Signup behaviour."""
+
+    @pytest.mark.asyncio
+    async def test_duplicate_email_conflict(self, assert_max_queries):
+        """A taken email is rejected by the insert itself, without a lookup."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            payload = {"email": "taken@example.com", "name": "First"}
+            assert (await client.post("/api/users", json=payload)).status_code == 201
+            with assert_max_queries(1):
+                response = await client.post("/api/users", json={**payload, "name": "Second"})
+            assert response.status_code == 409
+
+            users = (await client.get("/api/users")).json()
+            assert [u["name"] for u in users if u["email"] == "taken@example.com"] == ["First"]
+
+
+class TestOrderDetailCache:
+    """Cached GET /api/orders/{id} responses."""
+
+    @pytest.mark.asyncio
+    async def test_changes_invalidate_and_cancelled_orders_stay_cached(self, assert_max_queries):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "detailcache@example.com", "name": "Detail Cache"}
+            )
+            user_id = user_response.json()["id"]
+            order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+            first = (await client.get(f"/api/orders/{order_id}")).json()
+            assert first["status"] == "created"
+
+            await client.post(f"/api/orders/{order_id}/cancel")
+            cancelled = await client.get(f"/api/orders/{order_id}")
+            assert cancelled.json()["status"] == "cancelled"
+            with assert_max_queries(0):
+                cached = await client.get(f"/api/orders/{order_id}")
+            assert cached.status_code == 200
+            assert cached.json() == cancelled.json()
+
+    @pytest.mark.asyncio
+    async def test_completed_order_changed_elsewhere_is_not_served_stale(self):
+        """Items can still be added to completed orders, so they are not cached for good."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "detailcache-completed@example.com", "name": "Detail Cache"}
+            )
+            user_id = user_response.json()["id"]
+            order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+            await client.post(f"/api/orders/{order_id}/pay")
+            await client.post("/api/orders/bulk/ship", json={"ids": [order_id]})
+            await client.post("/api/orders/bulk/complete", json={"ids": [order_id]})
+            completed = (await client.get(f"/api/orders/{order_id}")).json()
+            assert completed["status"] == "completed"
+
+            # Another worker adds an item: its commit does not reach this process's cache
+            async with SessionLocal() as session:
+                repository = OrderRepository(session)
+                order = await repository.find_by_id(uuid.UUID(order_id))
+                order.add_item("Late", Decimal("5.00"), 1)
+                await repository.save(order)
+                await session.commit()
+
+            current = (await client.get(f"/api/orders/{order_id}")).json()
+            assert [i["product_name"] for i in current["items"]] == ["Late"]
+            assert Decimal(current["total_amount"]) == Decimal("5.00")
+
+
+class TestReadCoalescing:
+    """Concurrent identical reads and read-your-writes."""
+
+    @pytest.mark.asyncio
+    async def test_read_after_write_does_not_join_an_earlier_flight(self, monkeypatch):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "coalescing@example.com", "name": "Coalescing"}
+            )
+            user_id = user_response.json()["id"]
+            order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+
+            find_by_id = OrderRepository.find_by_id
+            reading, release = asyncio.Event(), asyncio.Event()
+
+            async def slow_first_read(repository, *args, **kwargs):
+                order = await find_by_id(repository, *args, **kwargs)
+                if not reading.is_set():
+                    reading.set()
+                    await release.wait()
+                return order
+
+            monkeypatch.setattr(OrderRepository, "find_by_id", slow_first_read)
+            before = asyncio.ensure_future(client.get(f"/api/orders/{order_id}"))
+            await reading.wait()
+            response = await client.post(
+                f"/api/orders/{order_id}/items",
+                json={"product_name": "Fresh", "price": "1.00", "quantity": 1}
+            )
+            assert response.status_code == 201
+            after = asyncio.ensure_future(client.get(f"/api/orders/{order_id}"))
+            await asyncio.sleep(0.05)
+            release.set()
+
+            await before
+            assert [i["product_name"] for i in (await after).json()["items"]] == ["Fresh"]
+
+
+class TestMultiGet:
+    """Batch lookups by id."""
+
+    @pytest.mark.asyncio
+    async def test_orders_and_users_by_ids(self, assert_max_queries):
+        """Results follow the request order; unknown ids are listed as missing."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            users = []
+            for n in range(3):
+                response = await client.post(
+                    "/api/users",
+                    json={"email": f"multiget{n}@example.com", "name": f"Multi {n}"}
+                )
+                users.append(response.json()["id"])
+            orders = []
+            for user_id in users:
+                order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+                await client.post(
+                    f"/api/orders/{order_id}/items",
+                    json={"product_name": f"Item {user_id[:4]}", "price": "1.00", "quantity": 1}
+                )
+                orders.append(order_id)
+            missing = "00000000-0000-7000-8000-000000000001"
+
+            ids = [orders[2], missing, orders[0], orders[1], orders[0]]
+            with assert_max_queries(3):
+                response = await client.get("/api/orders/batch", params={"ids": ids})
+            data = response.json()
+            assert [o["id"] for o in data["orders"]] == [orders[2], orders[0], orders[1]]
+            assert data["missing"] == [missing]
+            assert all(len(o["items"]) == 1 and len(o["status_history"]) == 1 for o in data["orders"])
+
+            with assert_max_queries(1):
+                response = await client.get("/api/users/batch", params={"ids": [users[1], missing, users[0]]})
+            data = response.json()
+            assert [u["id"] for u in data["users"]] == [users[1], users[0]]
+            assert data["missing"] == [missing]
+
+            response = await client.get("/api/users/batch", params={"ids": [missing] * 101})
+            assert response.status_code == 422
+
+
+class TestBulkTransitions:
+    """Warehouse batch endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_bulk_ship_reports_failures(self, assert_max_queries):
+        """Eligible orders change in one statement; the rest are reported."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "bulkship@example.com", "name": "Bulk Ship"}
+            )
+            user_id = user_response.json()["id"]
+            paid = []
+            for _ in range(3):
+                order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+                await client.post(f"/api/orders/{order_id}/pay")
+                paid.append(order_id)
+            unpaid = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+            missing = "00000000-0000-7000-8000-000000000000"
+
+            with assert_max_queries(3):  # update, status lookup, outbox insert
+                response = await client.post(
+                    "/api/orders/bulk/ship",
+                    json={"ids": paid + [unpaid, missing, paid[0]]}
+                )
+            assert response.status_code == 200
+            data = response.json()
+            assert sorted(o["id"] for o in data["updated"]) == sorted(paid)
+            assert {o["status"] for o in data["updated"]} == {"shipped"}
+            failed = {f["id"]: f["error"] for f in data["failed"]}
+            assert set(failed) == {unpaid, missing}
+            assert "status created" in failed[unpaid]
+            assert "not found" in failed[missing]
+
+            history = (await client.get(f"/api/orders/{paid[1]}/history")).json()
+            assert [h["status"] for h in history] == ["created", "paid", "shipped"]
+
+            response = await client.post("/api/orders/bulk/complete", json={"ids": paid})
+            assert len(response.json()["updated"]) == 3
+            response = await client.post("/api/orders/bulk/cancel", json={"ids": paid + [unpaid]})
+            assert [o["id"] for o in response.json()["updated"]] == [unpaid]
+
+            response = await client.post("/api/orders/bulk/refund", json={"ids": paid})
+            assert response.status_code == 422
+
+
+class TestQueryBudgets:
+    """Upper bounds on SQL statements per endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_server_timing_header(self):
+        """Responses report DB time and statement count."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            response = await client.get("/health")
+            timing = parse_server_timing(response.headers["server-timing"])
+            assert timing["db"]["desc"] == "0 queries"
+            assert "app" in timing
+
+    @pytest.mark.asyncio
+    async def test_order_endpoints_query_budget(self, assert_max_queries):
+        """Creating and reading an order stays within its query budget."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            with assert_max_queries(1):
+                user_response = await client.post(
+                    "/api/users",
+                    json={"email": "budget@example.com", "name": "Budget"}
+                )
+            user_id = user_response.json()["id"]
+
+            with assert_max_queries(3):
+                order_response = await client.post("/api/orders", json={"user_id": user_id})
+            order_id = order_response.json()["id"]
+
+            with assert_max_queries(3):
+                response = await client.get(f"/api/orders/{order_id}")
+            assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_order_list_summary_is_one_query(self, assert_max_queries):
+        """view=summary and fields= read order rows only, however many orders."""
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user_response = await client.post(
+                "/api/users",
+                json={"email": "summary@example.com", "name": "Summary"}
+            )
+            user_id = user_response.json()["id"]
+            for _ in range(3):
+                order_id = (await client.post("/api/orders", json={"user_id": user_id})).json()["id"]
+                await client.post(
+                    f"/api/orders/{order_id}/items",
+                    json={"product_name": "Thing", "price": "2.00", "quantity": 1}
+                )
+
+            with assert_max_queries(1):
+                response = await client.get("/api/orders", params={"user_id": user_id, "view": "summary"})
+            summaries = response.json()
+            assert len(summaries) == 3
+            assert set(summaries[0]) == {"id", "user_id", "status", "total_amount", "created_at"}
+
+            with assert_max_queries(1):
+                response = await client.get(
+                    "/api/orders", params={"user_id": user_id, "fields": "id,status,total_amount"}
+                )
+            assert response.json() == [
+                {"id": s["id"], "status": "created", "total_amount": s["total_amount"]} for s in summaries
+            ]
+
+            full = (await client.get("/api/orders", params={"user_id": user_id})).json()
+            assert [o["items"][0]["product_name"] for o in full] == ["Thing"] * 3
+
+            response = await client.get("/api/orders", params={"fields": "id,password"})
+            assert response.status_code == 422
+
+
+class TestMetricsEndpoint:
+    """Prometheus metrics exposition."""
+
+    @pytest.mark.asyncio
+    async def test_request_and_domain_metrics(self):
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test"
+        ) as client:
+            user = await client.post("/api/users", json={"email": "metrics@example.com", "name": "Metrics"})
+            order = await client.post("/api/orders", json={"user_id": user.json()["id"]})
+            await client.get(f"/api/orders/{order.json()['id']}")
+
+            response = await client.get("/metrics")
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+            body = response.text
+            assert 'http_request_duration_seconds_count{method="GET",route="/api/orders/{order_id}",status="200"}' in body
+            assert 'repository_duration_seconds_count{method="OrderRepository.save"}' in body
+            assert "\norders_created_total " in body
+
+
+class TestAdmissionControl:
+    """Load shedding in front of the API."""
+
+    @staticmethod
+    def _slow_app(release: asyncio.Event):
+        async def app(scope, receive, send):
+            await release.wait()
+            response = JSONResponse({"ok": True})
+            await response(scope, receive, send)
+        return app
+
+    @pytest.mark.asyncio
+    async def test_sheds_writes_when_queue_full(self):
+        release = asyncio.Event()
+        limited = AdmissionControlMiddleware(
+            self._slow_app(release), read_limit=1, write_limit=1, queue_size=1, queue_timeout=5
+        )
+        async with AsyncClient(
+            transport=ASGITransport(app=limited),
+            base_url="http://test"
+        ) as client:
+            running = asyncio.create_task(client.post("/api/orders"))
+            queued = asyncio.create_task(client.post("/api/orders"))
+            await asyncio.sleep(0.01)
+
+            shed = await client.post("/api/orders")
+            assert shed.status_code == 503
+            assert shed.headers["retry-after"] == "1"
+
+            # Reads have their own slots and are not affected by writes
+            read = asyncio.create_task(client.get("/api/orders"))
+            release.set()
+            responses = await asyncio.gather(running, queued, read)
+            assert [r.status_code for r in responses] == [200, 200, 200]
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        release = asyncio.Event()
+        limited = AdmissionControlMiddleware(
+            self._slow_app(release), write_limit=1, queue_size=5, queue_timeout=0.01
+        )
+        async with AsyncClient(
+            transport=ASGITransport(app=limited),
+            base_url="http://test"
+        ) as client:
+            running = asyncio.create_task(client.post("/api/orders"))
+            await asyncio.sleep(0.01)
+            assert (await client.post("/api/orders")).status_code == 503
+            release.set()
+            assert (await running).status_code == 200
+
+
+class TestRateLimiting:
+    """Per-client rate limits on hot endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_limits_per_client_with_headers(self):
+        async def ok(scope, receive, send):
+            await JSONResponse([])(scope, receive, send)
+
+        store = ratelimit.MemoryTokenBucketStore()
+        limited = RateLimitMiddleware(
+            ok, rules=ratelimit.parse_rules("GET /api/orders=0.01/2"), store=store
+        )
+        async with AsyncClient(
+            transport=ASGITransport(app=limited, client=("10.0.0.1", 50000)),
+            base_url="http://test"
+        ) as client, AsyncClient(
+            transport=ASGITransport(app=limited, client=("10.0.0.2", 50000)),
+            base_url="http://test"
+        ) as other:
+            first = await client.get("/api/orders")
+            assert first.status_code == 200
+            assert first.headers["ratelimit-limit"] == "2"
+            assert first.headers["ratelimit-remaining"] == "1"
+
+            await client.get("/api/orders")
+            refused = await client.get("/api/orders")
+            assert refused.status_code == 429
+            assert int(refused.headers["retry-after"]) >= 1
+            # Client-supplied headers do not open a new bucket
+            assert (await client.get("/api/orders", headers={"X-User-Id": "new"})).status_code == 429
+
+            # Another client, and routes without a rule, are unaffected
+            assert (await other.get("/api/orders")).status_code == 200
+            assert "ratelimit-limit" not in (await client.get("/api/users")).headers
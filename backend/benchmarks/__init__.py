@@ -0,0 +1 @@
+# Benchmark suite (run from backend/, e.g. python -m benchmarks.api_load --help)
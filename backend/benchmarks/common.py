@@ -0,0 +1,118 @@
+"""Shared helpers for the benchmark scripts: timing stats and baselines."""
+
+import json
+import math
+import os
+import platform
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+def configure_database(database_url: str):
+    """Point the app at ``database_url``; must run before importing ``app``."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SQL_ECHO", "0")
+    # All simulated users share one address; measure the app, not the limiter
+    os.environ.setdefault("RATE_LIMIT", "0")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class Stats:
+    """Latencies (seconds) and per-request query counts for one operation."""
+
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    errors: int = 0
+
+    def record(self, latency: float, queries: Optional[int] = None, ok: bool = True):
+        self.latencies.append(latency)
+        if queries is not None:
+            self.queries.append(queries)
+        if not ok:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, float]:
+        count = len(self.latencies)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "rps": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "queries_per_request": sum(self.queries) / len(self.queries) if self.queries else None,
+        }
+
+
+def summarize(stats: Dict[str, Stats], elapsed: float) -> Dict[str, Dict[str, float]]:
+    return {name: s.summary(elapsed) for name, s in sorted(stats.items())}
+
+
+def print_report(results: Dict[str, Dict[str, float]], title: str):
+    print(f"\n{title}")
+    header = f"{'operation':<20}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        queries = "-" if r.get("queries_per_request") is None else f"{r['queries_per_request']:.1f}"
+        print(
+            f"{name:<20}{r['count']:>8}{r['errors']:>8}{r['rps']:>10.1f}"
+            f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{queries:>9}"
+        )
+
+
+def save_baseline(name: str, results: Dict[str, Dict[str, float]], params: dict) -> Path:
+    BASELINES_DIR.mkdir(exist_ok=True)
+    path = BASELINES_DIR / f"{name}.json"
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return path
+
+
+def compare_baseline(name: str, results: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Print deltas against a saved baseline and return detected regressions.
+
+    A regression is a p95 latency or queries-per-request increase, or an
+    rps drop, larger than ``tolerance`` (a fraction, e.g. 0.2 for 20%).
+    """
+    baseline = json.loads((BASELINES_DIR / f"{name}.json").read_text(encoding="utf-8"))["results"]
+    regressions = []
+    print(f"\nCompared to baseline '{name}' (tolerance {tolerance:.0%})")
+    for op, current in results.items():
+        before = baseline.get(op)
+        if before is None:
+            continue
+        checks = (
+            ("p95_ms", current["p95_ms"], before["p95_ms"], 1),
+            ("rps", current["rps"], before["rps"], -1),
+            ("queries_per_request", current.get("queries_per_request"), before.get("queries_per_request"), 1),
+        )
+        for metric, now, then, direction in checks:
+            if now is None or then in (None, 0):
+                continue
+            change = (now - then) / then
+            marker = ""
+            if change * direction > tolerance:
+                marker = "  REGRESSION"
+                regressions.append(f"{op}.{metric}")
+            print(f"  {op:<20}{metric:<22}{then:>10.2f} -> {now:>10.2f} ({change:+.1%}){marker}")
+    return regressions
@@ -0,0 +1,16 @@
+-- ============================================
+-- Индексы для горячих запросов OrderRepository
+-- ============================================
+
+-- Заказы пользователя (find_by_user)
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id);
+
+-- Выборки и сортировка по дате создания
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+
+-- Позиции заказа (find_by_id, save)
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+-- История статусов заказа, отсортированная по времени (find_by_id)
+CREATE INDEX IF NOT EXISTS idx_order_status_history_order_id
+    ON order_status_history (order_id, changed_at);
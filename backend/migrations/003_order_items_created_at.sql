@@ -0,0 +1,19 @@
+-- ============================================
+-- Дата создания заказа в позициях заказа
+-- Нужна как ключ секционирования order_items (см. 004)
+-- ============================================
+
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE;
+
+UPDATE order_items i
+SET created_at = o.created_at
+FROM orders o
+WHERE o.id = i.order_id AND i.created_at IS NULL;
+
+ALTER TABLE order_items ALTER COLUMN created_at SET NOT NULL;
+
+ALTER TABLE orders ALTER COLUMN created_at SET NOT NULL;
+
+-- Ключ (id, created_at): цель ON CONFLICT в OrderRepository.save,
+-- совпадает с первичным ключом секционированной таблицы
+CREATE UNIQUE INDEX IF NOT EXISTS uq_orders_id_created_at ON orders (id, created_at);
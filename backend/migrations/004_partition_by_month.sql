@@ -0,0 +1,149 @@
+-- ============================================
+-- Помесячное секционирование orders, order_items и order_status_history
+-- (только PostgreSQL; для SQLite этой версии нет)
+--
+-- orders и order_items секционируются по created_at заказа,
+-- order_status_history — по changed_at. Будущие секции создаёт
+-- ensure_monthly_partitions(), старые отсоединяет
+-- python -m app.infrastructure.partitions detach.
+-- ============================================
+
+-- Создаёт секцию <parent>_pYYYY_MM для месяца, в который попадает month
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', month)::date;
+    partition_name TEXT := format('%s_p%s', parent, to_char(start_date, 'YYYY_MM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, parent, start_date, (start_date + INTERVAL '1 month')::date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Создаёт секции текущего месяца и months_ahead следующих для всех таблиц
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    i INTEGER;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['orders', 'order_items', 'order_status_history'] LOOP
+        FOR i IN 0..months_ahead LOOP
+            PERFORM create_monthly_partition(
+                parent,
+                (date_trunc('month', NOW()) + make_interval(months => i))::date
+            );
+        END LOOP;
+    END LOOP;
+    RETURN months_ahead;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Переносим существующие таблицы в секционированные (один раз)
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    DROP TRIGGER IF EXISTS trg_prevent_double_payment ON orders;
+    DROP TRIGGER IF EXISTS trg_log_status_change ON orders;
+
+    ALTER TABLE order_status_history RENAME TO order_status_history_unpartitioned;
+    ALTER INDEX order_status_history_pkey RENAME TO order_status_history_unpartitioned_pkey;
+    ALTER TABLE order_items RENAME TO order_items_unpartitioned;
+    ALTER INDEX order_items_pkey RENAME TO order_items_unpartitioned_pkey;
+    ALTER TABLE orders RENAME TO orders_unpartitioned;
+    ALTER INDEX orders_pkey RENAME TO orders_unpartitioned_pkey;
+
+    -- Ключ секционирования входит в первичный ключ
+    CREATE TABLE orders (
+        id UUID NOT NULL DEFAULT uuid_generate_v4(),
+        user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        status_id INTEGER NOT NULL REFERENCES order_statuses(id) DEFAULT 1,
+        total_amount DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        CONSTRAINT total_amount_check CHECK (total_amount >= 0),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE TABLE order_items (
+        id UUID NOT NULL DEFAULT uuid_generate_v4(),
+        order_id UUID NOT NULL,
+        product_name VARCHAR(255) NOT NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        quantity INTEGER NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        CONSTRAINT price_check CHECK (price >= 0),
+        CONSTRAINT quantity_check CHECK (quantity > 0),
+        PRIMARY KEY (id, created_at),
+        FOREIGN KEY (order_id, created_at) REFERENCES orders (id, created_at) ON DELETE CASCADE
+    ) PARTITION BY RANGE (created_at);
+
+    -- Секционируется по собственному времени изменения, поэтому внешний ключ
+    -- на orders (id, created_at) невозможен; записи пишет триггер trg_log_status_change
+    CREATE TABLE order_status_history (
+        id UUID NOT NULL DEFAULT uuid_generate_v4(),
+        order_id UUID NOT NULL,
+        status_id INTEGER NOT NULL REFERENCES order_statuses(id),
+        changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, changed_at)
+    ) PARTITION BY RANGE (changed_at);
+
+    -- Строки вне созданных секций не теряются
+    CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+    CREATE TABLE order_items_default PARTITION OF order_items DEFAULT;
+    CREATE TABLE order_status_history_default PARTITION OF order_status_history DEFAULT;
+
+    FOR month IN SELECT DISTINCT date_trunc('month', created_at)::date FROM orders_unpartitioned LOOP
+        PERFORM create_monthly_partition('orders', month);
+        PERFORM create_monthly_partition('order_items', month);
+    END LOOP;
+    FOR month IN
+        SELECT DISTINCT date_trunc('month', changed_at)::date
+        FROM order_status_history_unpartitioned
+        WHERE changed_at IS NOT NULL
+    LOOP
+        PERFORM create_monthly_partition('order_status_history', month);
+    END LOOP;
+    PERFORM ensure_monthly_partitions(3);
+
+    INSERT INTO orders (id, user_id, status_id, total_amount, created_at)
+    SELECT id, user_id, status_id, total_amount, created_at FROM orders_unpartitioned;
+
+    INSERT INTO order_items (id, order_id, product_name, price, quantity, created_at)
+    SELECT id, order_id, product_name, price, quantity, created_at FROM order_items_unpartitioned;
+
+    INSERT INTO order_status_history (id, order_id, status_id, changed_at)
+    SELECT id, order_id, status_id, COALESCE(changed_at, NOW()) FROM order_status_history_unpartitioned;
+
+    DROP TABLE order_status_history_unpartitioned;
+    DROP TABLE order_items_unpartitioned;
+    DROP TABLE orders_unpartitioned;
+END;
+$$;
+
+-- Индексы из 002 на секционированных таблицах (создаются в каждой секции)
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+CREATE INDEX IF NOT EXISTS idx_order_status_history_order_id
+    ON order_status_history (order_id, changed_at);
+
+-- Триггеры из 001 на новой таблице orders
+DROP TRIGGER IF EXISTS trg_prevent_double_payment ON orders;
+CREATE TRIGGER trg_prevent_double_payment
+BEFORE UPDATE ON orders
+FOR EACH ROW
+EXECUTE FUNCTION prevent_double_payment();
+
+DROP TRIGGER IF EXISTS trg_log_status_change ON orders;
+CREATE TRIGGER trg_log_status_change
+AFTER INSERT OR UPDATE ON orders
+FOR EACH ROW
+EXECUTE FUNCTION log_status_change();
@@ -0,0 +1,20 @@
+-- ============================================
+-- Outbox фоновых задач
+-- Строки пишутся в той же транзакции, что и изменение заказа,
+-- и обрабатываются воркерами JobQueue (app/infrastructure/jobs.py)
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id UUID PRIMARY KEY,
+    topic VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+    -- pending: ждёт обработки, dead: исчерпаны попытки
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (available_at) WHERE status = 'pending';
@@ -0,0 +1,10 @@
+-- ============================================
+-- Индекс для постраничной выдачи заказов пользователя
+-- Списки сортируются по id (UUIDv7 — порядок создания), следующая
+-- страница начинается с id > :after. Индекс (user_id, id) отдаёт её
+-- без сортировки и заменяет idx_orders_user_id.
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_id_id ON orders (user_id, id);
+
+DROP INDEX IF EXISTS idx_orders_user_id;
@@ -0,0 +1,11 @@
+-- ============================================
+-- Поиск заказов по названию товара
+-- Триграммный GIN-индекс обслуживает ILIKE '%...%' по
+-- order_items.product_name без полного сканирования таблицы
+-- (OrderRepository.search_by_product).
+-- ============================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_order_items_product_name_trgm
+    ON order_items USING gin (product_name gin_trgm_ops);
@@ -0,0 +1,102 @@
+-- ============================================
+-- Схема базы данных маркетплейса (SQLite)
+-- Повторяет migrations/001_init.sql для локального запуска и тестов
+-- ============================================
+
+-- Таблица статусов заказов
+CREATE TABLE IF NOT EXISTS order_statuses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL
+);
+
+-- Заполнение статусов (идемпотентно)
+INSERT OR IGNORE INTO order_statuses (name) VALUES
+('created'),
+('paid'),
+('cancelled'),
+('shipped'),
+('completed');
+
+-- Таблица пользователей
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL
+);
+
+-- Таблица заказов
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status_id INTEGER NOT NULL DEFAULT 1,
+    total_amount REAL NOT NULL DEFAULT 0.00,
+    created_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (status_id) REFERENCES order_statuses(id)
+);
+
+-- Таблица товаров в заказе
+CREATE TABLE IF NOT EXISTS order_items (
+    id TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    FOREIGN KEY (order_id) REFERENCES orders(id)
+);
+
+-- Таблица истории статусов
+CREATE TABLE IF NOT EXISTS order_status_history (
+    id TEXT PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    status_id INTEGER NOT NULL,
+    changed_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (order_id) REFERENCES orders(id),
+    FOREIGN KEY (status_id) REFERENCES order_statuses(id)
+);
+
+-- ==========================================================
+-- ТРИГГЕРЫ (аналоги plpgsql-триггеров из 001_init.sql)
+-- ==========================================================
+
+CREATE TRIGGER IF NOT EXISTS trg_prevent_double_payment
+BEFORE UPDATE ON orders
+FOR EACH ROW
+WHEN NEW.status_id = (SELECT id FROM order_statuses WHERE name = 'paid')
+    AND EXISTS (
+        SELECT 1 FROM order_status_history
+        WHERE order_id = NEW.id AND status_id = NEW.status_id
+    )
+BEGIN
+    SELECT RAISE(ABORT, 'Order has already been paid.');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_log_status_insert
+AFTER INSERT ON orders
+FOR EACH ROW
+BEGIN
+    INSERT INTO order_status_history (id, order_id, status_id, changed_at)
+    VALUES (
+        lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' ||
+              substr(hex(randomblob(2)), 2) || '-' ||
+              substr('89ab', 1 + (abs(random()) % 4), 1) ||
+              substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))),
+        NEW.id, NEW.status_id, strftime('%Y-%m-%d %H:%M:%f', 'now')
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_log_status_update
+AFTER UPDATE ON orders
+FOR EACH ROW
+WHEN OLD.status_id IS NOT NEW.status_id
+BEGIN
+    INSERT INTO order_status_history (id, order_id, status_id, changed_at)
+    VALUES (
+        lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' ||
+              substr(hex(randomblob(2)), 2) || '-' ||
+              substr('89ab', 1 + (abs(random()) % 4), 1) ||
+              substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))),
+        NEW.id, NEW.status_id, strftime('%Y-%m-%d %H:%M:%f', 'now')
+    );
+END;
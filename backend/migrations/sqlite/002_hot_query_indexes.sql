@@ -0,0 +1,12 @@
+-- ============================================
+-- Индексы для горячих запросов OrderRepository (SQLite)
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id);
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+CREATE INDEX IF NOT EXISTS idx_order_status_history_order_id
+    ON order_status_history (order_id, changed_at);
@@ -0,0 +1,11 @@
+-- ============================================
+-- Дата создания заказа в позициях заказа (SQLite)
+-- ============================================
+
+ALTER TABLE order_items ADD COLUMN created_at TIMESTAMP;
+
+UPDATE order_items
+SET created_at = (SELECT o.created_at FROM orders o WHERE o.id = order_items.order_id)
+WHERE created_at IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_orders_id_created_at ON orders (id, created_at);
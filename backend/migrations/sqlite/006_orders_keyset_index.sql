@@ -0,0 +1,7 @@
+-- ============================================
+-- Индекс для постраничной выдачи заказов пользователя (SQLite)
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_id_id ON orders (user_id, id);
+
+DROP INDEX IF EXISTS idx_orders_user_id;
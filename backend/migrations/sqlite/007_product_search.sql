@@ -0,0 +1,32 @@
+-- ============================================
+-- Поиск заказов по названию товара (SQLite)
+-- FTS5-таблица с триграммным токенайзером поверх order_items
+-- (external content), синхронизируется триггерами по rowid.
+-- VACUUM может перенумеровать rowid таблицы без INTEGER PRIMARY KEY:
+-- после него индекс пересобирается командой
+-- INSERT INTO order_items_fts (order_items_fts) VALUES ('rebuild');
+-- ============================================
+
+CREATE VIRTUAL TABLE IF NOT EXISTS order_items_fts USING fts5(
+    product_name,
+    content = 'order_items',
+    content_rowid = 'rowid',
+    tokenize = 'trigram'
+);
+
+INSERT INTO order_items_fts (order_items_fts) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_insert AFTER INSERT ON order_items BEGIN
+    INSERT INTO order_items_fts (rowid, product_name) VALUES (new.rowid, new.product_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_delete AFTER DELETE ON order_items BEGIN
+    INSERT INTO order_items_fts (order_items_fts, rowid, product_name)
+    VALUES ('delete', old.rowid, old.product_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_update AFTER UPDATE OF product_name ON order_items BEGIN
+    INSERT INTO order_items_fts (order_items_fts, rowid, product_name)
+    VALUES ('delete', old.rowid, old.product_name);
+    INSERT INTO order_items_fts (rowid, product_name) VALUES (new.rowid, new.product_name);
+END;
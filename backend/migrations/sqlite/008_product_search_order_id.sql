@@ -0,0 +1,48 @@
+-- ============================================
+-- Поиск заказов по названию товара без привязки к rowid (SQLite)
+-- FTS5-таблица из 007 ссылалась на неявный rowid order_items,
+-- который VACUUM может перенумеровать. Теперь order_id хранится
+-- в самой FTS-таблице (UNINDEXED), а rowid строки индекса берётся
+-- из order_items_fts_rowids (INTEGER PRIMARY KEY не меняется при
+-- VACUUM) по id позиции заказа.
+-- ============================================
+
+DROP TRIGGER IF EXISTS order_items_fts_insert;
+DROP TRIGGER IF EXISTS order_items_fts_delete;
+DROP TRIGGER IF EXISTS order_items_fts_update;
+DROP TABLE IF EXISTS order_items_fts;
+
+CREATE TABLE IF NOT EXISTS order_items_fts_rowids (
+    rowid INTEGER PRIMARY KEY,
+    item_id TEXT NOT NULL UNIQUE
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS order_items_fts USING fts5(
+    product_name,
+    order_id UNINDEXED,
+    tokenize = 'trigram'
+);
+
+INSERT INTO order_items_fts_rowids (item_id) SELECT id FROM order_items;
+
+INSERT INTO order_items_fts (rowid, product_name, order_id)
+SELECT r.rowid, i.product_name, i.order_id
+FROM order_items i
+JOIN order_items_fts_rowids r ON r.item_id = i.id;
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_insert AFTER INSERT ON order_items BEGIN
+    INSERT INTO order_items_fts_rowids (item_id) VALUES (new.id);
+    INSERT INTO order_items_fts (rowid, product_name, order_id)
+    SELECT rowid, new.product_name, new.order_id FROM order_items_fts_rowids WHERE item_id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_delete AFTER DELETE ON order_items BEGIN
+    DELETE FROM order_items_fts
+    WHERE rowid = (SELECT rowid FROM order_items_fts_rowids WHERE item_id = old.id);
+    DELETE FROM order_items_fts_rowids WHERE item_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS order_items_fts_update AFTER UPDATE OF product_name ON order_items BEGIN
+    UPDATE order_items_fts SET product_name = new.product_name
+    WHERE rowid = (SELECT rowid FROM order_items_fts_rowids WHERE item_id = new.id);
+END;